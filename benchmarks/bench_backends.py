@@ -0,0 +1,112 @@
+"""
+Tiles/sec and accuracy of each CPU inference backend against eager PyTorch.
+
+Runs the streaming engine once per backend on (a crop of) the inference
+scene, scores every mask against data.label_aligned_tif and reports the IoU
+change against the first backend (eager `torch`), plus the pixel agreement
+of the masks. Backends whose model file is missing are skipped; pass
+--export to build them first.
+
+    python benchmarks/bench_backends.py --export --crop 2048 --threads 4
+"""
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import torch
+import yaml
+from rasterio.windows import Window
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from export_model import export_models  # noqa: E402
+from inference import BACKEND_PATHS, load_inference_model, predict_raster  # noqa: E402
+from metrics import segmentation_scores  # noqa: E402
+from raster_utils import band_scaling  # noqa: E402
+from temporal import input_adapter  # noqa: E402
+
+
+def crop_raster(src_path, out_path, size):
+    """Top-left size x size crop, so a benchmark run stays short on a full scene."""
+    with rasterio.open(src_path) as src:
+        window = Window(0, 0, min(size, src.width), min(size, src.height))
+        profile = src.profile.copy()
+        profile.update(width=window.width, height=window.height,
+                       transform=src.window_transform(window))
+        with rasterio.open(out_path, 'w', **profile) as dst:
+            dst.write(src.read(window=window))
+            # Quantized stacks keep their dequantization parameters
+            dst.scales, dst.offsets = band_scaling(src)
+
+
+def label_iou(label, mask):
+    """Paddy IoU of `mask` against the label; pixels whose label is not 0/1 are ignored."""
+    confusion = np.zeros((2, 2), dtype='int64')
+    for true in (0, 1):
+        for pred in (0, 1):
+            confusion[true, pred] = np.count_nonzero((label == true) & (mask == pred))
+    return segmentation_scores(confusion)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--crop", type=int, default=2048, help="Crop the scene to this size (0 = full scene)")
+    parser.add_argument("--threads", type=int, default=0, help="torch/onnxruntime threads (0 = default)")
+    parser.add_argument("--export", action="store_true", help="Run export_model.export_models first")
+    parser.add_argument("--backends", nargs="+", default=list(BACKEND_PATHS))
+    args = parser.parse_args()
+
+    with open(ROOT_DIR / "config.yaml", 'r') as f:
+        config = yaml.safe_load(f)
+    inf_cfg = config['inference']
+    if args.threads:
+        torch.set_num_threads(args.threads)
+        inf_cfg['threads'] = args.threads
+    if args.export:
+        export_models(config)
+
+    scene = ROOT_DIR / inf_cfg.get('input_path', config['data']['norm_output']).strip()
+    label_path = ROOT_DIR / config['data']['label_aligned_tif']
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if args.crop:
+            crop_raster(scene, tmp / "scene.tif", args.crop)
+            crop_raster(label_path, tmp / "label.tif", args.crop)
+            scene, label_path = tmp / "scene.tif", tmp / "label.tif"
+        with rasterio.open(label_path) as src:
+            label = src.read(1)
+        with rasterio.open(scene) as src:
+            num_channels, band_transform = input_adapter(config, ROOT_DIR, src.count)
+            print(f"{scene.name}: {src.width}x{src.height}x{num_channels}, window {inf_cfg['window_size']}, "
+                  f"overlap {inf_cfg['overlap']}, batch {inf_cfg['batch_size']}")
+
+        reference = reference_iou = None
+        for backend in args.backends:
+            section, key = BACKEND_PATHS[backend]
+            if not (ROOT_DIR / config[section][key]).exists():
+                print(f"{backend:>12}: skipped, {config[section][key]} not found")
+                continue
+            model = load_inference_model(backend, config, ROOT_DIR, num_channels)
+            out = tmp / f"mask_{backend}.tif"
+            stats = predict_raster(model, scene, out, window_size=inf_cfg['window_size'],
+                                   overlap=inf_cfg['overlap'], batch_size=inf_cfg['batch_size'],
+                                   band_transform=band_transform)
+            with rasterio.open(out) as src:
+                mask = src.read(1)
+            if mask.shape != label.shape:
+                raise ValueError(f"{label_path} is not on the grid of {scene}; run labeling.py align first")
+            iou = label_iou(label, mask)
+            if reference is None:
+                reference, reference_iou, reference_name = mask, iou, backend
+            agreement = float((reference == mask).mean())
+            print(f"{backend:>12}: {stats['windows_per_sec']:7.2f} tiles/s  "
+                  f"IoU {iou:.4f} (delta vs {reference_name} {iou - reference_iou:+.4f})  "
+                  f"pixel agreement {agreement:.4%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+File size, write time and random-window read latency of output layouts.
+
+Rewrites one normalized stack (the configured norm_output, or a synthetic
+one with --synthetic) with each layout variant and reads the same random
+windows from every copy, as the tiling, inference and statistics stages do.
+
+    python benchmarks/bench_layout.py --windows 200 --window-size 512
+    python benchmarks/bench_layout.py --synthetic 4096 --bands 24
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import yaml
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from raster_utils import iter_windows, layout_writer  # noqa: E402
+
+# name -> (file suffix, output_layout); None = striped LZW, the plain-profile baseline
+VARIANTS = {
+    "striped_lzw": (".tif", None),
+    "tiled_lzw": (".tif", {"compress": "lzw"}),
+    "zstd_p3_pixel": (".tif", {"compress": "zstd", "level": 9, "predictor": 3, "interleave": "pixel"}),
+    "zstd_p3_band": (".tif", {"compress": "zstd", "level": 9, "predictor": 3, "interleave": "band"}),
+    "deflate_p3": (".tif", {"compress": "deflate", "level": 6, "predictor": 3}),
+    "cog_zstd_p3": (".tif", {"cog": True, "compress": "zstd", "level": 9, "predictor": 3}),
+    "zarr_zstd": (".zarr", {"compress": "zstd", "level": 9}),
+}
+
+
+def synthetic_stack(path, size, bands, seed=0):
+    """[0, 1] float32 stack with field structure, speckle and a nodata (0) border."""
+    rng = np.random.default_rng(seed)
+    profile = dict(driver='GTiff', width=size, height=size, count=bands, dtype='float32', nodata=0,
+                   crs='EPSG:4326', transform=from_origin(138.5, 38.0, 1e-4, 1e-4),
+                   tiled=True, blockxsize=512, blockysize=512)
+    fields = rng.random((size // 64 + 1, size // 64 + 1, bands)).astype('float32')
+    with rasterio.open(path, 'w', **profile) as dst:
+        for window in iter_windows(size, size, 512):
+            rows = np.arange(window.row_off, window.row_off + window.height) // 64
+            cols = np.arange(window.col_off, window.col_off + window.width) // 64
+            base = fields[rows[:, None], cols[None, :]].transpose(2, 0, 1)
+            block = np.clip(base * rng.gamma(4.0, 0.25, base.shape), 0, 1).astype('float32')
+            if window.col_off == 0:
+                block[:, :, :64] = 0
+            dst.write(block, window=window)
+    return path
+
+
+def copy_with_layout(src_path, out_path, layout, block_size=512):
+    with rasterio.open(src_path) as src:
+        profile = src.profile.copy()
+        if layout is None:
+            profile.update(driver='GTiff', tiled=False, compress='lzw', interleave='pixel')
+            for key in ('blockxsize', 'blockysize'):
+                profile.pop(key, None)
+            writer = rasterio.open(out_path, 'w', **profile)
+        else:
+            writer = layout_writer(out_path, profile, layout)
+        with writer as dst:
+            for band, description in enumerate(src.descriptions, start=1):
+                dst.set_band_description(band, description or f"Band_{band}")
+            for window in iter_windows(src.width, src.height, block_size):
+                dst.write(src.read(window=window), window=window)
+
+
+def disk_size(path):
+    path = Path(path)
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+    return path.stat().st_size
+
+
+def read_latency(path, offsets, window_size):
+    """Per-window read times (s) with a fresh dataset and a small GDAL cache."""
+    times = []
+    with rasterio.Env(GDAL_CACHEMAX=64), rasterio.open(path) as src:
+        for row, col in offsets:
+            start = time.perf_counter()
+            src.read(window=Window(col, row, window_size, window_size))
+            times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="Stack to rewrite (default: data.norm_output)")
+    parser.add_argument("--synthetic", type=int, help="Use a synthetic N x N stack instead")
+    parser.add_argument("--bands", type=int, default=12, help="Bands of the synthetic stack")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=list(VARIANTS))
+    parser.add_argument("--windows", type=int, default=200, help="Random windows read per variant")
+    parser.add_argument("--window-size", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if args.synthetic:
+            src_path = synthetic_stack(tmp / "synthetic.tif", args.synthetic, args.bands, args.seed)
+        else:
+            with open(ROOT_DIR / "config.yaml", 'r') as f:
+                config = yaml.safe_load(f)
+            src_path = Path(args.input) if args.input else ROOT_DIR / config['data']['norm_output'].strip()
+
+        with rasterio.open(src_path) as src:
+            width, height, count = src.width, src.height, src.count
+            raw_mb = width * height * count * 4 / 2 ** 20
+        rng = np.random.default_rng(args.seed)
+        size = args.window_size
+        offsets = list(zip(rng.integers(0, max(height - size, 0) + 1, args.windows),
+                           rng.integers(0, max(width - size, 0) + 1, args.windows)))
+        window_mb = min(size, width) * min(size, height) * count * 4 / 2 ** 20
+        print(f"{src_path.name}: {width}x{height}x{count} float32 ({raw_mb:.0f} MB raw), "
+              f"{args.windows} random {size}px windows\n")
+
+        print(f"{'variant':>16} {'size MB':>9} {'ratio':>6} {'write s':>8} "
+              f"{'read ms p50':>12} {'p95':>8} {'MB/s':>8}")
+        for name in args.variants:
+            suffix, layout = VARIANTS[name]
+            out_path = tmp / f"{name}{suffix}"
+            start = time.perf_counter()
+            copy_with_layout(src_path, out_path, layout)
+            write_s = time.perf_counter() - start
+
+            size_mb = disk_size(out_path) / 2 ** 20
+            times = read_latency(out_path, offsets, size)
+            print(f"{name:>16} {size_mb:>9.1f} {raw_mb / size_mb:>5.2f}x {write_s:>8.2f} "
+                  f"{np.median(times) * 1000:>12.1f} {np.percentile(times, 95) * 1000:>8.1f} "
+                  f"{window_mb / times.mean():>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Storage, I/O and accuracy cost of quantized (uint8/uint16) normalized stacks.
+
+Rewrites the float32 normalized stack with each `normalization.dtype`, builds
+a tile store from every copy and reports stack / store size, the bytes and
+time of one pass over all training windows, the worst dequantization error
+and the validation IoU of one model (trained on the float32 store, or
+--model) on each copy. With --retrain a model is also trained per dtype.
+
+    python benchmarks/bench_quantize.py --epochs 3
+    python benchmarks/bench_quantize.py --model models/best_model.pth --dtypes uint8
+"""
+import argparse
+import copy
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import torch
+import yaml
+from torch.utils.data import DataLoader
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from inference import load_segmentation_model  # noqa: E402
+from metrics import segmentation_scores  # noqa: E402
+from preprocessing import set_quantization  # noqa: E402
+from raster_utils import iter_windows, quantize_normalized, read_normalized  # noqa: E402
+from tile_store import WindowDataset, build_tile_store, split_offsets  # noqa: E402
+from training import train_from_tile_store  # noqa: E402
+
+
+def quantized_copy(src_path, out_path, dtype, block_size=512):
+    """Re-codes a float32 normalized stack as `dtype`; returns the max abs error."""
+    max_error = 0.0
+    with rasterio.open(src_path) as src:
+        profile = src.profile.copy()
+        profile.update(dtype=dtype, nodata=0)
+        with rasterio.open(out_path, 'w', **profile) as dst:
+            dst.descriptions = src.descriptions
+            set_quantization(dst, dtype)
+            for window in iter_windows(src.width, src.height, block_size):
+                data = read_normalized(src, window)
+                codes = quantize_normalized(data, data != 0, dtype)
+                dst.write(codes, window=window)
+                restored = codes * np.float32(dst.scales[0]) + np.float32(dst.offsets[0])
+                valid = codes != 0
+                if valid.any():
+                    max_error = max(max_error, float(np.abs(restored[valid] - data[valid]).max()))
+    return max_error
+
+
+def disk_mb(path):
+    path = Path(path)
+    files = path.rglob('*') if path.is_dir() else [path]
+    return sum(f.stat().st_size for f in files if f.is_file()) / 2 ** 20
+
+
+def window_pass(store, tile_size, stride):
+    """(seconds, MB of image windows read) for one pass over every window of the store."""
+    dataset = WindowDataset(store, tile_size, stride)
+    dataset[0]  # open the memory maps outside the timing
+    item_mb = tile_size * tile_size * dataset.num_channels * dataset._image.dtype.itemsize / 2 ** 20
+    start = time.perf_counter()
+    for idx in range(len(dataset)):
+        dataset[idx]
+    return time.perf_counter() - start, item_mb * len(dataset)
+
+
+def validation_iou(model, store, train_cfg, device):
+    """Paddy IoU of `model` over the validation windows of the store."""
+    tile_size, stride = train_cfg['tile_size'], train_cfg['stride']
+    offsets = WindowDataset(store, tile_size, stride).offsets
+    _, val_offsets = split_offsets(offsets, train_cfg.get('val_split', 0.2))
+    loader = DataLoader(WindowDataset(store, tile_size, offsets=val_offsets), batch_size=train_cfg['batch_size'])
+    confusion = np.zeros((2, 2), dtype='int64')
+    with torch.inference_mode():
+        for images, masks in loader:
+            preds = model(images.to(device)).argmax(1).cpu().numpy()
+            masks = masks.numpy()
+            for true in (0, 1):
+                for pred in (0, 1):
+                    confusion[true, pred] += np.count_nonzero((masks == true) & (preds == pred))
+    return segmentation_scores(confusion)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dtypes", nargs="+", default=["uint16", "uint8"], choices=["uint16", "uint8"])
+    parser.add_argument("--model", help="Evaluate this checkpoint instead of training one on float32")
+    parser.add_argument("--retrain", action="store_true", help="Also train one model per dtype")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--tile-size", type=int, default=256)
+    args = parser.parse_args()
+
+    with open(ROOT_DIR / "config.yaml", 'r') as f:
+        config = yaml.safe_load(f)
+    train_cfg = config['training']
+    train_cfg.update(epochs=args.epochs, tile_size=args.tile_size, stride=args.tile_size)
+    stack_path = ROOT_DIR / config['data']['norm_output'].strip()
+    label_path = ROOT_DIR / config['data']['label_aligned_tif']
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    with rasterio.open(stack_path) as src:
+        if src.dtypes[0] != 'float32':
+            raise ValueError(f"{stack_path} is {src.dtypes[0]}; run with normalization.dtype: float32 first")
+        num_channels = src.count
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        rows, model = [], None
+        for dtype in ["float32"] + args.dtypes:
+            raster, max_error = stack_path, 0.0
+            if dtype != "float32":
+                raster = tmp / f"norm_{dtype}.tif"
+                max_error = quantized_copy(stack_path, raster, dtype)
+            store = build_tile_store(raster, label_path, tmp / f"store_{dtype}")
+            pass_s, pass_mb = window_pass(store, args.tile_size, args.tile_size)
+
+            retrained = None
+            if dtype == "float32" or args.retrain:
+                if dtype == "float32" and args.model:
+                    model_path = Path(args.model)
+                else:
+                    out_dir = tmp / f"model_{dtype}"
+                    out_dir.mkdir()
+                    torch.manual_seed(0)
+                    history = train_from_tile_store(copy.deepcopy(config), store, out_dir)
+                    model_path = out_dir / "best_model.pth"
+                    retrained = max(history['val_ious'])
+                if model is None:
+                    model = load_segmentation_model(model_path, train_cfg, num_channels, device)
+            iou = validation_iou(model, store, train_cfg, device)
+            rows.append((dtype, disk_mb(raster), disk_mb(store / "image.npy"), pass_s, pass_mb,
+                         max_error, iou, retrained))
+
+        print(f"\n{'dtype':>8} {'stack MB':>9} {'store MB':>9} {'pass s':>7} {'read MB':>8} "
+              f"{'max err':>9} {'IoU':>7} {'dIoU':>8} {'retrain':>8}")
+        base_iou = rows[0][6]
+        for dtype, stack_mb, store_mb, pass_s, pass_mb, max_error, iou, retrained in rows:
+            retrain = f"{retrained:.4f}" if retrained is not None else "-"
+            print(f"{dtype:>8} {stack_mb:>9.1f} {store_mb:>9.1f} {pass_s:>7.2f} {pass_mb:>8.0f} "
+                  f"{max_error:>9.2e} {iou:>7.4f} {iou - base_iou:>+8.4f} {retrain:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Throughput comparison of the sequential and pooled SAR stack builders.
+
+    python benchmarks/bench_stacking.py --size 4096 --dates 20 --workers 4
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from preprocessing import group_sar_dates, write_sar_stack_windowed  # noqa: E402
+
+
+def write_synthetic_dates(out_dir, size, n_dates, seed=0):
+    """Writes dB-scaled VV/VH pairs named like the cropped Sentinel-1 outputs."""
+    rng = np.random.default_rng(seed)
+    profile = dict(driver='GTiff', width=size, height=size, count=1, dtype='float32',
+                   crs='EPSG:4326', transform=from_origin(138.5, 38.0, 1e-4, 1e-4),
+                   nodata=0, compress='lzw', tiled=True, blockxsize=256, blockysize=256)
+    for d in range(n_dates):
+        date = f"2024{(d // 28) + 4:02d}{(d % 28) + 1:02d}"
+        for pol, mean in (("VV", -12.0), ("VH", -19.0)):
+            data = rng.normal(mean, 3.0, (size, size)).astype('float32')
+            path = Path(out_dir) / f"S1A_IW_{date}T053000_{pol}_db.tif"
+            with rasterio.open(path, 'w', **profile) as dst:
+                dst.write(data, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--dates", type=int, default=12)
+    parser.add_argument("--block-size", type=int, default=512)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        (tmp / "in").mkdir()
+        write_synthetic_dates(tmp / "in", args.size, args.dates)
+        date_map, sorted_dates = group_sar_dates(tmp / "in")
+
+        with rasterio.open(date_map[sorted_dates[0]]['vv']) as src:
+            meta = src.meta.copy()
+        meta.update(count=len(sorted_dates) * 3, dtype='float32', compress='lzw', nodata=0)
+
+        pixels = args.size * args.size * len(sorted_dates) * 3
+        runs = [("sequential", 0, "thread"),
+                ("thread", args.workers, "thread"),
+                ("process", args.workers, "process")]
+        baseline = None
+        print(f"{args.dates} dates, {args.size}x{args.size} px, block {args.block_size}")
+        for label, workers, kind in runs:
+            out = tmp / f"stack_{label}.tif"
+            start = time.perf_counter()
+            write_sar_stack_windowed(date_map, sorted_dates, out, meta,
+                                     block_size=args.block_size, workers=workers, executor=kind)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"{label:>10}: {elapsed:7.2f} s  {pixels / elapsed / 1e6:8.1f} Mpx/s  "
+                  f"x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup time of every pipeline stage: interpreter, config and imports.
+
+Runs `python src/paddy.py --check <stage>` in a fresh interpreter per repeat
+and reports the median wall time of the whole process plus the config-load
+and import shares paddy.py measures itself. --baseline points at another
+checkout (e.g. `git worktree add /tmp/base HEAD~1`) whose stage modules are
+timed with a bare `import <module>` for comparison.
+
+    python benchmarks/bench_startup.py --repeats 5
+    python benchmarks/bench_startup.py --baseline /tmp/base --stages statistics train_model
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from paddy import STAGES  # noqa: E402
+
+
+def timed_run(cmd, cwd):
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} failed:\n{proc.stderr.strip()}")
+    return wall, proc.stdout
+
+
+def check_stage(stage, repeats):
+    """Median (wall, config, import) seconds of `paddy.py --check stage`."""
+    walls, configs, imports = [], [], []
+    for _ in range(repeats):
+        wall, out = timed_run([sys.executable, "src/paddy.py", "--check", stage], ROOT_DIR)
+        report = json.loads(out.strip().splitlines()[-1])
+        walls.append(wall)
+        configs.append(report['config_seconds'])
+        imports.append(report['import_seconds'])
+    return statistics.median(walls), statistics.median(configs), statistics.median(imports)
+
+
+def baseline_import(src_dir, module, repeats):
+    """Median wall seconds of a fresh interpreter importing `module` from src_dir."""
+    code = f"import sys; sys.path.insert(0, {str(src_dir)!r}); import {module}"
+    return statistics.median(timed_run([sys.executable, "-c", code], src_dir.parent)[0] for _ in range(repeats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", help="Checkout whose src/ modules are timed for comparison")
+    args = parser.parse_args()
+
+    header = f"{'stage':>18} {'module':>16} {'wall s':>7} {'config s':>9} {'import s':>9}"
+    if args.baseline:
+        header += f" {'baseline s':>11} {'speedup':>8}"
+    print(header)
+    for stage in args.stages:
+        module = STAGES[stage][0]
+        wall, config_s, import_s = check_stage(stage, args.repeats)
+        line = f"{stage:>18} {module:>16} {wall:>7.2f} {config_s:>9.3f} {import_s:>9.2f}"
+        if args.baseline:
+            try:
+                base = baseline_import(Path(args.baseline).resolve() / "src", module, args.repeats)
+                line += f" {base:>11.2f} {base / wall:>7.1f}x"
+            except RuntimeError as exc:
+                line += f" {'failed':>11}"
+                print(exc, file=sys.stderr)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
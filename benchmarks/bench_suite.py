@@ -0,0 +1,354 @@
+"""
+Offline benchmark of every pipeline stage on synthetic data.
+
+For each (size, dates) scenario a throwaway project root is created with a
+copy of src/, a config pointing at synthetic dB-scaled VV/VH rasters, a KML
+ROI and label tiles. Each stage then runs in its own interpreter so its
+wall time and peak RSS are measured in isolation. Results are written as
+JSON; `compare` lines up two result files (e.g. from two commits).
+
+    python benchmarks/bench_suite.py run --sizes 1024 2048 --dates 4 8 --out base.json
+    python benchmarks/bench_suite.py compare base.json head.json --threshold 0.10
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import yaml
+from rasterio.transform import from_origin
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak RSS is not recorded
+    resource = None
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+STAGES = ["crop", "stack", "statistics", "normalize", "labels", "align", "tiling", "inference", "metrics"]
+
+ORIGIN = (138.5, 38.0)
+RES = 1e-4
+
+
+# --- Synthetic data -------------------------------------------------------
+
+def synthetic_dates(n_dates, start=datetime(2024, 4, 1), interval=12):
+    return [(start + timedelta(days=interval * d)).strftime("%Y%m%d") for d in range(n_dates)]
+
+
+def write_db_raster(path, data):
+    profile = dict(driver='GTiff', width=data.shape[1], height=data.shape[0], count=1, dtype='float32',
+                   crs='EPSG:4326', transform=from_origin(*ORIGIN, RES, RES), nodata=0,
+                   compress='lzw', tiled=True, blockxsize=256, blockysize=256)
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(data, 1)
+
+
+def paddy_field_mask(size, rng, n_fields=40):
+    """Rectangular 'fields' that follow the flooding/growth backscatter curve."""
+    mask = np.zeros((size, size), dtype=bool)
+    for _ in range(n_fields):
+        h, w = rng.integers(size // 40 + 1, size // 8 + 2, size=2)
+        r, c = rng.integers(0, size - h), rng.integers(0, size - w)
+        mask[r:r + h, c:c + w] = True
+    return mask
+
+
+def write_synthetic_scene(root, size, n_dates, cropped, seed=0):
+    """
+    dB-scaled VV/VH pairs for n_dates acquisitions. With `cropped` they go
+    straight to processed_dir (named like crop outputs); otherwise into
+    SAFE-like folders under data/raw for the crop stage.
+    Returns the paddy mask used to shape the signal.
+    """
+    rng = np.random.default_rng(seed)
+    paddy = paddy_field_mask(size, rng)
+    for d, date in enumerate(synthetic_dates(n_dates)):
+        # Flooded fields are dark early in the season and brighten as rice grows
+        growth = d / max(n_dates - 1, 1)
+        for pol, mean in (("VV", -11.0), ("VH", -18.0)):
+            data = rng.normal(mean, 2.5, (size, size)).astype('float32')
+            data[paddy] += -8.0 + 10.0 * growth
+            if cropped:
+                path = root / "data/processed/niigata" / f"S1A_IW_GRDH_{date}T053000_Sigma0_{pol}_db.tif"
+            else:
+                path = root / "data/raw" / f"S1A_IW_GRDH_{date}T053000" / "measurement" / f"Sigma0_{pol}_db.tif"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_db_raster(path, data)
+    return paddy
+
+
+def write_roi_kml(path, size, margin=0.1):
+    """KML rectangle over the central part of the synthetic scene."""
+    west, north = ORIGIN
+    east, south = west + size * RES, north - size * RES
+    dx, dy = (east - west) * margin, (north - south) * margin
+    ring = [(west + dx, north - dy), (east - dx, north - dy), (east - dx, south + dy),
+            (west + dx, south + dy), (west + dx, north - dy)]
+    coords = " ".join(f"{x},{y},0" for x, y in ring)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+        f'<Placemark><name>roi</name><Polygon><outerBoundaryIs><LinearRing><coordinates>{coords}'
+        '</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark></Document></kml>\n')
+
+
+def write_label_tiles(label_dir, paddy, tiles=2):
+    """Splits a class raster (3 = paddy, 1/2/4 = other land cover) into tiles x tiles GeoTIFFs."""
+    rng = np.random.default_rng(1)
+    size = paddy.shape[0]
+    classes = rng.choice(np.array([1, 2, 4], dtype='uint8'), size=(size, size))
+    classes[paddy] = 3
+    label_dir.mkdir(parents=True, exist_ok=True)
+    step = size // tiles
+    for i in range(tiles):
+        for j in range(tiles):
+            block = classes[i * step:(i + 1) * step, j * step:(j + 1) * step]
+            profile = dict(driver='GTiff', width=block.shape[1], height=block.shape[0], count=1, dtype='uint8',
+                           crs='EPSG:4326', nodata=0, compress='lzw',
+                           transform=from_origin(ORIGIN[0] + j * step * RES, ORIGIN[1] - i * step * RES, RES, RES))
+            with rasterio.open(label_dir / f"label_tile_{i}_{j}.tif", 'w', **profile) as dst:
+                dst.write(block, 1)
+
+
+def make_project(root, size, n_dates, stages, workers):
+    """Scratch project: src/ copy, adjusted config and synthetic inputs."""
+    shutil.copytree(ROOT_DIR / "src", root / "src", ignore=shutil.ignore_patterns("__pycache__"))
+    with open(ROOT_DIR / "config.yaml", 'r') as f:
+        config = yaml.safe_load(f)
+    config['data']['label_src_dir'] = "data/external/labels"
+    config['preprocessing'].update(incremental=False, fused=False, workers=workers)
+    config['statistics']['workers'] = workers
+    config['extraction'] = dict(config.get('extraction') or {}, workers=workers)
+    config['polygonize'] = dict(config.get('polygonize') or {}, workers=workers)
+    config['evaluation'] = dict(config.get('evaluation') or {}, workers=workers, scenes=[])
+    config['training'].update(encoder='resnet18', encoder_weights=None)
+    with open(root / "config.yaml", 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+    paddy = write_synthetic_scene(root, size, n_dates, cropped="crop" not in stages)
+    write_roi_kml(root / config['data']['roi_kml'], size)
+    write_label_tiles(root / config['data']['label_src_dir'], paddy)
+    return config
+
+
+# --- Stages (run inside the child interpreter) ----------------------------
+
+def _raster_pixels(path, bands=True):
+    with rasterio.open(path) as src:
+        return src.width * src.height * (src.count if bands else 1)
+
+
+def run_stage(stage, root):
+    """Runs one stage of the scratch project; returns (work units, unit name)."""
+    root = Path(root)
+    os.chdir(root)
+    sys.path.insert(0, str(root / "src"))
+    with open(root / "config.yaml", 'r') as f:
+        config = yaml.safe_load(f)
+    data = config['data']
+
+    if stage == "crop":
+        import data_extraction
+        data_extraction.crop_sar_to_roi()
+        return sum(_raster_pixels(p) for p in (root / "data/raw").rglob("*.tif")), "pixels"
+    if stage == "stack":
+        import preprocessing
+        preprocessing.stack_sar_timeseries()
+        return _raster_pixels(root / data['stack_output']), "pixels"
+    if stage == "statistics":
+        import preprocessing
+        preprocessing.generate_stack_statistics()
+        return _raster_pixels(root / data['stack_output']), "pixels"
+    if stage == "normalize":
+        import preprocessing
+        preprocessing.normalize_sar_stack()
+        return _raster_pixels(root / data['norm_output']), "pixels"
+    if stage == "labels":
+        import labeling
+        labeling.process_labels()
+        return _raster_pixels(root / data['label_binary_tif']), "pixels"
+    if stage == "align":
+        import labeling
+        labeling.align_labels_to_stack()
+        return _raster_pixels(root / data['label_aligned_tif']), "pixels"
+    if stage == "tiling":
+        from tile_store import build_tile_store, window_offsets
+        train_cfg = config['training']
+        build_tile_store(root / data['norm_output'], root / data['label_aligned_tif'], root / data['tile_store_dir'])
+        with rasterio.open(root / data['norm_output']) as src:
+            return len(window_offsets(src.width, src.height, train_cfg['tile_size'], train_cfg['stride'])), "tiles"
+    if stage == "inference":
+        import segmentation_models_pytorch as smp
+        from inference import predict_raster
+        inf_cfg = config['inference']
+        with rasterio.open(root / data['norm_output']) as src:
+            channels = src.count
+        # Untrained weights: the cost of a forward pass does not depend on them
+        model = smp.create_model(arch=config['training']['architecture'], encoder_name='resnet18',
+                                 encoder_weights=None, in_channels=channels, classes=2).eval()
+        output_path = root / inf_cfg['output_mask_path']
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        stats = predict_raster(model, root / data['norm_output'], output_path,
+                               window_size=inf_cfg['window_size'], overlap=inf_cfg['overlap'],
+                               batch_size=inf_cfg['batch_size'])
+        return stats['windows'], "tiles"
+    if stage == "metrics":
+        import metrics
+        metrics.run_evaluation(config)
+        return _raster_pixels(root / data['label_aligned_tif']), "pixels"
+    raise ValueError(f"Unknown stage '{stage}'")
+
+
+# --- Driver ---------------------------------------------------------------
+
+def peak_rss_mb():
+    """Peak RSS in MB of this process and its reaped workers, None without `resource`."""
+    if resource is None:
+        return None
+    return max(resource.getrusage(who).ru_maxrss
+               for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / 1024.0  # kilobytes on Linux
+
+
+def measure_stage(stage, root, log_path):
+    """Runs a stage in a child interpreter; returns (seconds, peak RSS MB, units, unit, error)."""
+    result_path = root / f".bench_{stage}.json"
+    start = time.perf_counter()
+    with open(log_path, 'a') as log:
+        proc = subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "_stage", stage, str(root),
+                                 str(result_path)], stdout=log, stderr=subprocess.STDOUT)
+        proc.wait()
+    seconds = time.perf_counter() - start
+
+    if proc.returncode != 0 or not result_path.exists():
+        tail = Path(log_path).read_text().strip().splitlines()[-1:] or ["no output"]
+        return seconds, None, None, None, f"exit {proc.returncode}: {tail[0]}"
+    with open(result_path, 'r') as f:
+        units, unit, peak_mb = json.load(f)
+    return seconds, peak_mb, units, unit, None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    stages = [s for s in STAGES if s in args.stages]
+    report = {
+        "meta": {"commit": git_commit(), "date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count(), "workers": args.workers, "stages": stages},
+        "results": [],
+    }
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)  # --keep-logs copies next to it per scenario
+    for size in args.sizes:
+        for n_dates in args.dates:
+            scenario = f"{size}px_{n_dates}d"
+            with tempfile.TemporaryDirectory() as tmp:
+                root = Path(tmp)
+                make_project(root, size, n_dates, stages, args.workers)
+                failed = None
+                for stage in stages:
+                    if failed:
+                        error = f"skipped, '{failed}' failed"
+                        seconds = peak_mb = units = unit = None
+                    else:
+                        seconds, peak_mb, units, unit, error = measure_stage(stage, root, root / "bench.log")
+                        if error:
+                            failed = stage
+                    throughput = units / seconds if units and seconds else None
+                    report["results"].append({"scenario": scenario, "size": size, "dates": n_dates,
+                                              "stage": stage, "seconds": seconds, "peak_rss_mb": peak_mb,
+                                              "units": units, "unit": unit, "throughput": throughput,
+                                              "error": error})
+                    if error:
+                        print(f"{scenario:>12} {stage:>11}: {error}")
+                    else:
+                        peak = f"peak {peak_mb:8.1f} MB" if peak_mb is not None else "peak        - MB"
+                        rate = f"{throughput:14,.1f}" if throughput is not None else f"{'-':>14}"
+                        print(f"{scenario:>12} {stage:>11}: {seconds:8.2f} s  {rate} {unit}/s  {peak}")
+                if args.keep_logs:
+                    shutil.copy(root / "bench.log", Path(args.out).with_suffix(f".{scenario}.log"))
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to: {args.out}")
+
+
+def _mb(value):
+    return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+
+def compare(args):
+    """Prints stage-by-stage deltas; exits 1 when a stage got slower than --threshold."""
+    with open(args.base, 'r') as f:
+        base = json.load(f)
+    with open(args.head, 'r') as f:
+        head = json.load(f)
+    index = {(r["scenario"], r["stage"]): r for r in base["results"]}
+
+    print(f"base {base['meta'].get('commit')}  ->  head {head['meta'].get('commit')}")
+    print(f"{'scenario':>12} {'stage':>11} {'base s':>9} {'head s':>9} {'speedup':>8} {'base MB':>9} {'head MB':>9}")
+    regressions = 0
+    for row in head["results"]:
+        old = index.get((row["scenario"], row["stage"]))
+        if old is None or old["seconds"] is None or row["seconds"] is None:
+            continue
+        speedup = old["seconds"] / row["seconds"] if row["seconds"] else float('inf')
+        flag = ""
+        if speedup < 1 / (1 + args.threshold):
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{row['scenario']:>12} {row['stage']:>11} {old['seconds']:>9.2f} {row['seconds']:>9.2f} "
+              f"{speedup:>7.2f}x {_mb(old['peak_rss_mb'])} {_mb(row['peak_rss_mb'])}{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the suite")
+    run.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048])
+    run.add_argument("--dates", type=int, nargs="+", default=[4, 8])
+    run.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    run.add_argument("--workers", type=int, default=0, help="Worker count for the pooled stages")
+    run.add_argument("--out", default=str(ROOT_DIR / "benchmarks" / "results" / "bench_suite.json"))
+    run.add_argument("--keep-logs", action="store_true", help="Keep each scenario's stage log next to --out")
+
+    cmp = sub.add_parser("compare", help="Compare two result files")
+    cmp.add_argument("base")
+    cmp.add_argument("head")
+    cmp.add_argument("--threshold", type=float, default=0.10, help="Slowdown that counts as a regression")
+
+    stage = sub.add_parser("_stage")  # internal: one stage in a fresh interpreter
+    stage.add_argument("stage")
+    stage.add_argument("root")
+    stage.add_argument("result_path")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_suite(args)
+    elif args.command == "compare":
+        sys.exit(compare(args))
+    else:
+        units, unit = run_stage(args.stage, args.root)
+        with open(args.result_path, 'w') as f:
+            json.dump([units, unit, peak_rss_mb()], f)
+
+
+if __name__ == "__main__":
+    main()
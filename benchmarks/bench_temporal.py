@@ -0,0 +1,78 @@
+"""
+Runtime and validation IoU of temporal compression against the full stack.
+
+For the full normalized stack and each compression method, builds a tile
+store, trains the native loop for a few epochs with identical settings and
+reports channels, compression / store / training time and the best
+validation IoU.
+
+    python benchmarks/bench_temporal.py --epochs 5 --methods pca harmonic resample
+"""
+import argparse
+import copy
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import rasterio
+import yaml
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from temporal import fit_projection, write_projected  # noqa: E402
+from tile_store import build_tile_store  # noqa: E402
+from training import train_from_tile_store  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--methods", nargs="+", default=["pca", "harmonic", "resample"])
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--tile-size", type=int, default=256)
+    args = parser.parse_args()
+
+    with open(ROOT_DIR / "config.yaml", 'r') as f:
+        config = yaml.safe_load(f)
+    config['training'].update(epochs=args.epochs, tile_size=args.tile_size, stride=args.tile_size)
+    stack_path = ROOT_DIR / config['data']['norm_output'].strip()
+    label_path = ROOT_DIR / config['data']['label_aligned_tif']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        rows = []
+        for method in ["full"] + args.methods:
+            start = time.perf_counter()
+            if method == "full":
+                raster = stack_path
+            else:
+                t_cfg = dict(config['temporal'], method=method)
+                raster = tmp / f"{method}.tif"
+                with rasterio.open(stack_path) as src:
+                    write_projected(src, fit_projection(src, t_cfg), raster, t_cfg.get('block_size', 512))
+            compress_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store = build_tile_store(raster, label_path, tmp / f"store_{method}")
+            store_s = time.perf_counter() - start
+
+            out_dir = tmp / f"model_{method}"
+            out_dir.mkdir()
+            start = time.perf_counter()
+            history = train_from_tile_store(copy.deepcopy(config), store, out_dir)
+            train_s = time.perf_counter() - start
+
+            with rasterio.open(raster) as src:
+                channels = src.count
+            rows.append((method, channels, compress_s, store_s, train_s / args.epochs, max(history['val_ious'])))
+
+        print(f"\n{'method':>10} {'channels':>9} {'compress s':>11} {'store s':>8} {'s/epoch':>8} {'best IoU':>9} {'dIoU':>8}")
+        full_iou = rows[0][-1]
+        for method, channels, compress_s, store_s, epoch_s, iou in rows:
+            print(f"{method:>10} {channels:>9} {compress_s:>11.1f} {store_s:>8.1f} {epoch_s:>8.1f} "
+                  f"{iou:>9.4f} {iou - full_iou:>+8.4f}")
+
+
+if __name__ == "__main__":
+    main()
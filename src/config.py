@@ -0,0 +1,224 @@
+"""
+config.yaml, parsed and validated once per process.
+
+    config = load_config()                    # project config.yaml, cached
+    config = load_config("trial/config.yaml") # e.g. a tuning trial
+    config['training']['epochs']              # plain dict access, as before
+    config.root_dir / config['data']['norm_output']
+
+Every stage calls load_config() instead of re-reading the file, so the YAML
+is parsed once and all stages of a process share one Config. Validation
+checks each key against SCHEMA (type, allowed values, required keys) and
+names the closest known key for unknown ones: a typo fails at startup with
+every problem listed, not deep into a run.
+"""
+import difflib
+import os
+from pathlib import Path
+
+import yaml
+from yaml.representer import SafeRepresenter
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+NUM = (int, float)
+NONE = type(None)
+
+
+class ConfigError(ValueError):
+    """config.yaml failed validation; `problems` lists every finding."""
+
+    def __init__(self, path, problems):
+        self.path = path
+        self.problems = problems
+        super().__init__(f"Invalid config {path}:\n" + "\n".join(f"  - {p}" for p in problems))
+
+
+class Key:
+    """Expected type (or allowed values) of one config key."""
+
+    def __init__(self, types=str, choices=None, required=False):
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.choices = choices
+        self.required = required
+
+    def check(self, value):
+        if self.choices is not None:
+            if value not in self.choices:
+                return f"must be one of {', '.join(repr(c) for c in self.choices)}, got {value!r}"
+            return None
+        # bool is an int subclass: True is not a valid block size
+        if not isinstance(value, self.types) or (isinstance(value, bool) and bool not in self.types):
+            names = " or ".join('null' if t is NONE else t.__name__ for t in self.types)
+            return f"must be {names}, got {type(value).__name__} {value!r}"
+        return None
+
+
+def _path(required=True):
+    return Key(str, required=required)
+
+
+def _int(required=False):
+    return Key(int, required=required)
+
+
+EXECUTORS = ('thread', 'process')
+
+# section -> (section required, {key: Key})
+SCHEMA = {
+    'project': (False, {'name': Key(str)}),
+    'data': (True, {
+        'roi_kml': _path(), 'raw_zip_dir': _path(), 'processed_dir': _path(),
+        'stack_output': _path(), 'norm_output': _path(), 'label_src_dir': _path(),
+        'label_merged_tif': _path(), 'label_binary_tif': _path(), 'label_geojson': _path(),
+        'label_aligned_tif': _path(), 'stack_parts_dir': _path(False), 'tile_store_dir': _path(False),
+    }),
+    'extraction': (False, {'workers': _int()}),
+    'snap': (False, {
+        'workers': _int(), 'threads_per_job': _int(), 'memory_per_job': Key(str), 'cache_per_job': Key(str),
+        'timeout_minutes': Key(NUM), 'retries': _int(), 'backoff_seconds': Key(NUM),
+    }),
+    'preprocessing': (False, {
+        'stack_mode': Key(choices=('windowed', 'full')), 'block_size': _int(), 'workers': _int(),
+        'executor': Key(choices=EXECUTORS), 'fused': Key(bool), 'write_raw_stack': Key(bool),
+        'incremental': Key(bool),
+    }),
+    'statistics': (False, {
+        'block_size': _int(), 'workers': _int(), 'executor': Key(choices=EXECUTORS),
+        'hist_range': Key(list), 'hist_bins': _int(),
+    }),
+    'normalization': (False, {
+        'method': Key(choices=('histogram', 'exact')), 'percentiles': Key(list), 'max_error': Key(NUM),
+        'reuse_stats': Key(bool), 'block_size': _int(), 'dtype': Key(choices=('float32', 'uint16', 'uint8')),
+    }),
+    'output_layout': (False, {
+        'cog': Key(bool), 'compress': Key(str), 'level': Key((int, NONE)), 'predictor': Key(choices=(1, 2, 3)),
+        'interleave': Key(choices=('pixel', 'band')), 'block_size': _int(), 'overviews': Key(list),
+    }),
+    'temporal': (False, {
+        'enabled': Key(bool), 'method': Key(choices=('pca', 'harmonic', 'resample')), 'components': _int(),
+        'harmonics': _int(), 'period_days': Key(NUM + (NONE,)), 'steps': _int(), 'sample_pixels': _int(),
+        'seed': _int(), 'block_size': _int(), 'output': _path(False),
+    }),
+    'labels': (False, {'block_size': _int(), 'write_merged': Key(bool)}),
+    'polygonize': (False, {'tile_size': _int(), 'workers': _int(), 'simplify_tolerance': Key(NUM)}),
+    'training': (True, {
+        'tile_size': _int(True), 'stride': _int(True), 'batch_size': _int(True), 'epochs': _int(True),
+        'learning_rate': Key(NUM, required=True), 'architecture': Key(str, required=True),
+        'encoder': Key(str, required=True), 'encoder_weights': Key((str, NONE)),
+        'data_pipeline': Key(choices=('tiles', 'tile_store')), 'label_source': Key(choices=('raster', 'vector')),
+        'val_split': Key(NUM), 'num_workers': _int(), 'resume': Key(bool), 'threads': _int(),
+        'amp': Key(choices=(None, 'bf16')), 'channels_last': Key(bool), 'compile': Key(bool),
+        'prefetch_factor': _int(),
+    }),
+    'tuning': (False, {
+        'search_space': Key(dict, required=True), 'min_epochs': _int(), 'max_epochs': _int(),
+        'reduction_factor': _int(), 'workers': _int(), 'threads_per_trial': _int(), 'output_dir': _path(False),
+    }),
+    'inference': (True, {
+        'input_path': _path(False), 'engine': Key(choices=('stream', 'geoai')),
+        'backend': Key(choices=('torch', 'torchscript', 'onnx', 'onnx_int8')), 'threads': _int(),
+        'window_size': _int(True), 'overlap': _int(True), 'batch_size': _int(True), 'prefetch': _int(),
+        'block_size': _int(), 'model_path': _path(), 'output_mask_path': _path(), 'vector_output': _path(False),
+    }),
+    'evaluation': (False, {
+        'scenes': Key(list), 'metrics_path': _path(False), 'block_size': _int(), 'workers': _int(),
+        'executor': Key(choices=EXECUTORS),
+    }),
+    'serve': (False, {
+        'host': Key(str), 'port': _int(), 'max_batch_size': _int(), 'max_wait_ms': Key(NUM),
+        'output_dir': _path(False), 'verbose': Key(bool),
+    }),
+    'export': (False, {
+        'formats': Key(list), 'torchscript_path': _path(), 'onnx_path': _path(), 'onnx_int8_path': _path(),
+        'quantization': Key(choices=('static', 'dynamic', None)), 'calibration_tiles': _int(),
+        'opset': _int(), 'seed': _int(),
+    }),
+    'instrumentation': (False, {
+        'enabled': Key(bool), 'output_dir': _path(False), 'profile': Key((str, NONE)), 'profile_top': _int(),
+    }),
+    'paths': (True, {'output_model_dir': _path()}),
+}
+
+
+def _unknown(kind, name, known):
+    close = difflib.get_close_matches(name, known, n=1)
+    return f"unknown {kind} '{name}'" + (f" (did you mean '{close[0]}'?)" if close else "")
+
+
+def validate_config(raw):
+    """List of problems found in a parsed config mapping (empty when valid)."""
+    if not isinstance(raw, dict):
+        return [f"top level must be a mapping, got {type(raw).__name__}"]
+    problems = []
+    for section in raw:
+        if section not in SCHEMA:
+            problems.append(_unknown("section", section, SCHEMA))
+    for section, (section_required, keys) in SCHEMA.items():
+        values = raw.get(section)
+        if values is None:
+            if section_required:
+                problems.append(f"missing section '{section}'")
+            continue
+        if not isinstance(values, dict):
+            problems.append(f"{section}: must be a mapping, got {type(values).__name__}")
+            continue
+        for key, value in values.items():
+            if key not in keys:
+                problems.append(f"{section}: " + _unknown("key", key, keys))
+                continue
+            problem = keys[key].check(value)
+            if problem:
+                problems.append(f"{section}.{key} {problem}")
+        problems += [f"{section}: missing required key '{key}'"
+                     for key, spec in keys.items() if spec.required and key not in values]
+    return problems
+
+
+class Config(dict):
+    """
+    Validated config.yaml contents. A dict of sections, so stage functions
+    keep indexing it as before; `path` is the file it was read from and
+    `root_dir` the project root that relative paths refer to.
+    """
+
+    def __init__(self, values, path=None, root_dir=ROOT_DIR):
+        super().__init__(values)
+        self.path = Path(path) if path else None
+        self.root_dir = Path(root_dir)
+
+    def section(self, name):
+        """Section `name`, or an empty dict when it is absent or null."""
+        return self.get(name) or {}
+
+
+# Trial configs (hyper_tuning) and benchmarks dump Configs back to YAML
+yaml.SafeDumper.add_representer(Config, SafeRepresenter.represent_dict)
+
+_cache = {}
+
+
+def load_config(path=None, validate=True):
+    """
+    The Config of `path` (default: config.yaml in the project root). Parsed
+    and validated on first use, then shared by every caller until the file
+    changes; raises ConfigError listing every problem. A config that is
+    already loaded is returned as is, so stage functions can take either.
+    """
+    if isinstance(path, dict):
+        return path  # already loaded (a Config, or a dict built by a benchmark)
+    path = Path(path).resolve() if path else ROOT_DIR / "config.yaml"
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, 'r') as f:
+        raw = yaml.safe_load(f) or {}
+    if validate:
+        problems = validate_config(raw)
+        if problems:
+            raise ConfigError(path, problems)
+    config = Config(raw, path)
+    _cache[path] = (mtime, config)
+    return config
@@ -1,27 +1,115 @@
 import fiona
 import geopandas as gpd
-import rioxarray
+import json
+import math
+import multiprocessing as mp
+import signal
+import sys
+import time
+import rasterio
+from concurrent.futures import as_completed
+from rasterio import features
+from rasterio.control import GroundControlPoint
+from rasterio.errors import WindowError
+from rasterio.transform import from_gcps
+from rasterio.warp import transform_geom
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
 from shapely.geometry import mapping
-import yaml
 from pathlib import Path
 import os
 import glob
-from pyroSAR.snap import geocode
-from pyroSAR import identify
+from config import load_config
+from instrumentation import span, stage_run
+from raster_utils import list_zip_rasters, make_executor
 
-def crop_sar_to_roi():
+# Reprojected ROI geometries per raster CRS, cached for the life of each worker
+_roi_cache = {}
+
+
+def _roi_in_crs(roi_geoms, roi_crs, dst_crs):
+    key = (dst_crs.to_wkt(), roi_crs, str(roi_geoms))
+    if key not in _roi_cache:
+        _roi_cache[key] = [transform_geom(roi_crs, dst_crs, geom) for geom in roi_geoms]
+    return _roi_cache[key]
+
+
+def crop_raster_to_roi(raster_path, output_path, roi_geoms, roi_crs):
+    """
+    Crops one raster to the ROI by reading only the pixel window covering the
+    ROI bounds, then masking pixels outside the polygons (as rio.clip does).
+    Returns the size of the written window, or None if the ROI misses the raster.
+    """
+    # Skip GDAL's sibling-file scan, which is costly inside /vsizip/ archives
+    with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'), rasterio.open(raster_path) as src:
+        crs, transform, gcps = src.crs, src.transform, None
+        if crs is None and src.gcps[1] is not None:
+            # Raw GRD measurements are georeferenced by GCPs only. A least-squares
+            # affine is close enough to pick the window and mask the ROI, but not
+            # to georeference the output: that keeps the (shifted) GCPs instead.
+            gcps, crs = src.gcps
+            transform = from_gcps(gcps)
+
+        geoms = _roi_in_crs(roi_geoms, roi_crs, crs)
+        boxes = [features.bounds(geom) for geom in geoms]
+        left, bottom = min(b[0] for b in boxes), min(b[1] for b in boxes)
+        right, top = max(b[2] for b in boxes), max(b[3] for b in boxes)
+
+        # Pixel extent of the four ROI corners: unlike windows.from_bounds this
+        # also holds for GCP geometries whose rows or columns run backwards
+        inverse = ~transform
+        cols, rows = zip(*(inverse * (x, y) for x in (left, right) for y in (bottom, top)))
+        col_off, row_off = math.floor(min(cols)), math.floor(min(rows))
+        window = Window(col_off, row_off, math.ceil(max(cols)) - col_off, math.ceil(max(rows)) - row_off)
+        try:
+            window = window.intersection(Window(0, 0, src.width, src.height))
+        except WindowError:
+            return None
+
+        data = src.read(window=window)
+        win_transform = window_transform(window, transform)
+        outside = features.geometry_mask(geoms, out_shape=data.shape[1:], transform=win_transform)
+        nodata = src.nodata if src.nodata is not None else 0
+        data[:, outside] = nodata
+
+        profile = src.profile.copy()
+        for key in ('tiled', 'blockxsize', 'blockysize'):
+            profile.pop(key, None)
+        profile.update(driver='GTiff', height=data.shape[1], width=data.shape[2], nodata=nodata)
+        if gcps is None:
+            profile.update(transform=win_transform, crs=crs)
+        else:
+            for key in ('transform', 'crs'):
+                profile.pop(key, None)
+            gcps = [GroundControlPoint(row=g.row - window.row_off, col=g.col - window.col_off,
+                                       x=g.x, y=g.y, z=g.z, id=g.id, info=g.info) for g in gcps]
+
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        if gcps is not None:
+            dst.gcps = (gcps, crs)
+        dst.write(data)
+    return data.shape[2], data.shape[1]
+
+
+def _crop_task(raster_path, output_path, roi_geoms, roi_crs):
+    try:
+        return raster_path, output_path, crop_raster_to_roi(raster_path, output_path, roi_geoms, roi_crs), None
+    except Exception as e:
+        return raster_path, output_path, None, e
+
+
+def crop_sar_to_roi(config=None):
 
     # Load configuration
     ROOT_DIR = Path(__file__).resolve().parent.parent
-    CONFIG_PATH = ROOT_DIR / "config.yaml"
-    with open(CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
-        print(config)
+    config = load_config(config)
+    print(config)
 
     # Extract paths from YAML
     raw_dir = os.path.join(ROOT_DIR,config['data']['raw_zip_dir'])
     output_dir = os.path.join(ROOT_DIR,config['data']['processed_dir'])
     kml_path = os.path.join(ROOT_DIR,config['data']['roi_kml'])
+    workers = (config.get('extraction') or {}).get('workers', 0)
     if not os.path.exists(output_dir):
         print(f"Creating output directory: {output_dir}")
         os.makedirs(output_dir, exist_ok=True)
@@ -30,56 +118,196 @@ def crop_sar_to_roi():
     # 1. Setup Environment
     fiona.drvsupport.supported_drivers['KML'] = 'rw'
     roi_gdf = gpd.read_file(kml_path, driver='KML')
+    # Plain GeoJSON-like geometries are cheap to ship to worker processes
+    roi_geoms = [mapping(geom) for geom in roi_gdf.geometry]
+    roi_crs = roi_gdf.crs.to_wkt()
 
     safe_folders = [f for f in glob.glob(os.path.join(raw_dir, "*")) if os.path.isdir(f)]
     print(f"Found {len(safe_folders)} potential SAR folders in {raw_dir}")
 
+    jobs = []
     for safe_folder in safe_folders:
         folder_name = os.path.basename(safe_folder)
-        print(f"Processing directory: {folder_name}...")
         raster_files = glob.glob(os.path.join(safe_folder, "**", "*.tif"), recursive=True)
-
         for raster_path in raster_files:
             filename = os.path.basename(raster_path)
-            output_filename = f"{folder_name}_{filename}"
-            output_path = os.path.join(output_dir, output_filename)
-            print(output_path)
-
-            try:
-                with rioxarray.open_rasterio(raster_path) as src:
-                    # Match CRS to the raster
-                    roi_projected = roi_gdf.to_crs(src.rio.crs)
-                    # Crop to ROI
-                    cropped = src.rio.clip(
-                        roi_projected.geometry.apply(mapping),
-                        roi_projected.crs
-                    )
-                    cropped.rio.to_raster(output_path)
-                    print(f"   [Saved]: {output_filename}")
-
-            except Exception as e:
-                print(f"   [Error] skipping {filename}: {e}")
+            jobs.append((raster_path, os.path.join(output_dir, f"{folder_name}_{filename}")))
+
+    # Zipped bundles are read in place through /vsizip/, without extraction
+    zip_bundles = glob.glob(os.path.join(raw_dir, "*.zip"))
+    print(f"Found {len(zip_bundles)} zipped SAR bundles in {raw_dir}")
+    for zip_path in zip_bundles:
+        for member, vsi_path in list_zip_rasters(zip_path):
+            # Name outputs like the extracted case: <SAFE folder>_<file>.tif
+            parts = member.split("/")
+            folder_name = parts[0] if len(parts) > 1 else Path(zip_path).stem
+            filename = os.path.splitext(parts[-1])[0] + ".tif"
+            jobs.append((vsi_path, os.path.join(output_dir, f"{folder_name}_{filename}")))
+    print(f"Cropping {len(jobs)} rasters with {max(workers, 1)} worker(s)...")
+
+    pool = make_executor('process', workers)
+    if pool is None:
+        results = (_crop_task(src, dst, roi_geoms, roi_crs) for src, dst in jobs)
+    else:
+        futures = [pool.submit(_crop_task, src, dst, roi_geoms, roi_crs) for src, dst in jobs]
+        results = (future.result() for future in as_completed(futures))
+
+    for raster_path, output_path, size, error in results:
+        filename = os.path.basename(raster_path)
+        if error is not None:
+            print(f"   [Error] skipping {filename}: {error}")
+        elif size is None:
+            print(f"   [Skipped] {filename}: ROI does not overlap the raster")
+        else:
+            print(f"   [Saved]: {os.path.basename(output_path)} ({size[0]}x{size[1]} px)")
+    if pool is not None:
+        pool.shutdown()
 
     print("\n--- ROI Cropping Complete for all folders ---")
 
 
 
 
-def process_s1_batch( gpt_path=None):
+def _geocode_job(bundle, output_folder, kml_path, snap_cfg, conn):
+    """Runs one SNAP geocode in its own process so it can be timed out and killed."""
+    if hasattr(os, 'setsid'):
+        # New process group: a timeout kill also takes down the gpt child
+        os.setsid()
+    if snap_cfg.get('memory_per_job'):
+        # Picked up by the JVM that gpt starts
+        os.environ['_JAVA_OPTIONS'] = f"-Xmx{snap_cfg['memory_per_job']}"
+
+    gpt_args = ['-q', str(snap_cfg.get('threads_per_job', 2))]
+    if snap_cfg.get('cache_per_job'):
+        gpt_args += ['-c', str(snap_cfg['cache_per_job'])]
+
+    # pyroSAR (and SNAP discovery) is only loaded by the geocode jobs
+    from pyroSAR.snap import geocode
+
+    try:
+        geocode(
+            infile=bundle,
+            outdir=output_folder,
+            speckleFilter='Refined Lee',
+            t_srs=4326,
+            spacing=10,
+            scaling='db',
+            shapefile=kml_path,
+            removeS1BorderNoise=True,
+            removeS1BorderNoiseMethod='pyroSAR',
+            removeS1ThermalNoise=True,
+            demResamplingMethod='BILINEAR_INTERPOLATION',
+            demName='SRTM 1Sec HGT',
+            cleanup=True,  # Set to True to save disk space after each run
+            gpt_args=gpt_args
+        )
+    except Exception as e:
+        conn.send(f"{type(e).__name__}: {e}")
+        conn.close()
+        sys.exit(1)
+    conn.close()
+
+
+def _kill_job(proc):
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        # No process groups on Windows: gpt may outlive its parent here
+        proc.kill()
+    proc.join()
+
+
+def run_snap_jobs(jobs, output_folder, kml_path, snap_cfg):
+    """
+    Runs up to snap.workers geocode jobs at once. Failed or timed-out jobs are
+    retried snap.retries times with exponential backoff. `jobs` is a list of
+    (scene_name, bundle); returns one result dict per job.
+    """
+    workers = max(1, snap_cfg.get('workers', 1))
+    timeout = snap_cfg.get('timeout_minutes', 120) * 60
+    retries = snap_cfg.get('retries', 2)
+    backoff = snap_cfg.get('backoff_seconds', 60)
+
+    pending = [{"scene": name, "bundle": bundle, "attempts": 0, "not_before": 0.0,
+                "first_start": None, "error": None} for name, bundle in jobs]
+    running, results = [], []
+
+    while pending or running:
+        now = time.monotonic()
+
+        # Start jobs while there are free slots
+        for job in [j for j in pending if j["not_before"] <= now]:
+            if len(running) >= workers:
+                break
+            pending.remove(job)
+            job["attempts"] += 1
+            job["started"] = now
+            job["first_start"] = job["first_start"] or now
+            recv_conn, send_conn = mp.Pipe(duplex=False)
+            proc = mp.Process(target=_geocode_job,
+                              args=(job["bundle"], output_folder, kml_path, snap_cfg, send_conn))
+            proc.start()
+            send_conn.close()
+            running.append((job, proc, recv_conn))
+            print(f">>> Processing: {job['scene']} (attempt {job['attempts']}/{retries + 1})")
+
+        # Collect finished and timed-out jobs
+        for entry in list(running):
+            job, proc, recv_conn = entry
+            if proc.is_alive() and now - job["started"] < timeout:
+                continue
+            if proc.is_alive():
+                _kill_job(proc)
+                job["error"] = f"timed out after {timeout / 60:.0f} min"
+            else:
+                proc.join()
+                job["error"] = None if proc.exitcode == 0 else f"exit code {proc.exitcode}"
+                try:
+                    if recv_conn.poll():
+                        job["error"] = recv_conn.recv()
+                except EOFError:
+                    pass
+            recv_conn.close()
+            running.remove(entry)
+
+            if job["error"] is None:
+                status = "succeeded"
+            elif job["attempts"] <= retries:
+                delay = backoff * 2 ** (job["attempts"] - 1)
+                print(f"   [Retry] {job['scene']}: {job['error']} - retrying in {delay:.0f}s")
+                job["not_before"] = time.monotonic() + delay
+                pending.append(job)
+                continue
+            else:
+                status = "failed"
+            duration = time.monotonic() - job["first_start"]
+            print(f"Done: {job['scene']} [{status}] in {duration / 60:.1f} min")
+            results.append({"scene": job["scene"], "status": status, "attempts": job["attempts"],
+                            "duration_s": round(duration, 1), "error": job["error"]})
+
+        time.sleep(1.0)
+
+    return results
+
+
+def process_s1_batch( gpt_path=None, config=None):
     """
     Processes all Sentinel-1 scenes in a folder using pyroSAR and SNAP.
     """
+    from pyroSAR import identify
 
     # 0.Load configuration
     ROOT_DIR = Path(__file__).resolve().parent.parent
-    CONFIG_PATH = ROOT_DIR / "config.yaml"
-    with open(CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
-        print(config)
+    config = load_config(config)
+    print(config)
 
     output_folder = os.path.join(ROOT_DIR, config['data']['processed_dir'])
     input_folder = os.path.join(ROOT_DIR, config['data']['raw_zip_dir'])
     kml_path = os.path.join(ROOT_DIR, config['data']['roi_kml'])
+    snap_cfg = config.get('snap') or {}
     # 1. Environment Setup
 
     if gpt_path:
@@ -94,50 +322,65 @@ def process_s1_batch( gpt_path=None):
 
     print(f"Total scenes found: {len(input_bundles)}")
 
-    # 3. Execution Loop
+    # 3. Skip finished scenes, schedule the rest
+    jobs, results = [], []
     for bundle in input_bundles:
         try:
             scene = identify(bundle)
             scene_name = scene.outname_base()
+        except Exception as e:
+            print(f"Error processing {bundle}: {e}")
+            results.append({"scene": os.path.basename(bundle), "status": "failed", "attempts": 0,
+                            "duration_s": 0.0, "error": str(e)})
+            continue
 
-            # Check if processing is already done (Optional but recommended)
-            # This looks for the directory or file starting with the scene name
-            if any(scene_name in f for f in os.listdir(output_folder)):
-                print(f"Skipping {scene_name} - Output already exists.")
-                continue
+        # Check if processing is already done (Optional but recommended)
+        # This looks for the directory or file starting with the scene name
+        if any(scene_name in f for f in os.listdir(output_folder)):
+            print(f"Skipping {scene_name} - Output already exists.")
+            results.append({"scene": scene_name, "status": "skipped", "attempts": 0,
+                            "duration_s": 0.0, "error": None})
+            continue
+        jobs.append((scene_name, bundle))
 
-            print(f"\n>>> Processing: {scene_name}")
-            geocode(
-                infile=bundle,
-                outdir=output_folder,
-                speckleFilter='Refined Lee',
-                t_srs=4326,
-                spacing=10,
-                scaling='db',
-                shapefile=kml_path,
-                removeS1BorderNoise=True,
-                removeS1BorderNoiseMethod='pyroSAR',
-                removeS1ThermalNoise=True,
-                demResamplingMethod='BILINEAR_INTERPOLATION',
-                demName='SRTM 1Sec HGT',
-                cleanup=True  # Set to True to save disk space after each run
-            )
-            print(f"Done: {scene_name}")
+    print(f"Scheduling {len(jobs)} scenes on {max(1, snap_cfg.get('workers', 1))} concurrent SNAP jobs")
+    results += run_snap_jobs(jobs, output_folder, kml_path, snap_cfg)
 
-        except Exception as e:
-            print(f"Error processing {bundle}: {e}")
+    # 4. Summary
+    print("\n--- SNAP Batch Summary ---")
+    for status in ("succeeded", "skipped", "failed"):
+        group = [r for r in results if r["status"] == status]
+        print(f"{status.capitalize()}: {len(group)}")
+        for r in group:
+            detail = f" ({r['error']})" if r["error"] else ""
+            print(f"   {r['scene']}: {r['duration_s'] / 60:.1f} min, {r['attempts']} attempt(s){detail}")
 
+    summary_path = os.path.join(output_folder, "snap_batch_summary.json")
+    with open(summary_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Summary saved to: {summary_path}")
 
 
 
-if __name__ == "__main__":
-    crop_sar_to_roi()
 
-    Fix PROJ_LIB for GDAL
+def run_crop_sar(config=None):
+    """The `crop_sar` stage: crop the raw scenes to the ROI, then geocode with SNAP."""
+    config = load_config(config)
+    with span("crop"):
+        crop_sar_to_roi(config)
+
+    # Fix PROJ_LIB for GDAL
     proj_lib = r"D:\cv_project\sar_prj\venv\Lib\site-packages\osgeo\data\proj"
     if os.path.exists(proj_lib):
         os.environ['PROJ_LIB'] = proj_lib
 
-    definin path of SNAP tool
+    # definin path of SNAP tool
     GPT = r"C:\Program Files\esa-snap\bin\gpt.exe"
-    process_s1_batch(gpt_path=GPT)
\ No newline at end of file
+    with span("geocode"):
+        process_s1_batch(gpt_path=GPT, config=config)
+
+
+if __name__ == "__main__":
+    config = load_config()
+    with stage_run("crop_sar", config):
+        run_crop_sar(config)
@@ -0,0 +1,149 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import torch
+from rasterio.windows import Window
+from config import load_config
+from inference import load_segmentation_model
+from instrumentation import stage_run
+from raster_utils import read_normalized
+from temporal import input_adapter
+
+
+def iter_calibration_tiles(raster_path, n_tiles=32, tile_size=512, seed=0, band_transform=None):
+    """
+    Yields `n_tiles` random full-size windows of the normalized stack, each
+    (C, T, T) float32 (after `band_transform`), read one at a time so memory
+    stays at one tile whatever the number of dates.
+    """
+    rng = np.random.default_rng(seed)
+    with rasterio.open(raster_path) as src:
+        max_row, max_col = max(src.height - tile_size, 0), max(src.width - tile_size, 0)
+        for _ in range(n_tiles):
+            row, col = int(rng.integers(0, max_row + 1)), int(rng.integers(0, max_col + 1))
+            window = Window(col, row, min(tile_size, src.width), min(tile_size, src.height))
+            tile = np.zeros((src.count, tile_size, tile_size), dtype='float32')
+            tile[:, :window.height, :window.width] = read_normalized(src, window)
+            yield tile if band_transform is None else band_transform(tile)
+
+
+def export_torchscript(model, sample, out_path):
+    """Traces the model on `sample` (N, C, H, W) and saves a TorchScript module."""
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, torch.from_numpy(sample), check_trace=False)
+    traced = torch.jit.freeze(traced)
+    traced.save(str(out_path))
+    return out_path
+
+
+def export_onnx(model, sample, out_path, opset=17):
+    """Exports to ONNX with dynamic batch and spatial axes."""
+    axes = {0: 'batch', 2: 'height', 3: 'width'}
+    torch.onnx.export(model, (torch.from_numpy(sample),), str(out_path),
+                      input_names=['image'], output_names=['logits'],
+                      dynamic_axes={'image': axes, 'logits': axes},
+                      opset_version=opset, do_constant_folding=True, dynamo=False)
+    return out_path
+
+
+class _TileReader:
+    """onnxruntime CalibrationDataReader over an iterable of calibration tiles, one tile per batch."""
+
+    def __init__(self, tiles):
+        self._tiles = iter(tiles)
+
+    def get_next(self):
+        tile = next(self._tiles, None)
+        return None if tile is None else {'image': tile[None]}
+
+
+def quantize_onnx(fp32_path, out_path, mode='static', calibration_tiles=None):
+    """
+    int8 quantization with onnxruntime. `static` calibrates activation ranges
+    on `calibration_tiles`, an iterable of (C, T, T) tiles consumed lazily
+    (QDQ format, the one the CPU kernels fuse); `dynamic` quantizes weights
+    only and needs no calibration data.
+    """
+    try:
+        from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType,
+                                              quantize_dynamic, quantize_static)
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError as exc:
+        raise ImportError("int8 export needs onnxruntime: pip install onnxruntime") from exc
+
+    # Shape inference + graph cleanup before quantization
+    prep_path = Path(out_path).with_suffix('.prep.onnx')
+    quant_pre_process(str(fp32_path), str(prep_path), skip_symbolic_shape=True)
+    try:
+        if mode == 'dynamic':
+            quantize_dynamic(str(prep_path), str(out_path), weight_type=QuantType.QInt8)
+        elif mode == 'static':
+            if calibration_tiles is None:
+                raise ValueError("Static quantization needs calibration tiles")
+            quantize_static(str(prep_path), str(out_path), _TileReader(calibration_tiles),
+                            quant_format=QuantFormat.QDQ, per_channel=True,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                            calibrate_method=CalibrationMethod.MinMax)
+        else:
+            raise ValueError(f"Unknown quantization mode '{mode}', use 'static' or 'dynamic'")
+    finally:
+        prep_path.unlink(missing_ok=True)
+    return out_path
+
+
+def export_models(config):
+    """
+    Writes the CPU inference variants of best_model.pth listed in the
+    `export` config section and a manifest (models/export_manifest.json).
+    """
+    root_dir = Path(__file__).resolve().parent.parent
+    exp_cfg = config['export']
+    inf_cfg = config['inference']
+    raster_path = root_dir / inf_cfg.get('input_path', config['data']['norm_output']).strip()
+    model_path = root_dir / inf_cfg['model_path']
+
+    with rasterio.open(raster_path) as src:
+        num_channels, band_transform = input_adapter(config, root_dir, src.count)
+    model = load_segmentation_model(model_path, config['training'], num_channels, 'cpu')
+
+    tile_size = inf_cfg['window_size']
+    seed = exp_cfg.get('seed', 0)
+    # Tracing needs a single example tile; calibration tiles are streamed only for static int8
+    sample = next(iter_calibration_tiles(raster_path, 1, tile_size, seed, band_transform))[None]
+    manifest = {"source": str(model_path), "num_channels": num_channels, "tile_size": tile_size}
+
+    formats = exp_cfg.get('formats', ['torchscript', 'onnx'])
+    if 'torchscript' in formats:
+        path = root_dir / exp_cfg['torchscript_path']
+        export_torchscript(model, sample, path)
+        manifest['torchscript'] = str(path)
+        print(f"TorchScript model saved to: {path}")
+
+    if 'onnx' in formats or exp_cfg.get('quantization'):
+        path = root_dir / exp_cfg['onnx_path']
+        export_onnx(model, sample, path, opset=exp_cfg.get('opset', 17))
+        manifest['onnx'] = str(path)
+        print(f"ONNX model saved to: {path}")
+
+        if exp_cfg.get('quantization'):
+            int8_path = root_dir / exp_cfg['onnx_int8_path']
+            tiles = None
+            if exp_cfg['quantization'] == 'static':
+                tiles = iter_calibration_tiles(raster_path, exp_cfg.get('calibration_tiles', 32), tile_size,
+                                               seed, band_transform)
+            quantize_onnx(path, int8_path, mode=exp_cfg['quantization'], calibration_tiles=tiles)
+            manifest['onnx_int8'] = str(int8_path)
+            manifest['quantization'] = exp_cfg['quantization']
+            print(f"int8 ({exp_cfg['quantization']}) ONNX model saved to: {int8_path}")
+
+    with open(model_path.parent / "export_manifest.json", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    config = load_config()
+    with stage_run("export", config):
+        export_models(config)
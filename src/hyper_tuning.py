@@ -1,22 +1,187 @@
-import yaml
+import copy
+import csv
+import itertools
+import json
+import math
+import os
+import shutil
 import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import yaml
+from config import load_config
+from instrumentation import span, stage_run
+from temporal import model_input_path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+RESULT_FIELDS = ["trial", "rung", "epochs", "status", "best_val_iou", "best_epoch", "final_val_iou",
+                 "final_val_f1", "final_val_precision", "final_val_recall", "seconds", "returncode"]
+
+
+def grid_trials(search_space):
+    """One params dict per combination of the `tuning.search_space` lists."""
+    keys = sorted(search_space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(search_space[k] for k in keys))]
+
+
+def rung_budgets(min_epochs, max_epochs, eta):
+    """Epoch budget of each successive-halving rung: min_epochs * eta**k, capped at max_epochs."""
+    budgets = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        budgets.append(epochs)
+        epochs *= eta
+    budgets.append(max_epochs)
+    return budgets
+
+
+def write_trial_config(base_config, params, trial_dir, epochs):
+    """Isolated copy of the config for one trial; outputs go to trial_dir."""
+    config = copy.deepcopy(base_config)
+    config['training'].update(params)
+    config['training']['epochs'] = epochs
+    config['training']['data_pipeline'] = 'tile_store'
+    config['training']['resume'] = True
+    config['paths']['output_model_dir'] = str(trial_dir)
+    # Spans of concurrent trials must not overwrite each other (or the train_model metrics)
+    config['instrumentation'] = dict(config.get('instrumentation') or {}, output_dir=str(trial_dir))
+    config_path = trial_dir / "config.yaml"
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return config_path
+
+
+def claim_trial_dir(trial_dir, params):
+    """
+    Creates trial_dir for `params`. Trial dirs are named by grid index, so a
+    dir left by a different search_space (params.json missing or different)
+    is cleared instead of resuming its checkpoint under the new params.
+    """
+    params_path = trial_dir / "params.json"
+    if trial_dir.exists():
+        previous = json.loads(params_path.read_text()) if params_path.exists() else None
+        if previous == params:
+            return
+        print(f"  {trial_dir.name}: params changed from {previous} to {params}, discarding its old results")
+        shutil.rmtree(trial_dir)
+    trial_dir.mkdir(parents=True)
+    params_path.write_text(json.dumps(params, indent=2))
+
+
+def read_trial_metrics(trial_dir):
+    metrics_path = trial_dir / "training_metrics.json"
+    if not metrics_path.exists():
+        return None
+    with open(metrics_path, 'r') as f:
+        return json.load(f)
+
+
+def run_trial(config_path, trial_dir, threads):
+    """
+    Trains one trial in its own interpreter with BLAS/OpenMP/torch thread
+    pools capped at `threads`, logging to trial_dir/train.log.
+    Returns (returncode, seconds).
+    """
+    env = dict(os.environ)
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+        env[var] = str(threads)
+    start = time.perf_counter()
+    with open(trial_dir / "train.log", 'a') as log:
+        proc = subprocess.run([sys.executable, str(ROOT_DIR / "src" / "training.py"),
+                               "--config", str(config_path), "--resume", "--curves", ""],
+                              cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return proc.returncode, time.perf_counter() - start
+
+
+def write_results(results_path, rows, param_keys):
+    with open(results_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS[:1] + param_keys + RESULT_FIELDS[1:])
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+
+def run_search(config):
+    """
+    Successive halving over the `tuning.search_space` grid. Every live trial
+    trains to the rung's epoch budget in parallel; only the best 1/eta by
+    validation IoU is promoted and resumes from its checkpoint at the next
+    rung. Trials already trained to a rung's budget are not rerun, so an
+    interrupted search picks up where it stopped.
+    """
+    tune_cfg = config['tuning']
+    out_dir = ROOT_DIR / tune_cfg.get('output_dir', 'models/tuning')
+    out_dir.mkdir(parents=True, exist_ok=True)
+    eta = tune_cfg.get('reduction_factor', 3)
+    workers = tune_cfg.get('workers', 1)
+    threads = tune_cfg.get('threads_per_trial', max(1, (os.cpu_count() or 1) // max(workers, 1)))
+    budgets = rung_budgets(tune_cfg.get('min_epochs', 2),
+                           tune_cfg.get('max_epochs', config['training']['epochs']), eta)
+
+    # Shared read-only tile store, built once instead of once per trial
+    data_cfg = config['data']
+    label_path = data_cfg['label_aligned_tif'] if config['training'].get('label_source', 'raster') == 'raster' \
+        else data_cfg['label_geojson']
+    from tile_store import build_tile_store  # torch is only needed for this step, not for scheduling
+    with span("tile_store"):
+        build_tile_store(model_input_path(config, ROOT_DIR), ROOT_DIR / label_path.strip(),
+                         ROOT_DIR / data_cfg.get('tile_store_dir', 'data/processed/tile_store').strip())
+
+    trials = {f"trial_{i:03d}": params for i, params in enumerate(grid_trials(tune_cfg['search_space']))}
+    param_keys = sorted(tune_cfg['search_space'])
+    rows = {}
+    live = list(trials)
+    print(f"{len(trials)} trials, rungs {budgets} epochs, {workers} workers x {threads} threads")
+
+    for rung, epochs in enumerate(budgets):
+        def launch(name):
+            trial_dir = out_dir / name
+            claim_trial_dir(trial_dir, trials[name])
+            metrics = read_trial_metrics(trial_dir)
+            if metrics and metrics['epochs_completed'] >= epochs:
+                return name, 0, 0.0
+            config_path = write_trial_config(config, trials[name], trial_dir, epochs)
+            with span("trial", trial=name, rung=rung, epochs=epochs):
+                returncode, seconds = run_trial(config_path, trial_dir, threads)
+            return name, returncode, seconds
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            for name, returncode, seconds in pool.map(launch, live):
+                metrics = read_trial_metrics(out_dir / name) or {}
+                row = rows.setdefault(name, {"trial": name, **trials[name], "seconds": 0.0})
+                row.update({k: metrics.get(k) for k in RESULT_FIELDS if k in metrics and k != "seconds"})
+                row.update(rung=rung, epochs=epochs, returncode=returncode,
+                           status="failed" if returncode else "running",
+                           seconds=row["seconds"] + seconds)
+                print(f"  rung {rung} {name} {trials[name]}: IoU {row.get('best_val_iou')} "
+                      f"({seconds:.0f}s, exit {returncode})")
+
+        ranked = sorted((n for n in live if rows[n]["status"] != "failed"),
+                        key=lambda n: rows[n].get("best_val_iou") or 0.0, reverse=True)
+        keep = ranked if rung == len(budgets) - 1 else ranked[:max(1, math.ceil(len(ranked) / eta))]
+        for name in live:
+            if rows[name]["status"] != "failed":
+                rows[name]["status"] = "promoted" if name in keep else f"pruned@{epochs}"
+        live = keep
+        write_results(out_dir / "results.csv", list(rows.values()), param_keys)
+        if not live:
+            break
+
+    for name in live:
+        rows[name]["status"] = "completed"
+    write_results(out_dir / "results.csv", list(rows.values()), param_keys)
+    if live:
+        best = live[0]
+        print(f"Best trial: {best} {trials[best]} IoU {rows[best].get('best_val_iou')} "
+              f"-> {out_dir / best / 'best_model.pth'}")
+    print(f"Results table: {out_dir / 'results.csv'}")
+    return rows
+
 
-# Define the grid you want to search
-lrs = [1e-4, 5e-5, 1e-5]
-batch_sizes = [2, 4]
-
-for lr in lrs:
-    for bs in batch_sizes:
-        # 1. Update config.yaml
-        with open("config.yaml", 'r') as f:
-            conf = yaml.safe_load(f)
-        
-        conf['training']['learning_rate'] = lr
-        conf['training']['batch_size'] = bs
-        
-        with open("config.yaml", 'w') as f:
-            yaml.dump(conf, f)
-            
-        print(f"🚀 Starting Experiment: LR={lr}, BS={bs}")
-        # 2. Run the training script
-        subprocess.run(["python", "src/train.py"])
\ No newline at end of file
+if __name__ == "__main__":
+    config = load_config()
+    with stage_run("tuning", config):
+        run_search(config)
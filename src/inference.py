@@ -0,0 +1,244 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import rasterio
+import torch
+from rasterio.windows import Window
+from instrumentation import span
+from raster_utils import read_normalized, tiled_block_size
+
+_DONE = object()
+
+
+def axis_offsets(length, window_size, stride):
+    """Window starts along one axis; the last window is pulled back to end at the edge."""
+    if length <= window_size:
+        return [0]
+    offsets = list(range(0, length - window_size + 1, stride))
+    if offsets[-1] + window_size < length:
+        offsets.append(length - window_size)
+    return offsets
+
+
+def blend_weights(window_size, overlap):
+    """
+    2-D blending weights: 1 in the centre, a cosine ramp over the `overlap`
+    pixels at each edge. Strictly positive, so scene borders covered by a
+    single window keep their logits. Only the argmax of the blend is written,
+    so the weighted sum never needs dividing by the total weight.
+    """
+    ramp = np.ones(window_size, dtype='float32')
+    if overlap > 0:
+        n = min(overlap, window_size // 2)
+        edge = np.sin(0.5 * np.pi * (np.arange(n) + 0.5) / n) ** 2
+        ramp[:n] = edge
+        ramp[window_size - n:] = edge[::-1]
+    return np.outer(ramp, ramp)
+
+
+def load_segmentation_model(model_path, train_cfg, num_channels, device):
+    """Rebuilds the smp model described by the training section and loads its weights."""
+    # smp (and timm behind it) costs seconds to import; the exported backends do not need it
+    import segmentation_models_pytorch as smp
+
+    model = smp.create_model(
+        arch=train_cfg['architecture'],
+        encoder_name=train_cfg['encoder'],
+        encoder_weights=None,
+        in_channels=num_channels,
+        classes=2,  # Background + Paddy
+    )
+    state = torch.load(model_path, map_location='cpu')
+    if isinstance(state, dict) and 'model_state_dict' in state:
+        state = state['model_state_dict']
+    model.load_state_dict(state)
+    return model.to(device).eval()
+
+
+# Config (section, key) holding the model file of each inference backend
+BACKEND_PATHS = {
+    'torch': ('inference', 'model_path'),
+    'torchscript': ('export', 'torchscript_path'),
+    'onnx': ('export', 'onnx_path'),
+    'onnx_int8': ('export', 'onnx_int8_path'),
+}
+
+
+class OnnxModel:
+    """onnxruntime session with the call signature of the torch model (NCHW tensor in, logits out)."""
+
+    def __init__(self, model_path, threads=0):
+        try:
+            import onnxruntime as ort
+        except ImportError as exc:
+            raise ImportError("ONNX backends need onnxruntime: pip install onnxruntime") from exc
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, tiles):
+        logits = self.session.run(None, {'image': tiles.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def load_inference_model(backend, config, root_dir, num_channels, device='cpu'):
+    """Loads the model for `backend` ('torch', 'torchscript', 'onnx' or 'onnx_int8')."""
+    if backend not in BACKEND_PATHS:
+        raise ValueError(f"Unknown inference backend '{backend}', use one of {sorted(BACKEND_PATHS)}")
+    section, key = BACKEND_PATHS[backend]
+    model_path = root_dir / config[section][key]
+
+    if backend == 'torch':
+        return load_segmentation_model(model_path, config['training'], num_channels, device)
+    if backend == 'torchscript':
+        return torch.jit.load(str(model_path), map_location=device).eval()
+    return OnnxModel(model_path, threads=config['inference'].get('threads', 0))
+
+
+class _RowStrip:
+    """
+    Blended logits for one row of windows. Rows above the next window row
+    can no longer change, so they are flushed and the strip shifted up;
+    memory stays at (classes, window_size, scene width).
+    """
+
+    def __init__(self, classes, window_size, width):
+        self.logits = np.zeros((classes, window_size, width), dtype='float32')
+        self.row0 = 0
+
+    def add(self, row, col, logits, weights):
+        h, w = logits.shape[1:]
+        r = row - self.row0
+        self.logits[:, r:r + h, col:col + w] += logits * weights
+
+    def pop(self, until_row):
+        """Returns (row0, class map) for rows [row0, until_row) and shifts the strip."""
+        n = until_row - self.row0
+        mask = self.logits[:, :n].argmax(axis=0).astype('uint8')
+        self.logits[:, :-n] = self.logits[:, n:].copy()
+        self.logits[:, -n:] = 0
+        row0, self.row0 = self.row0, until_row
+        return row0, mask
+
+
+def predict_raster(model, input_path, output_path, window_size=512, overlap=128,
+                   batch_size=8, prefetch=2, device='cpu', block_size=512, window=None,
+                   band_transform=None):
+    """
+    Sliding-window segmentation of an arbitrarily large raster.
+
+    A reader thread cuts windows (stride = window_size - overlap) into
+    batches, the calling thread runs the model, and a writer thread blends
+    the logits into a row strip and writes finished rows of the class mask
+    to `output_path`. Queues between the stages are bounded by `prefetch`,
+    so memory depends on batch size and scene width, not scene size.
+    `window` (rasterio Window) restricts prediction to part of the input;
+    the mask then covers just that window. `band_transform` maps every
+    (C, H, W) tile read from the input to the model's channels (e.g. the
+    temporal projection) inside the reader thread.
+    Returns a dict with window count and throughput.
+    """
+    stride = max(1, window_size - overlap)
+    weights = blend_weights(window_size, overlap)
+
+    with rasterio.open(input_path) as src:
+        count = src.count
+        if band_transform is not None:
+            count = band_transform(np.zeros((count, 1, 1), dtype='float32')).shape[0]
+        if window is None:
+            window = Window(0, 0, src.width, src.height)
+        window = window.round_offsets().round_lengths().intersection(Window(0, 0, src.width, src.height))
+        width, height = window.width, window.height
+        profile = src.profile.copy()
+        profile.update(width=width, height=height, transform=src.window_transform(window))
+    col0, row0 = window.col_off, window.row_off
+    rows = axis_offsets(height, window_size, stride)
+    cols = axis_offsets(width, window_size, stride)
+
+    block = tiled_block_size(block_size)
+    profile.update(driver='GTiff', count=1, dtype='uint8', nodata=None, compress='lzw',
+                   tiled=True, blockxsize=block, blockysize=block, BIGTIFF='IF_SAFER')
+    profile.pop('photometric', None)
+    profile.pop('interleave', None)
+
+    read_q = queue.Queue(maxsize=prefetch)
+    write_q = queue.Queue(maxsize=prefetch)
+    errors = []
+
+    def reader():
+        try:
+            with rasterio.open(input_path) as src:
+                batch = []
+                for row in rows:
+                    for col in cols:
+                        tile_window = Window(col, row, min(window_size, width - col), min(window_size, height - row))
+                        data = read_normalized(src, Window(col0 + col, row0 + row,
+                                                           tile_window.width, tile_window.height))
+                        if band_transform is not None:
+                            data = band_transform(data)
+                        tile = np.zeros((count, window_size, window_size), dtype='float32')
+                        tile[:, :tile_window.height, :tile_window.width] = data
+                        batch.append((tile_window, tile))
+                        if len(batch) == batch_size:
+                            read_q.put(batch)
+                            batch = []
+                if batch:
+                    read_q.put(batch)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            read_q.put(_DONE)
+
+    def writer():
+        try:
+            strip = _RowStrip(2, window_size, width)
+            next_rows = dict(zip(rows, rows[1:] + [height]))
+            last_col = cols[-1]
+            with rasterio.open(output_path, 'w', **profile) as dst:
+                while (item := write_q.get()) is not _DONE:
+                    for window, logits in item:
+                        h, w = window.height, window.width
+                        strip.add(window.row_off, window.col_off, logits[:, :h, :w], weights[:h, :w])
+                        if window.col_off == last_col:
+                            # Row of windows complete: everything above the next row is final
+                            row0, mask = strip.pop(next_rows[window.row_off])
+                            dst.write(mask, 1, window=Window(0, row0, width, mask.shape[0]))
+        except Exception as exc:
+            errors.append(exc)
+            # Keep draining so the compute stage never blocks on a dead writer
+            while write_q.get() is not _DONE:
+                pass
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for t in threads:
+        t.start()
+
+    n_windows = 0
+    start = time.perf_counter()
+    try:
+        with torch.inference_mode():
+            while (batch := read_q.get()) is not _DONE:
+                with span("batch", tiles=len(batch)):
+                    tiles = torch.from_numpy(np.stack([tile for _, tile in batch])).to(device)
+                    logits = model(tiles).float().cpu().numpy()
+                write_q.put([(window, l) for (window, _), l in zip(batch, logits)])
+                n_windows += len(batch)
+    except BaseException:
+        # Unblock the reader before joining it
+        while read_q.get() is not _DONE:
+            pass
+        raise
+    finally:
+        write_q.put(_DONE)
+        for t in threads:
+            t.join()
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - start
+    return {"windows": n_windows, "seconds": elapsed,
+            "windows_per_sec": n_windows / elapsed if elapsed else 0.0}
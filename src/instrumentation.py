@@ -0,0 +1,264 @@
+"""
+Span timings and resource counters shared by the pipeline stages.
+
+    with stage_run("preprocessing"):          # once per `python src/<stage>.py`
+        with span("stack"):
+            with span("window", index=i):
+                ...
+
+Every span is appended to <output_dir>/<stage>.jsonl with its wall and CPU
+time, current and peak RSS, bytes read/written by the process (/proc/self/io)
+and the GDAL block cache usage. <output_dir>/<stage>.json summarizes the run
+per span name and is declared as DVC metrics. Outside a stage_run, span() is
+a no-op, so library code can be instrumented unconditionally.
+
+With `instrumentation.profile` set to a stage name (or "all"), that stage
+also runs under cProfile: <stage>.prof for snakeviz/pstats and the hottest
+functions in <stage>.profile.txt.
+"""
+import cProfile
+import ctypes
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import load_config
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, peak RSS is not recorded
+    resource = None
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+MB = 2 ** 20
+
+_active = None
+_local = threading.local()
+_gdal_lib = False  # False = not looked up yet, None = unavailable
+
+
+def _io_counters():
+    """
+    (rchar, wchar, read_bytes, write_bytes) of this process. rchar/wchar
+    count every read/write call, read_bytes/write_bytes only what reached the
+    block device, so their ratio approximates the page cache hit rate.
+    """
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(':') for line in f.read().splitlines())
+        return tuple(int(fields[k]) for k in ('rchar', 'wchar', 'read_bytes', 'write_bytes'))
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except (OSError, IndexError, ValueError, AttributeError):
+        return None
+
+
+def process_age():
+    """
+    Seconds since this process started, interpreter startup included (from
+    /proc/self/stat); None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # Fields after the parenthesized command name; starttime is field 22
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, IndexError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb(children=False):
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    return usage.ru_maxrss / 1024.0  # kilobytes on Linux
+
+
+def _gdal_cache_mb():
+    """
+    (used, max) of the GDAL block cache in MB, read from the libgdal that
+    rasterio loaded; None when it cannot be located. GDAL keeps no hit/miss
+    counters, so hit rates are not available for this cache.
+    """
+    global _gdal_lib
+    if _gdal_lib is False and 'rasterio' in sys.modules:
+        # Looked up once rasterio (and with it libgdal) has been imported
+        _gdal_lib = None
+        try:
+            with open('/proc/self/maps', 'r') as f:
+                paths = {line.split()[-1] for line in f if 'libgdal' in line}
+            for path in paths:
+                lib = ctypes.CDLL(path)
+                lib.GDALGetCacheUsed64.restype = ctypes.c_int64
+                lib.GDALGetCacheMax64.restype = ctypes.c_int64
+                _gdal_lib = lib
+                break
+        except (OSError, AttributeError):
+            _gdal_lib = None
+    if not _gdal_lib:
+        return None
+    return _gdal_lib.GDALGetCacheUsed64() / MB, _gdal_lib.GDALGetCacheMax64() / MB
+
+
+def _snapshot():
+    return {'time': time.perf_counter(), 'cpu': time.process_time(), 'io': _io_counters()}
+
+
+class _StageRun:
+    """Open JSONL sink plus per-span-name totals of one stage."""
+
+    def __init__(self, name, output_dir):
+        self.name = name
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.sink = open(self.output_dir / f"{name}.jsonl", 'w')
+        self.totals = defaultdict(lambda: defaultdict(float))
+        self.start = _snapshot()
+
+    def record(self, name, attrs, depth, begin, end):
+        entry = {
+            'span': name,
+            **attrs,
+            'depth': depth,
+            'start_s': round(begin['time'] - self.start['time'], 6),
+            'seconds': end['time'] - begin['time'],
+            'cpu_seconds': end['cpu'] - begin['cpu'],
+            'rss_mb': _rss_mb(),
+            'peak_rss_mb': _peak_rss_mb(),
+        }
+        if begin['io'] and end['io']:
+            deltas = [(b - a) / MB for a, b in zip(begin['io'], end['io'])]
+            entry.update(read_mb=deltas[0], write_mb=deltas[1], disk_read_mb=deltas[2], disk_write_mb=deltas[3])
+        cache = _gdal_cache_mb()
+        if cache:
+            entry['gdal_cache_used_mb'] = cache[0]
+
+        with self.lock:
+            self.sink.write(json.dumps(entry) + "\n")
+            totals = self.totals[name]
+            totals['count'] += 1
+            for key in ('seconds', 'cpu_seconds', 'read_mb', 'write_mb', 'disk_read_mb', 'disk_write_mb'):
+                totals[key] += entry.get(key, 0.0)
+            totals['max_seconds'] = max(totals['max_seconds'], entry['seconds'])
+
+    def summary(self):
+        end = _snapshot()
+        report = {
+            'stage': self.name,
+            'seconds': end['time'] - self.start['time'],
+            'cpu_seconds': end['cpu'] - self.start['cpu'],
+            'peak_rss_mb': _peak_rss_mb(),
+            # Worker processes (pools, subprocesses) are only visible through this
+            'children_peak_rss_mb': _peak_rss_mb(children=True),
+        }
+        if self.start['io'] and end['io']:
+            read, write, disk_read, disk_write = [(b - a) / MB for a, b in zip(self.start['io'], end['io'])]
+            report.update(read_mb=read, write_mb=write, disk_read_mb=disk_read, disk_write_mb=disk_write,
+                          page_cache_hit_rate=max(0.0, 1.0 - disk_read / read) if read else None)
+        else:
+            report['io'] = "unavailable (/proc/self/io not readable)"
+        cache = _gdal_cache_mb()
+        if cache:
+            # No gdal_cache_hit_rate: GDAL has no hit/miss counters (see _gdal_cache_mb)
+            report.update(gdal_cache_used_mb=cache[0], gdal_cache_max_mb=cache[1])
+        else:
+            report['gdal_cache'] = "unavailable (libgdal not loaded)"
+        report['spans'] = {name: dict(totals) for name, totals in self.totals.items()}
+        return report
+
+
+def _instrumentation_config(config):
+    if config is None and not (ROOT_DIR / "config.yaml").exists():
+        return {}
+    return load_config(config).get('instrumentation') or {}
+
+
+@contextmanager
+def stage_run(name, config=None, startup=None):
+    """
+    Activates instrumentation for one pipeline stage (config defaults to the
+    project config.yaml). Writes <stage>.jsonl and the <stage>.json summary
+    when the block exits, even on failure. The summary's startup_seconds is
+    the time from process start to here (interpreter, imports, config);
+    `startup` adds a breakdown of it (see paddy.py).
+    """
+    global _active
+    startup_seconds = process_age()
+    inst_cfg = _instrumentation_config(config)
+    if not inst_cfg.get('enabled', True) or _active is not None:
+        yield
+        return
+
+    run = _StageRun(name, ROOT_DIR / inst_cfg.get('output_dir', 'plots/instrumentation'))
+    profile_target = inst_cfg.get('profile')
+    profiler = cProfile.Profile() if profile_target in (name, 'all') else None
+    _active = run
+    failed = False
+    try:
+        if profiler is not None:
+            profiler.enable()
+        with span(name):
+            yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _active = None
+        run.sink.close()
+
+        report = run.summary()
+        report['startup_seconds'] = startup_seconds
+        if startup:
+            report['startup'] = startup
+        report['status'] = "failed" if failed else "ok"
+        with open(run.output_dir / f"{name}.json", 'w') as f:
+            json.dump(report, f, indent=2)
+
+        if profiler is not None:
+            # Only the main thread is profiled; pool workers show up as waits
+            profiler.dump_stats(str(run.output_dir / f"{name}.prof"))
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(inst_cfg.get('profile_top', 30))
+            (run.output_dir / f"{name}.profile.txt").write_text(text.getvalue())
+        peak = f", peak RSS {report['peak_rss_mb']:.0f} MB" if report['peak_rss_mb'] is not None else ""
+        print(f"Stage '{name}': {report['seconds']:.1f}s{peak} -> {run.output_dir / (name + '.json')}")
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times the enclosed block as `name` (attrs such as date=, band= or tile=
+    are stored with it). I/O counters are process-wide, so spans running
+    concurrently in threads share each other's bytes.
+    """
+    run = _active
+    if run is None:
+        yield
+        return
+
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    begin = _snapshot()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        run.record(name, attrs, depth, begin, _snapshot())
@@ -1,21 +1,25 @@
 import os
-import yaml
+import sys
 import glob
 import numpy as np
 import rasterio
-import geopandas as gpd
+from affine import Affine
+from contextlib import ExitStack
 from pathlib import Path
+from rasterio.enums import Resampling
 from rasterio.merge import merge
-from rasterio.features import shapes
-from shapely.geometry import shape
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import bounds as window_bounds
+from config import load_config
+from instrumentation import span, stage_run
+from polygonize import polygonize_to_file
+from raster_utils import iter_windows, tiled_block_size
 
 
-def process_labels():
+def process_labels(config=None):
     # 1. Setup Paths
     ROOT_DIR = Path(__file__).resolve().parent.parent
-    CONFIG_PATH = ROOT_DIR / "config.yaml"
-    with open(CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_config(config)
 
     label_dir = ROOT_DIR / config['data']['label_src_dir']
     merged_path = ROOT_DIR / config['data']['label_merged_tif']
@@ -25,64 +29,116 @@ def process_labels():
     # Ensure output directories exist
     merged_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 2. Merge tiles if necessary
+    # 2. Output grid, as rasterio.merge.merge would build it
     tile_files = glob.glob(str(label_dir / "*.tif"))
     if not tile_files:
         print(f"No label tiles found in {label_dir}")
         return
 
-    if len(tile_files) > 1:
-        print(f"Merging {len(tile_files)} tiles...")
-        src_files_to_mosaic = [rasterio.open(f) for f in tile_files]
-        mosaic, transform = merge(src_files_to_mosaic)
-
-        meta = src_files_to_mosaic[0].meta.copy()
-        meta.update({
-            "height": mosaic.shape[1],
-            "width": mosaic.shape[2],
-            "transform": transform
-        })
-
-        with rasterio.open(merged_path, "w", **meta) as dst:
-            dst.write(mosaic)
-        for src in src_files_to_mosaic: src.close()
-        current_label_source = merged_path
-    else:
-        print("Single tile detected, skipping merge.")
-        current_label_source = tile_files[0]
-
-    # 3. Convert to Binary Class
-    print(f"Converting {current_label_source} to binary...")
-    with rasterio.open(current_label_source) as src:
-        data = src.read(1)
-        meta = src.meta.copy()
-        nodata = src.nodata
-
-    # Create binary mask (Class 3 = 1, others = 0)
-    binary = np.zeros_like(data, dtype=np.uint8)
-    binary[data == 3] = 1
-
-    if nodata is not None:
-        binary[data == nodata] = 0  # Ensure nodata is clean
-
-    meta.update(dtype="uint8", count=1, nodata=0)
-    with rasterio.open(binary_path, "w", **meta) as dst:
-        dst.write(binary, 1)
-
-    # 4. Export to GeoJSON
-    print("Vectorizing binary mask to GeoJSON...")
-    with rasterio.open(binary_path) as src:
-        image = src.read(1)
-        mask = (image == 1)
-        results = (
-            {'properties': {'class': 1}, 'geometry': s}
-            for i, (s, v) in enumerate(shapes(image, mask=mask, transform=src.transform))
-        )
-        gdf = gpd.GeoDataFrame.from_features(list(results), crs=src.crs)
-        gdf.to_file(geojson_path, driver="GeoJSON")
-
-    print(f"Labeling complete. GeoJSON saved at: {geojson_path}")
+    labels_cfg = config.get('labels') or {}
+    block_size = tiled_block_size(labels_cfg.get('block_size', 1024))
+    write_merged = labels_cfg.get('write_merged', False)
+
+    sources = [rasterio.open(f) for f in tile_files]
+    first = sources[0]
+    res = first.res
+    nodata = first.nodata
+    left = min(src.bounds.left for src in sources)
+    bottom = min(src.bounds.bottom for src in sources)
+    right = max(src.bounds.right for src in sources)
+    top = max(src.bounds.top for src in sources)
+    width = int(round((right - left) / res[0]))
+    height = int(round((top - bottom) / res[1]))
+    transform = Affine.translation(left, top) * Affine.scale(res[0], -res[1])
+
+    meta = first.meta.copy()
+    meta.update(height=height, width=width, transform=transform,
+                tiled=True, blockxsize=block_size, blockysize=block_size)
+    binary_meta = meta.copy()
+    binary_meta.update(dtype="uint8", count=1, nodata=0, compress='lzw')
+
+    # 3. Mosaic block by block and convert each block to binary before writing
+    print(f"Mosaicking {len(sources)} tile(s) into {width}x{height} binary label blocks...")
+    with ExitStack() as stack:
+        binary_dst = stack.enter_context(rasterio.open(binary_path, "w", **binary_meta))
+        merged_dst = stack.enter_context(rasterio.open(merged_path, "w", **meta)) if write_merged else None
+
+        for window in iter_windows(width, height, block_size):
+            block_bounds = window_bounds(window, transform)
+            overlapping = [src for src in sources
+                           if src.bounds.left < block_bounds[2] and src.bounds.right > block_bounds[0]
+                           and src.bounds.bottom < block_bounds[3] and src.bounds.top > block_bounds[1]]
+
+            mosaic = np.full((first.count, window.height, window.width),
+                             nodata if nodata is not None else 0, dtype=first.dtypes[0])
+            if overlapping:
+                merged, _ = merge(overlapping, bounds=block_bounds, res=res, nodata=nodata)
+                h, w = min(merged.shape[1], window.height), min(merged.shape[2], window.width)
+                mosaic[:, :h, :w] = merged[:, :h, :w]
+
+            data = mosaic[0]
+            # Create binary mask (Class 3 = 1, others = 0)
+            binary = np.zeros_like(data, dtype=np.uint8)
+            binary[data == 3] = 1
+
+            if nodata is not None:
+                binary[data == nodata] = 0  # Ensure nodata is clean
+
+            binary_dst.write(binary, 1, window=window)
+            if merged_dst is not None:
+                merged_dst.write(mosaic, window=window)
+
+    for src in sources: src.close()
+
+    # 4. Export to vector (tiled, parallel polygonization; format from the file suffix)
+    print(f"Vectorizing binary mask to {geojson_path.suffix} ...")
+    with span("vectorize"):
+        n_polygons = polygonize_to_file(binary_path, geojson_path, config.get('polygonize'), value=1)
+
+    print(f"Labeling complete. {n_polygons} polygons saved at: {geojson_path}")
+
+
+def align_labels_to_stack(config=None):
+    """
+    Reprojects the binary label raster once onto the exact grid of the
+    normalized stack (CRS, transform and size), so training can slice label
+    windows with the same offsets as image windows.
+    """
+    # 1. Setup Paths
+    ROOT_DIR = Path(__file__).resolve().parent.parent
+    config = load_config(config)
+
+    binary_path = ROOT_DIR / config['data']['label_binary_tif']
+    stack_path = ROOT_DIR / config['data']['norm_output'].strip()
+    aligned_path = ROOT_DIR / config['data']['label_aligned_tif']
+    block_size = tiled_block_size((config.get('labels') or {}).get('block_size', 1024))
+    aligned_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with rasterio.open(stack_path) as grid:
+        crs, transform, width, height = grid.crs, grid.transform, grid.width, grid.height
+
+    meta = dict(driver='GTiff', dtype='uint8', count=1, nodata=0, compress='lzw',
+                crs=crs, transform=transform, width=width, height=height,
+                tiled=True, blockxsize=block_size, blockysize=block_size)
+
+    # 2. Nearest-neighbour warp, read block by block on the stack grid
+    print(f"Aligning {binary_path.name} to the {width}x{height} grid of {stack_path.name}...")
+    with rasterio.open(binary_path) as src, \
+            WarpedVRT(src, crs=crs, transform=transform, width=width, height=height,
+                      resampling=Resampling.nearest, nodata=0) as vrt, \
+            rasterio.open(aligned_path, "w", **meta) as dst:
+        for window in iter_windows(width, height, block_size):
+            dst.write(vrt.read(1, window=window), 1, window=window)
+
+    print(f"Aligned label saved at: {aligned_path}")
 
 
 if __name__ == "__main__":
-    process_labels()
\ No newline at end of file
+    # `python src/labeling.py align` runs only the grid alignment (needs norm_output)
+    config = load_config()
+    if sys.argv[1:] == ["align"]:
+        with stage_run("align_labels", config):
+            align_labels_to_stack(config)
+    else:
+        with stage_run("prepare_labels", config):
+            process_labels(config)
\ No newline at end of file
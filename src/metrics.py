@@ -0,0 +1,156 @@
+import json
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from config import load_config
+from instrumentation import stage_run
+from raster_utils import iter_windows, make_executor
+
+
+def segmentation_scores(confusion):
+    """IoU, F1, precision and recall of the paddy class from a 2x2 [true, pred] matrix."""
+    tp = float(confusion[1, 1])
+    fp = float(confusion[0, 1])
+    fn = float(confusion[1, 0])
+    iou = tp / (tp + fp + fn) if tp + fp + fn else 0.0
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return iou, f1, precision, recall
+
+
+def _confusion_windows(gt_path, pred_path, windows):
+    """
+    Worker task: 2x2 [true, pred] confusion matrix over a chunk of windows.
+    Pixels whose label or prediction is not 0/1 (nodata) are ignored. A
+    prediction on another grid is warped (nearest) onto the label grid, with
+    pixels it does not cover set to 255.
+    """
+    confusion = np.zeros(4, dtype=np.int64)
+    with ExitStack() as stack:
+        gt = stack.enter_context(rasterio.open(gt_path))
+        pred = stack.enter_context(rasterio.open(pred_path))
+        if (pred.width, pred.height) != (gt.width, gt.height) or not pred.transform.almost_equals(gt.transform):
+            pred = stack.enter_context(WarpedVRT(pred, crs=gt.crs, transform=gt.transform, width=gt.width,
+                                                 height=gt.height, resampling=Resampling.nearest,
+                                                 nodata=255))
+        for window in windows:
+            y_true = gt.read(1, window=window)
+            y_pred = pred.read(1, window=window)
+            valid = (y_true <= 1) & (y_pred <= 1)
+            codes = y_true[valid].astype(np.int64) * 2 + y_pred[valid]
+            confusion += np.bincount(codes, minlength=4)
+    return confusion
+
+
+def scene_confusion_tasks(gt_path, pred_path, block_size=1024, chunks=1):
+    """Splits one scene into `chunks` callables, each returning a partial confusion matrix."""
+    with rasterio.open(gt_path) as src:
+        windows = list(iter_windows(src.width, src.height, block_size))
+    chunks = max(1, min(chunks, len(windows)))
+    return [partial(_confusion_windows, str(gt_path), str(pred_path), windows[i::chunks])
+            for i in range(chunks)]
+
+
+def _call(task):
+    return task()
+
+
+def evaluate_scenes(scenes, block_size=1024, workers=0, executor='process'):
+    """
+    Confusion matrices for several (name, ground truth, prediction) scenes.
+    Every scene is cut into chunks of windows and all chunks of all scenes
+    share one pool, so large and small scenes are scored concurrently.
+    Returns ({name: 2x2 matrix}, aggregate 2x2 matrix).
+    """
+    chunks = max(1, workers * 2)
+    tasks = [(name, task) for name, gt_path, pred_path in scenes
+             for task in scene_confusion_tasks(gt_path, pred_path, block_size, chunks)]
+
+    pool = make_executor(executor, workers)
+    if pool is None:
+        results = map(_call, (task for _, task in tasks))
+    else:
+        results = pool.map(_call, [task for _, task in tasks])
+
+    per_scene = {name: np.zeros(4, dtype=np.int64) for name, _, _ in scenes}
+    for (name, _), confusion in zip(tasks, results):
+        per_scene[name] += confusion
+    if pool is not None:
+        pool.shutdown()
+
+    per_scene = {name: confusion.reshape(2, 2) for name, confusion in per_scene.items()}
+    total = sum(per_scene.values(), np.zeros((2, 2), dtype=np.int64))
+    return per_scene, total
+
+
+def metrics_dict(confusion):
+    iou, f1, precision, recall = segmentation_scores(confusion)
+    pixels = int(confusion.sum())
+    return {
+        "iou": iou,
+        "f1": f1,
+        "precision": precision,
+        "recall": recall,
+        "accuracy": float(np.trace(confusion) / pixels) if pixels else 0.0,
+        "pixels": pixels,
+        "confusion_matrix": confusion.tolist(),
+    }
+
+
+def write_metrics_json(json_path, per_scene, total):
+    """
+    Per-scene and aggregate paddy-class metrics, in a layout `dvc metrics show`
+    reads. Scores only, no run timestamp, so identical scores give an identical file.
+    """
+    json_path = Path(json_path)
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "aggregate": metrics_dict(total),
+        "scenes": {name: metrics_dict(confusion) for name, confusion in per_scene.items()},
+    }
+    with open(json_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def evaluation_scenes(config, root_dir):
+    """(name, ground truth, prediction) triples from evaluation.scenes, or the default scene."""
+    scenes = (config.get('evaluation') or {}).get('scenes')
+    if not scenes:
+        scenes = [{"name": "default",
+                   "ground_truth": config['data']['label_aligned_tif'],
+                   "prediction": config['inference']['output_mask_path']}]
+    return [(scene.get('name') or Path(scene['prediction']).stem,
+             root_dir / scene['ground_truth'], root_dir / scene['prediction'])
+            for scene in scenes]
+
+
+def run_evaluation(config):
+    root_dir = Path(__file__).resolve().parent.parent
+    eval_cfg = config.get('evaluation') or {}
+    scenes = evaluation_scenes(config, root_dir)
+
+    per_scene, total = evaluate_scenes(scenes,
+                                       block_size=eval_cfg.get('block_size', 1024),
+                                       workers=eval_cfg.get('workers', 0),
+                                       executor=eval_cfg.get('executor', 'process'))
+    metrics_path = root_dir / eval_cfg.get('metrics_path', 'plots/metrics.json')
+    report = write_metrics_json(metrics_path, per_scene, total)
+
+    for name, scores in list(report['scenes'].items()) + [("aggregate", report['aggregate'])]:
+        print(f"{name:>16}: IoU {scores['iou']:.4f}  F1 {scores['f1']:.4f}  "
+              f"precision {scores['precision']:.4f}  recall {scores['recall']:.4f}")
+    print(f"📊 Metrics saved to: {metrics_path}")
+    return report
+
+
+if __name__ == "__main__":
+    config = load_config()
+    with stage_run("evaluate", config):
+        run_evaluation(config)
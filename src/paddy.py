@@ -0,0 +1,101 @@
+"""
+Single entry point for the pipeline stages.
+
+    python src/paddy.py preprocessing
+    python src/paddy.py train_model --resume
+    python src/paddy.py test --config models/tuning/trial_003/config.yaml
+    python src/paddy.py --check train_model       # validate + import only, report startup
+    PYTHONPATH=src python -m paddy statistics
+
+Stage names match the DVC stages. config.yaml is parsed and validated once
+(config.load_config) before anything heavy is imported, so a typo fails in
+milliseconds; the stage module, and with it torch, geopandas or pyroSAR, is
+imported only for the stage that runs, and the heavier libraries only inside
+the functions that need them. The startup cost (interpreter, config, stage
+imports) is printed and written to the stage's instrumentation summary.
+"""
+import argparse
+import importlib
+import json
+import sys
+import time
+
+from config import ConfigError, load_config
+from instrumentation import process_age, stage_run
+
+# stage -> (module, function taking the config); the instrumentation stage has the same name
+STAGES = {
+    'crop_sar': ('data_extraction', 'run_crop_sar'),
+    'preprocessing': ('preprocessing', 'run_preprocessing'),
+    'stack': ('preprocessing', 'stack_sar_timeseries'),
+    'statistics': ('preprocessing', 'generate_stack_statistics'),
+    'normalize': ('preprocessing', 'normalize_sar_stack'),
+    'temporal_features': ('temporal', 'compress_temporal_stack'),
+    'prepare_labels': ('labeling', 'process_labels'),
+    'align_labels': ('labeling', 'align_labels_to_stack'),
+    'train_model': ('training', 'run_train_model'),
+    'tuning': ('hyper_tuning', 'run_search'),
+    'test': ('testing', 'run_test'),
+    'evaluate': ('metrics', 'run_evaluation'),
+    'export': ('export_model', 'export_models'),
+    'serve': ('serve', 'run_server'),
+}
+# Long-running stages without a stage summary
+UNINSTRUMENTED = {'serve'}
+
+
+def _add_common_arguments(parser):
+    parser.add_argument("--config", help="Config file (default: config.yaml in the project root)")
+    parser.add_argument("--check", action="store_true",
+                        help="Validate the config and import the stage, print the startup times as JSON, do not run")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="paddy", description="Run one stage of the paddy segmentation pipeline.")
+    _add_common_arguments(parser)
+    # Accepted after the stage name too; SUPPRESS keeps a value given before it
+    common = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    _add_common_arguments(common)
+    stages = parser.add_subparsers(dest="stage", required=True, metavar="stage")
+    for name, (module, function) in STAGES.items():
+        stage = stages.add_parser(name, parents=[common], help=f"{module}.{function}")
+        if name == 'train_model':
+            stage.add_argument("--resume", action="store_true", help="Continue from last_checkpoint.pth")
+            stage.add_argument("--curves", default="plots/learning_curves.png",
+                               help="Learning curve plot ('' to skip)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    module_name, function_name = STAGES[args.stage]
+
+    start = time.perf_counter()
+    try:
+        config = load_config(args.config)
+    except (ConfigError, OSError) as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    config_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    function = getattr(importlib.import_module(module_name), function_name)
+    startup = {'config_seconds': config_s, 'import_seconds': time.perf_counter() - start,
+               'process_seconds': process_age()}
+    if args.check:
+        print(json.dumps({'stage': args.stage, **startup}))
+        return 0
+    total = f", {startup['process_seconds']:.2f}s since process start" if startup['process_seconds'] else ""
+    print(f"Stage '{args.stage}' startup: config {config_s:.3f}s, imports {startup['import_seconds']:.2f}s{total}")
+
+    kwargs = {'resume': args.resume, 'curves': args.curves} if args.stage == 'train_model' else {}
+    if args.stage in UNINSTRUMENTED:
+        function(config, **kwargs)
+    else:
+        with stage_run(args.stage, config, startup=startup):
+            function(config, **kwargs)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import shapely
+from affine import Affine
+from rasterio.features import shapes
+from shapely.geometry import shape
+from raster_utils import iter_windows, make_executor
+
+# Output driver by file suffix
+VECTOR_DRIVERS = {".geojson": "GeoJSON", ".json": "GeoJSON", ".fgb": "FlatGeobuf",
+                  ".parquet": "GeoParquet", ".geoparquet": "GeoParquet"}
+
+
+def _polygonize_tile(raster_path, window, value):
+    """
+    Worker task: polygonizes one window in pixel coordinates of the full
+    raster. Integer vertices let neighbouring tiles share edges exactly.
+    Returns (interior, border) lists of WKB geometries; border polygons touch
+    an edge shared with another tile and have to be stitched.
+    """
+    with rasterio.open(raster_path) as src:
+        image = src.read(1, window=window)
+        at_right = window.col_off + window.width >= src.width
+        at_bottom = window.row_off + window.height >= src.height
+    at_left, at_top = window.col_off == 0, window.row_off == 0
+
+    mask = image == value
+    if not mask.any():
+        return [], []
+
+    x0, y0 = window.col_off, window.row_off
+    x1, y1 = x0 + window.width, y0 + window.height
+    pixel_transform = Affine.translation(x0, y0)
+
+    interior, border = [], []
+    for geom, _ in shapes(image, mask=mask, transform=pixel_transform):
+        poly = shape(geom)
+        minx, miny, maxx, maxy = poly.bounds
+        touches = ((not at_left and minx <= x0) or (not at_right and maxx >= x1)
+                   or (not at_top and miny <= y0) or (not at_bottom and maxy >= y1))
+        (border if touches else interior).append(shapely.to_wkb(poly))
+    return interior, border
+
+
+def polygonize_raster(raster_path, value=1, tile_size=2048, workers=0, simplify_tolerance=0):
+    """
+    Vectorizes the pixels equal to `value` tile by tile across a process pool.
+    Polygons cut by tile edges are dissolved back together, so the result
+    matches a single full-raster `rasterio.features.shapes` pass.
+    Returns (list of shapely polygons, crs).
+    """
+    with rasterio.open(raster_path) as src:
+        crs = src.crs
+        transform = src.transform
+        windows = list(iter_windows(src.width, src.height, tile_size))
+
+    task = partial(_polygonize_tile, str(raster_path), value=value)
+    pool = make_executor('process', workers)
+    if pool is None:
+        results = map(task, windows)
+    else:
+        results = pool.map(task, windows)
+
+    interior, border = [], []
+    for tile_interior, tile_border in results:
+        interior += tile_interior
+        border += tile_border
+    if pool is not None:
+        pool.shutdown()
+
+    geoms = list(shapely.from_wkb(interior))
+    if border:
+        stitched = shapely.union_all(shapely.from_wkb(border))
+        geoms += list(shapely.get_parts(stitched))
+
+    # Pixel grid -> map coordinates
+    a, b, c, d, e, f = transform[:6]
+    geoms = list(shapely.transform(
+        geoms, lambda xy: np.column_stack([a * xy[:, 0] + b * xy[:, 1] + c,
+                                           d * xy[:, 0] + e * xy[:, 1] + f])))
+
+    if simplify_tolerance:
+        geoms = list(shapely.simplify(geoms, simplify_tolerance, preserve_topology=True))
+    return geoms, crs
+
+
+def write_polygons(geoms, crs, out_path, value=1):
+    """Writes polygons with a `class` column; the format follows the file suffix."""
+    out_path = Path(out_path)
+    driver = VECTOR_DRIVERS.get(out_path.suffix.lower())
+    if driver is None:
+        raise ValueError(f"Unsupported vector format '{out_path.suffix}', use one of {sorted(VECTOR_DRIVERS)}")
+
+    import geopandas as gpd  # pandas + pyogrio are only needed by the writer
+
+    gdf = gpd.GeoDataFrame({'class': [value] * len(geoms)}, geometry=geoms, crs=crs)
+    if driver == "GeoParquet":
+        gdf.to_parquet(out_path)
+    else:
+        gdf.to_file(out_path, driver=driver)
+    return out_path
+
+
+def polygonize_to_file(raster_path, out_path, poly_cfg=None, value=1):
+    """polygonize_raster + write_polygons driven by the `polygonize` config section."""
+    poly_cfg = poly_cfg or {}
+    geoms, crs = polygonize_raster(raster_path, value=value,
+                                   tile_size=poly_cfg.get('tile_size', 2048),
+                                   workers=poly_cfg.get('workers', 0),
+                                   simplify_tolerance=poly_cfg.get('simplify_tolerance', 0))
+    write_polygons(geoms, crs, out_path, value=value)
+    return len(geoms)
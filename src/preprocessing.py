@@ -1,24 +1,199 @@
 import os
 import glob
 import re
-import yaml
 import rasterio
 from pathlib import Path
 from collections import defaultdict
+import threading
+from functools import partial
 import numpy as np
+from config import load_config
+from instrumentation import span, stage_run
+from raster_utils import (QUANTIZED_MAX_CODE, iter_windows, layout_writer, list_zip_rasters, make_executor,
+                          output_block_size, quantization_params, quantize_normalized, write_band_vrt)
+from stack_stats import (compute_statistics, load_statistics_json, raster_opener,
+                         write_statistics_json, write_statistics_log)
+
+
+def group_sar_dates(input_dir):
+    """Groups the VV/VH rasters in input_dir by acquisition date (YYYYMMDD)."""
+    # Rasters may also sit inside zip archives; those are read via /vsizip/
+    candidates = [(f_path.name, str(f_path)) for f_path in Path(input_dir).glob("*.tif")]
+    for zip_path in Path(input_dir).glob("*.zip"):
+        candidates += [(member.split("/")[-1], vsi_path) for member, vsi_path in list_zip_rasters(zip_path)]
+    date_map = defaultdict(dict)
+
+    for filename, f_path in candidates:
+        # Regex to find YYYYMMDD
+        match = re.search(r'\d{8}', filename)
+        if not match:
+            continue
+
+        date = match.group(0)
+        if "_VV_" in filename:
+            date_map[date]['vv'] = f_path
+        elif "_VH_" in filename:
+            date_map[date]['vh'] = f_path
+
+    return date_map, sorted(date_map.keys())
+
+
+# Per-thread (and therefore per-worker-process) cache of open datasets, so a
+# worker decodes many windows of the same date without reopening the files
+_local_sources = threading.local()
 
 
-def stack_sar_timeseries():
+def _cached_open(path):
+    sources = getattr(_local_sources, 'sources', None)
+    if sources is None:
+        sources = _local_sources.sources = {}
+    if path not in sources:
+        # Skip GDAL's sibling-file scan, which is costly inside /vsizip/ archives
+        with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN='EMPTY_DIR'):
+            sources[path] = rasterio.open(path)
+    return sources[path]
+
+
+def _close_cached_sources():
+    for src in getattr(_local_sources, 'sources', {}).values():
+        src.close()
+    _local_sources.sources = {}
+
+
+def read_date_window(vv_path, vh_path, window):
+    """Decodes one window of a VV/VH pair and returns the (VV, VH, Ratio) bands."""
+    vv_data = _cached_open(vv_path).read(1, window=window).astype('float32')
+    vh_data = _cached_open(vh_path).read(1, window=window).astype('float32')
+    # Difference in dB space is equivalent to ratio in linear
+    return np.stack([vv_data, vh_data, vv_data - vh_data])
+
+
+class LazySarStack:
+    """
+    Read-only, rasterio-like view of the VV/VH/Ratio stack that decodes the
+    per-date cropped files on demand. Only `read(window=...)` is supported.
+    """
+
+    def __init__(self, date_map, sorted_dates):
+        self.pairs = []
+        descriptions = []
+        for date in sorted_dates:
+            vv_path = date_map[date].get('vv')
+            vh_path = date_map[date].get('vh')
+            complete = bool(vv_path and vh_path)
+            self.pairs.append((vv_path, vh_path) if complete else None)
+            descriptions += [f"{date}_VV", f"{date}_VH", f"{date}_Ratio"] if complete else [None] * 3
+
+        self.descriptions = tuple(descriptions)
+        self.count = len(descriptions)
+        self.nodata = 0
+        first_vv = date_map[sorted_dates[0]]['vv']
+        with rasterio.open(first_vv) as src:
+            self.width, self.height = src.width, src.height
+            self.profile = src.profile
+        self.profile.update(count=self.count, dtype='float32', compress='lzw', nodata=0)
+
+    def read(self, window):
+        block = np.zeros((self.count, window.height, window.width), dtype='float32')
+        for i, pair in enumerate(self.pairs):
+            if pair is not None:
+                block[i * 3:i * 3 + 3] = read_date_window(pair[0], pair[1], window)
+        return block
+
+    def close(self):
+        _close_cached_sources()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_sar_stack_windowed(date_map, sorted_dates, output_file, meta, block_size=512,
+                             workers=0, executor='thread', layout=None):
+    """
+    Writes the VV/VH/Ratio stack window by window. Only one block of every
+    date is held in memory, so peak memory depends on block_size and the
+    number of dates instead of the scene extent.
+
+    With workers > 1 the per-date decode and ratio computation run in a
+    thread/process pool while this function stays the single writer, so band
+    order and descriptions are identical to the sequential path. `layout`
+    (the output_layout config) sets tiling, compression and COG/Zarr output;
+    its block_size, when set, overrides `block_size` (see output_block_size).
+    """
+    block_size = output_block_size(block_size, layout)
+    meta = meta.copy()
+    meta.update(tiled=True, blockxsize=block_size, blockysize=block_size)
+
+    pairs = []
+    for date in sorted_dates:
+        vv_path = date_map[date].get('vv')
+        vh_path = date_map[date].get('vh')
+        if not vv_path or not vh_path:
+            print(f"Skipping {date}: Incomplete pair.")
+            pairs.append(None)
+            continue
+        pairs.append((vv_path, vh_path))
+
+    windows = list(iter_windows(meta['width'], meta['height'], block_size))
+    pool = make_executor(executor, workers)
+
+    def submit_window(window):
+        if pool is None:
+            return None
+        return [pool.submit(read_date_window, pair[0], pair[1], window) if pair else None
+                for pair in pairs]
+
+    try:
+        with layout_writer(output_file, meta, layout) as dst:
+            for i, date in enumerate(sorted_dates):
+                if pairs[i] is None:
+                    continue
+                band_idx = i * 3 + 1
+                dst.set_band_description(band_idx, f"{date}_VV")
+                dst.set_band_description(band_idx + 1, f"{date}_VH")
+                dst.set_band_description(band_idx + 2, f"{date}_Ratio")
+
+            # Keep the next window queued in the pool while the current one is written
+            pending = submit_window(windows[0]) if windows else None
+            for w_idx, window in enumerate(windows, start=1):
+                current = pending
+                pending = submit_window(windows[w_idx]) if w_idx < len(windows) else None
+
+                with span("stack_window", index=w_idx):
+                    block = np.zeros((meta['count'], window.height, window.width), dtype='float32')
+                    for i, pair in enumerate(pairs):
+                        if pair is None:
+                            continue
+                        if current is None:
+                            block[i * 3:i * 3 + 3] = read_date_window(pair[0], pair[1], window)
+                        else:
+                            block[i * 3:i * 3 + 3] = current[i].result()
+
+                    # Writing every band of the window at once keeps pixel-interleaved
+                    # blocks from sitting half-filled in the GDAL cache
+                    dst.write(block, window=window)
+
+                if w_idx % 50 == 0 or w_idx == len(windows):
+                    print(f"   [Stacking] window {w_idx}/{len(windows)}")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        _close_cached_sources()
+
+
+def stack_sar_timeseries(config=None):
     # 1. Load configuration
     ROOT_DIR = Path(__file__).resolve().parent.parent
-    CONFIG_PATH = ROOT_DIR / "config.yaml"
-
-    with open(CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_config(config)
 
     # Extract paths from YAML (using .strip() to avoid newline issues)
     input_dir = ROOT_DIR / config['data']['processed_dir'].strip()
     output_file = ROOT_DIR / config['data']['stack_output'].strip()
+    prep_cfg = config.get('preprocessing') or {}
+    stack_mode = prep_cfg.get('stack_mode', 'full')
 
     # Ensure the parent directory for the output stack exists
     output_file.parent.mkdir(parents=True, exist_ok=True)
@@ -27,23 +202,7 @@ def stack_sar_timeseries():
 
     # 2. Group files by date
     # Look for VV and VH pairs in the processed directory
-    all_tifs = list(input_dir.glob("*.tif"))
-    date_map = defaultdict(dict)
-
-    for f_path in all_tifs:
-        filename = f_path.name
-        # Regex to find YYYYMMDD
-        match = re.search(r'\d{8}', filename)
-        if not match:
-            continue
-
-        date = match.group(0)
-        if "_VV_" in filename:
-            date_map[date]['vv'] = str(f_path)
-        elif "_VH_" in filename:
-            date_map[date]['vh'] = str(f_path)
-
-    sorted_dates = sorted(date_map.keys())
+    date_map, sorted_dates = group_sar_dates(input_dir)
     if not sorted_dates:
         print("No valid VV/VH pairs found. Check your file naming and input directory.")
         return
@@ -61,10 +220,20 @@ def stack_sar_timeseries():
             nodata=0
         )
 
-    # 4. Sequential Stacking
     print(f"Creating stack with {total_bands} bands at: {output_file}")
 
-    with rasterio.open(output_file, 'w', **meta) as dst:
+    if stack_mode == 'windowed':
+        # 4a. Block-windowed Stacking (bounded memory)
+        write_sar_stack_windowed(date_map, sorted_dates, output_file, meta,
+                                 block_size=prep_cfg.get('block_size', 512),
+                                 workers=prep_cfg.get('workers', 0),
+                                 executor=prep_cfg.get('executor', 'thread'),
+                                 layout=config.get('output_layout'))
+        print(f"\n--- Stacking Complete: {output_file} ---")
+        return
+
+    # 4. Sequential Stacking
+    with layout_writer(output_file, meta, config.get('output_layout')) as dst:
         band_idx = 1
 
         for date in sorted_dates:
@@ -77,7 +246,7 @@ def stack_sar_timeseries():
                 continue
 
             print(f"   [Stacking] {date}...")
-            with rasterio.open(vv_path) as vv_src, rasterio.open(vh_path) as vh_src:
+            with span("stack_date", date=date), rasterio.open(vv_path) as vv_src, rasterio.open(vh_path) as vh_src:
                 vv_data = vv_src.read(1).astype('float32')
                 vh_data = vh_src.read(1).astype('float32')
 
@@ -101,13 +270,10 @@ def stack_sar_timeseries():
 
 
 
-def generate_stack_statistics(config):
+def generate_stack_statistics(config=None):
     # 1. Setup Paths
     ROOT_DIR = Path(__file__).resolve().parent.parent
-    CONFIG_PATH = ROOT_DIR / config
-
-    with open(CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_config(config)
 
     stack_path = ROOT_DIR / config['data']['stack_output'].strip()
     print(stack_path)
@@ -119,51 +285,139 @@ def generate_stack_statistics(config):
         return
 
     print(f"Calculating statistics for: {stack_path.name}...")
+    stats_cfg = config.get('statistics') or {}
+    json_path = stack_path.with_suffix('.stats.json')
 
-    # 2. Compute Stats per Band
+    # 2. Single streaming pass over all blocks (bands accumulated together)
     with rasterio.open(stack_path) as src:
         band_names = src.descriptions
-        with open(log_path, 'w') as log:
-            log.write(f"Statistical Summary for {stack_path.name}\n")
-            log.write("=" * 50 + "\n\n")
-
-            for i in range(1, src.count + 1):
-                band_data = src.read(i)
-                band_name = band_names[i - 1] if band_names[i - 1] else f"Band_{i}"
-
-                # Filter out NoData (assuming 0 or use src.nodata)
-                nodata_val = src.nodata if src.nodata is not None else 0
-                valid_data = band_data[band_data != nodata_val]
-
-                if valid_data.size == 0:
-                    log.write(f"Band {i} ({band_name}): No valid data found.\n\n")
-                    continue
+        nodata_val = src.nodata if src.nodata is not None else 0
+        width, height = src.width, src.height
+
+    accumulators = compute_statistics(
+        raster_opener(stack_path), width, height,
+        nodata=nodata_val,
+        block_size=stats_cfg.get('block_size', 512),
+        workers=stats_cfg.get('workers', 0),
+        executor=stats_cfg.get('executor', 'process'),
+        hist_range=stats_cfg.get('hist_range', [-60.0, 40.0]),
+        bins=stats_cfg.get('hist_bins', 10000),
+    )
+
+    # 3. Write in the requested format, plus a JSON sidecar for later stages
+    write_statistics_log(log_path, stack_path.name, band_names, accumulators)
+    write_statistics_json(json_path, stack_path.name, band_names, accumulators, nodata=nodata_val)
+
+    print(f"Success! Statistics saved to: {log_path} and {json_path.name}")
+
+
+def histogram_layout(config):
+    """(hist_range, bins) from the statistics section, refined to normalization.max_error."""
+    stats_cfg = config.get('statistics') or {}
+    norm_cfg = config.get('normalization') or {}
+    hist_range = stats_cfg.get('hist_range', [-60.0, 40.0])
+    bins = stats_cfg.get('hist_bins', 10000)
+    max_error = norm_cfg.get('max_error')
+    if max_error:
+        bins = max(bins, int(np.ceil((hist_range[1] - hist_range[0]) / max_error)))
+    return hist_range, bins
+
+
+def percentile_bounds(accumulators, config):
+    low_q, high_q = (config.get('normalization') or {}).get('percentiles', [2, 98])
+    return [(acc.percentile(low_q), acc.percentile(high_q)) if acc.count else None
+            for acc in accumulators]
+
+
+def resolve_normalization_bounds(stack_path, src, config):
+    """
+    Returns per-band (low, high) percentile bounds from histograms, or None for
+    bands without valid data. The statistics sidecar is reused when it is
+    newer than the stack and its bins are at least as fine as max_error;
+    otherwise one streaming statistics pass is run.
+    """
+    stats_cfg = config.get('statistics') or {}
+    norm_cfg = config.get('normalization') or {}
+    hist_range, bins = histogram_layout(config)
+    max_error = norm_cfg.get('max_error')
+
+    accumulators = None
+    json_path = Path(stack_path).with_suffix('.stats.json')
+    if norm_cfg.get('reuse_stats', True) and json_path.exists() \
+            and json_path.stat().st_mtime >= Path(stack_path).stat().st_mtime:
+        sidecar, cached = load_statistics_json(json_path)
+        fine_enough = not max_error or cached[0].bin_width <= max_error
+        if len(cached) == src.count and fine_enough:
+            print(f"Reusing percentile histograms from {json_path.name}")
+            accumulators = cached
+
+    if accumulators is None:
+        print("Computing percentile histograms in one streaming pass...")
+        accumulators = compute_statistics(
+            raster_opener(stack_path), src.width, src.height,
+            nodata=0,
+            block_size=stats_cfg.get('block_size', 512),
+            workers=stats_cfg.get('workers', 0),
+            executor=stats_cfg.get('executor', 'process'),
+            hist_range=hist_range,
+            bins=bins,
+        )
 
-                # Calculate stats
-                stats = {
-                    "MINIMUM": np.min(valid_data),
-                    "MAXIMUM": np.max(valid_data),
-                    "MEAN": np.mean(valid_data),
-                    "STDDEV": np.std(valid_data),
-                    "VALID_PERCENT": (valid_data.size / band_data.size) * 100
-                }
+    return percentile_bounds(accumulators, config)
+
+
+def set_quantization(dst, dtype):
+    """Stores the per-band scale/offset that map `dtype` codes back to [0, 1] values."""
+    if dtype in QUANTIZED_MAX_CODE:
+        scale, offset = quantization_params(dtype)
+        dst.scales = [scale] * dst.count
+        dst.offsets = [offset] * dst.count
+
+
+def write_normalized_stack(opener, output_path, profile, bounds, band_names, block_size=512, layout=None,
+                           dtype='float32'):
+    """
+    Applies the per-band clip-and-scale block by block from `opener`'s raster
+    and stores the result with the `layout` (output_layout) options. With a
+    uint8/uint16 `dtype` the [0, 1] values are quantized (0 = nodata).
+    Windows follow the output tiles (see output_block_size).
+    """
+    block_size = output_block_size(block_size, layout)
+    profile = profile.copy()
+    profile.update(dtype=dtype, nodata=0, compress='lzw',
+                   tiled=True, blockxsize=block_size, blockysize=block_size)
+
+    with opener() as src, layout_writer(output_path, profile, layout) as dst:
+        for i, name in enumerate(band_names, start=1):
+            dst.set_band_description(i, f"Norm_{name or f'Band_{i}'}")
+        set_quantization(dst, dtype)
+
+        for w_idx, window in enumerate(iter_windows(profile['width'], profile['height'], block_size)):
+            with span("normalize_window", index=w_idx):
+                data = src.read(window=window).astype('float32', copy=False)
+                mask = (data != 0) & (~np.isnan(data))
 
-                # 3. Write in the requested format
-                log.write(f"--- Band {i}: {band_name} ---\n")
-                for key, value in stats.items():
-                    log.write(f"STATISTICS_{key}={value:.12f}\n")
-                log.write("\n")
+                for b, band_bounds in enumerate(bounds):
+                    if band_bounds is None:
+                        # No valid pixels anywhere in the band: written unchanged
+                        continue
+                    band_min, band_max = band_bounds
+                    if band_max == band_min:
+                        data[b] = 0
+                    else:
+                        np.clip(data[b], band_min, band_max, out=data[b])
+                        data[b] = (data[b] - band_min) / (band_max - band_min)
+                    data[b][~mask[b]] = 0
 
-    print(f"Success! Statistics saved to: {log_path}")
+                if dtype in QUANTIZED_MAX_CODE:
+                    data = quantize_normalized(data, mask, dtype)
+                dst.write(data, window=window)
 
 
-def normalize_sar_stack():
+def normalize_sar_stack(config=None):
     # 1. Setup Paths
     ROOT_DIR = Path(__file__).resolve().parent.parent
-    CONFIG_PATH = ROOT_DIR / "config.yaml"
-
-    with open(CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_config(config)
 
     input_path = ROOT_DIR / config['data']['stack_output'].strip()
     output_path = ROOT_DIR / config['data']['norm_output'].strip()
@@ -175,46 +429,269 @@ def normalize_sar_stack():
     # Ensure output directory exists (crucial for DVC)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
+    norm_cfg = config.get('normalization') or {}
+    if norm_cfg.get('method', 'exact') == 'histogram':
+        # 2a. Approximate percentiles from histograms, then block-wise scaling
+        with rasterio.open(input_path) as src:
+            profile = src.profile
+            band_names = src.descriptions
+            bounds = resolve_normalization_bounds(input_path, src, config)
+
+        print(f"Normalizing {len(bounds)} bands block by block...")
+        write_normalized_stack(raster_opener(input_path), output_path, profile, bounds,
+                               band_names, block_size=norm_cfg.get('block_size', 512),
+                               layout=config.get('output_layout'), dtype=norm_cfg.get('dtype', 'float32'))
+        print(f"Normalization complete. File saved to: {output_path}")
+        return
+
     # 2. Processing
+    dtype = norm_cfg.get('dtype', 'float32')
     with rasterio.open(input_path) as src:
         profile = src.profile
-        profile.update(dtype='float32', nodata=0, compress='lzw')
+        profile.update(dtype=dtype, nodata=0, compress='lzw')
 
-        with rasterio.open(output_path, 'w', **profile) as dst:
+        with layout_writer(output_path, profile, config.get('output_layout')) as dst:
+            set_quantization(dst, dtype)
             for i in range(1, src.count + 1):
                 band_name = src.descriptions[i - 1] if src.descriptions else f"Band_{i}"
                 print(f"Normalizing {band_name}...")
+                with span("normalize_band", band=band_name):
+                    data = src.read(i).astype('float32')
+                    mask = (data != 0) & (~np.isnan(data))
+
+                    if np.any(mask):
+                        # Robust scaling using percentiles
+                        band_min = np.percentile(data[mask], 2)
+                        band_max = np.percentile(data[mask], 98)
+
+                        # Avoid division by zero if a band is constant
+                        if band_max == band_min:
+                            norm_data = np.zeros_like(data)
+                        else:
+                            # Min-Max Scaling: $x_{norm} = \frac{x - min}{max - min}$
+                            norm_data = np.clip(data, band_min, band_max)
+                            norm_data = (norm_data - band_min) / (band_max - band_min)
+
+                        # Re-apply mask to preserve NoData
+                        norm_data[~mask] = 0
+                        if dtype in QUANTIZED_MAX_CODE:
+                            norm_data = quantize_normalized(norm_data, mask, dtype)
+                        dst.write(norm_data, i)
+                    else:
+                        dst.write(np.zeros(data.shape, dtype), i)  # no valid pixels: all nodata
 
-                data = src.read(i).astype('float32')
-                mask = (data != 0) & (~np.isnan(data))
+                dst.set_band_description(i, f"Norm_{band_name}")
 
-                if np.any(mask):
-                    # Robust scaling using percentiles
-                    band_min = np.percentile(data[mask], 2)
-                    band_max = np.percentile(data[mask], 98)
+    print(f"Normalization complete. File saved to: {output_path}")
 
-                    # Avoid division by zero if a band is constant
-                    if band_max == band_min:
-                        norm_data = np.zeros_like(data)
-                    else:
-                        # Min-Max Scaling: $x_{norm} = \frac{x - min}{max - min}$
-                        norm_data = np.clip(data, band_min, band_max)
-                        norm_data = (norm_data - band_min) / (band_max - band_min)
 
-                    # Re-apply mask to preserve NoData
-                    norm_data[~mask] = 0
-                    dst.write(norm_data, i)
-                else:
-                    dst.write(data, i)
 
-                dst.set_band_description(i, f"Norm_{band_name}")
+def declared_dvc_out(path, stage, root_dir):
+    """True when dvc.yaml lists `path` among the outs of `stage` (so DVC expects the file)."""
+    dvc_path = Path(root_dir) / "dvc.yaml"
+    if not dvc_path.exists():
+        return False
+    import yaml
+    with open(dvc_path, 'r') as f:
+        outs = ((yaml.safe_load(f) or {}).get('stages') or {}).get(stage, {}).get('outs') or []
+    names = {next(iter(out)) if isinstance(out, dict) else out for out in outs}
+    return any((Path(root_dir) / name).resolve() == Path(path).resolve() for name in names)
+
+
+def fused_stack_normalize(config=None):
+    """
+    Builds the normalized stack straight from the cropped VV/VH files. The raw
+    stack stays virtual (LazySarStack): one streaming pass collects the
+    statistics and percentile histograms, a second one writes only the
+    normalized output. The raw stack is still written when
+    preprocessing.write_raw_stack is set (debugging) or when dvc.yaml lists
+    it as an out of the preprocessing stage, which DVC then requires.
+    """
+    # 1. Setup Paths
+    ROOT_DIR = Path(__file__).resolve().parent.parent
+    config = load_config(config)
+
+    input_dir = ROOT_DIR / config['data']['processed_dir'].strip()
+    stack_path = ROOT_DIR / config['data']['stack_output'].strip()
+    output_path = ROOT_DIR / config['data']['norm_output'].strip()
+    prep_cfg = config.get('preprocessing') or {}
+    stats_cfg = config.get('statistics') or {}
+    norm_cfg = config.get('normalization') or {}
 
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    stack_path.parent.mkdir(parents=True, exist_ok=True)
+
+    date_map, sorted_dates = group_sar_dates(input_dir)
+    if not sorted_dates:
+        print("No valid VV/VH pairs found. Check your file naming and input directory.")
+        return
+
+    opener = partial(LazySarStack, date_map, sorted_dates)
+    with opener() as lazy:
+        profile = lazy.profile
+        band_names = lazy.descriptions
+    print(f"Fused stack -> normalize over {len(sorted_dates)} dates ({profile['count']} bands)")
+
+    if prep_cfg.get('write_raw_stack', False) or declared_dvc_out(stack_path, 'preprocessing', ROOT_DIR):
+        print(f"Writing raw stack (write_raw_stack or a dvc.yaml out): {stack_path}")
+        write_sar_stack_windowed(date_map, sorted_dates, stack_path, profile,
+                                 block_size=prep_cfg.get('block_size', 512),
+                                 workers=prep_cfg.get('workers', 0),
+                                 executor=prep_cfg.get('executor', 'thread'),
+                                 layout=config.get('output_layout'))
+
+    # 2. Pass 1: statistics and percentile histograms over the virtual stack
+    hist_range, bins = histogram_layout(config)
+    with span("statistics"):
+        accumulators = compute_statistics(
+            opener, profile['width'], profile['height'],
+            nodata=0,
+            block_size=stats_cfg.get('block_size', 512),
+            workers=stats_cfg.get('workers', 0),
+            executor=stats_cfg.get('executor', 'process'),
+            hist_range=hist_range,
+            bins=bins,
+        )
+    write_statistics_log(stack_path.with_suffix('.stats.log'), stack_path.name, band_names, accumulators)
+    write_statistics_json(stack_path.with_suffix('.stats.json'), stack_path.name, band_names, accumulators)
+
+    # 3. Pass 2: normalized output only
+    write_normalized_stack(opener, output_path, profile, percentile_bounds(accumulators, config),
+                           band_names, block_size=norm_cfg.get('block_size', 512),
+                           layout=config.get('output_layout'), dtype=norm_cfg.get('dtype', 'float32'))
     print(f"Normalization complete. File saved to: {output_path}")
 
 
+def _part_dtype(path):
+    with rasterio.open(path) as src:
+        return src.dtypes[0]
 
-if __name__ == "__main__":
-    stack_sar_timeseries()
-    generate_stack_statistics(config="config.yaml")
-    normalize_sar_stack()
 
+def append_new_dates(config=None):
+    """
+    Incremental mode: every date is stored as its own 3-band raw and normalized
+    part, and stack_output / norm_output are VRTs over those parts. Dates
+    already present in the stack (by their `<date>_VV` band description) are
+    left untouched; only new date triplets are stacked, get statistics and
+    are normalized, so the cost per acquisition is O(new dates).
+    """
+    # 1. Setup Paths
+    ROOT_DIR = Path(__file__).resolve().parent.parent
+    config = load_config(config)
+
+    input_dir = ROOT_DIR / config['data']['processed_dir'].strip()
+    stack_path = ROOT_DIR / config['data']['stack_output'].strip()
+    output_path = ROOT_DIR / config['data']['norm_output'].strip()
+    parts_dir = ROOT_DIR / config['data'].get('stack_parts_dir', 'data/processed/stack_parts').strip()
+    prep_cfg = config.get('preprocessing') or {}
+    stats_cfg = config.get('statistics') or {}
+    norm_cfg = config.get('normalization') or {}
+
+    if stack_path.suffix != '.vrt' or output_path.suffix != '.vrt':
+        print("Error: incremental mode needs data.stack_output and data.norm_output to be .vrt paths")
+        exit(1)
+
+    raw_dir, norm_dir = parts_dir / "raw", parts_dir / "norm"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    norm_dir.mkdir(parents=True, exist_ok=True)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # 2. Which dates are already stacked?
+    date_map, sorted_dates = group_sar_dates(input_dir)
+    complete = [d for d in sorted_dates if date_map[d].get('vv') and date_map[d].get('vh')]
+    existing = set()
+    if stack_path.exists():
+        with rasterio.open(stack_path) as src:
+            existing = {d[:-3] for d in src.descriptions if d and d.endswith('_VV')}
+    # A date only counts as stacked if both of its parts survived and the
+    # normalized part is stored with the configured dtype
+    norm_dtype = norm_cfg.get('dtype', 'float32')
+    existing = {d for d in existing
+                if (raw_dir / f"{d}.tif").exists() and (norm_dir / f"{d}.tif").exists()
+                and _part_dtype(norm_dir / f"{d}.tif") == norm_dtype}
+
+    new_dates = [d for d in complete if d not in existing]
+    if not new_dates:
+        print(f"Stack is up to date ({len(existing)} dates).")
+        return
+    print(f"{len(existing)} dates already stacked, appending {len(new_dates)}: {', '.join(new_dates)}")
+
+    # 3. Stack, summarize and normalize only the new dates
+    hist_range, bins = histogram_layout(config)
+    for date in new_dates:
+        with span("append_date", date=date):
+            raw_part = raw_dir / f"{date}.tif"
+            with rasterio.open(date_map[date]['vv']) as src:
+                meta = src.meta.copy()
+            meta.update(count=3, dtype='float32', compress='lzw', nodata=0)
+
+            print(f"   [Appending] {date}...")
+            write_sar_stack_windowed(date_map, [date], raw_part, meta,
+                                     block_size=prep_cfg.get('block_size', 512),
+                                     workers=prep_cfg.get('workers', 0),
+                                     executor=prep_cfg.get('executor', 'thread'),
+                                     layout=config.get('output_layout'))
+
+            accumulators = compute_statistics(
+                raster_opener(raw_part), meta['width'], meta['height'],
+                nodata=0,
+                block_size=stats_cfg.get('block_size', 512),
+                workers=stats_cfg.get('workers', 0),
+                executor=stats_cfg.get('executor', 'process'),
+                hist_range=hist_range,
+                bins=bins,
+            )
+            with rasterio.open(raw_part) as src:
+                band_names = src.descriptions
+                profile = src.profile
+            write_statistics_json(raw_part.with_suffix('.stats.json'), raw_part.name, band_names, accumulators)
+            write_normalized_stack(raster_opener(raw_part), norm_dir / f"{date}.tif", profile,
+                                   percentile_bounds(accumulators, config), band_names,
+                                   block_size=norm_cfg.get('block_size', 512),
+                                   layout=config.get('output_layout'), dtype=norm_dtype)
+
+    # 4. Re-point the VRTs and summary files at all parts (no pixel I/O)
+    all_dates = sorted(existing | set(new_dates))
+    with rasterio.open(raw_dir / f"{all_dates[0]}.tif") as src:
+        grid = dict(width=src.width, height=src.height, crs=src.crs, transform=src.transform)
+
+    raw_sources, norm_sources, band_names, accumulators = [], [], [], []
+    for date in all_dates:
+        for b, suffix in enumerate(("VV", "VH", "Ratio"), start=1):
+            raw_sources.append((raw_dir / f"{date}.tif", b, f"{date}_{suffix}"))
+            norm_sources.append((norm_dir / f"{date}.tif", b, f"Norm_{date}_{suffix}"))
+            band_names.append(f"{date}_{suffix}")
+        accumulators += load_statistics_json(raw_dir / f"{date}.stats.json")[1]
+
+    write_band_vrt(stack_path, raw_sources, **grid)
+    if norm_dtype in QUANTIZED_MAX_CODE:
+        scale, offset = quantization_params(norm_dtype)
+        write_band_vrt(output_path, norm_sources, **grid, dtype=norm_dtype, scale=scale, offset=offset)
+    else:
+        write_band_vrt(output_path, norm_sources, **grid)
+    write_statistics_log(stack_path.with_suffix('.stats.log'), stack_path.name, band_names, accumulators)
+    write_statistics_json(stack_path.with_suffix('.stats.json'), stack_path.name, band_names, accumulators)
+    print(f"Stack now holds {len(all_dates)} dates: {stack_path} / {output_path}")
+
+
+def run_preprocessing(config=None):
+    """The `preprocessing` stage: incremental, fused or stack -> statistics -> normalize."""
+    config = load_config(config)
+    prep_cfg = config.get('preprocessing') or {}
+    if prep_cfg.get('incremental', False):
+        append_new_dates(config)
+    elif prep_cfg.get('fused', False):
+        fused_stack_normalize(config)
+    else:
+        with span("stack"):
+            stack_sar_timeseries(config)
+        with span("statistics"):
+            generate_stack_statistics(config)
+        with span("normalize"):
+            normalize_sar_stack(config)
+
+
+if __name__ == "__main__":
+    config = load_config()
+    with stage_run("preprocessing", config):
+        run_preprocessing(config)
@@ -0,0 +1,279 @@
+import json
+import os
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+
+def iter_windows(width, height, block_size):
+    """Yields row-major windows of at most block_size x block_size covering the raster."""
+    for row_off in range(0, height, block_size):
+        win_height = min(block_size, height - row_off)
+        for col_off in range(0, width, block_size):
+            win_width = min(block_size, width - col_off)
+            yield Window(col_off, row_off, win_width, win_height)
+
+
+def tiled_block_size(block_size):
+    """GeoTIFF tiles must be multiples of 16 pixels."""
+    return max(16, (int(block_size) // 16) * 16)
+
+
+def output_block_size(block_size, layout=None):
+    """
+    Window edge of a block-wise writer: output_layout.block_size when set
+    (it sets the tile size in layout_profile), else the stage's own
+    block_size, so every window covers whole tiles and each tile is written once.
+    """
+    return tiled_block_size((layout or {}).get('block_size') or block_size)
+
+
+def make_executor(kind, workers):
+    """Returns a thread or process pool, or None when workers <= 1 (sequential)."""
+    if not workers or workers <= 1:
+        return None
+    if kind == 'process':
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers)
+
+
+# Integer storage of [0, 1] normalized values; code 0 is reserved for nodata
+QUANTIZED_MAX_CODE = {'uint8': 255, 'uint16': 65535}
+
+
+def quantization_params(dtype):
+    """(scale, offset) with value = code * scale + offset for codes 1..max of `dtype`."""
+    step = 1.0 / (QUANTIZED_MAX_CODE[dtype] - 1)
+    return step, -step
+
+
+def quantize_normalized(data, valid, dtype):
+    """
+    Codes normalized [0, 1] values as `dtype` integers: valid pixels map
+    linearly onto 1..max (error <= scale / 2), everything else onto 0.
+    """
+    scale, offset = quantization_params(dtype)
+    codes = np.zeros(data.shape, dtype=dtype)
+    codes[valid] = np.rint((np.clip(data[valid], 0.0, 1.0) - offset) / scale).astype(dtype)
+    return codes
+
+
+def dequantize(data, scales, offsets):
+    """
+    float32 values of bands-first `data` (C, ...). Integer codes are mapped
+    back with the per-band scales/offsets and code 0 to the nodata value 0;
+    float data passes through unchanged.
+    """
+    if data.dtype.kind == 'f':
+        return data.astype('float32', copy=False)
+    shape = (-1,) + (1,) * (data.ndim - 1)
+    values = data.astype('float32') * np.asarray(scales, dtype='float32').reshape(shape) \
+        + np.asarray(offsets, dtype='float32').reshape(shape)
+    values[data == 0] = 0.0
+    return values
+
+
+def band_scaling(src):
+    """
+    (scales, offsets) of every band of an open raster. GDAL cannot store them
+    on Zarr bands, so _write_zarr keeps them in the array attributes, which
+    GDAL exposes as the comma-separated 'scales'/'offsets' tags.
+    """
+    tags = src.tags()
+    if 'scales' in tags and 'offsets' in tags:
+        return ([float(v) for v in tags['scales'].split(',')],
+                [float(v) for v in tags['offsets'].split(',')])
+    return list(src.scales), list(src.offsets)
+
+
+def read_normalized(src, window=None):
+    """Reads a normalized stack (float32 or quantized) as float32 values."""
+    return dequantize(src.read(window=window), *band_scaling(src))
+
+
+def output_format(path, layout=None):
+    """'zarr' for .zarr paths, otherwise 'cog' or 'gtiff' depending on output_layout.cog."""
+    if Path(path).suffix.lower() == '.zarr':
+        return 'zarr'
+    return 'cog' if (layout or {}).get('cog', False) else 'gtiff'
+
+
+def layout_profile(profile, layout=None):
+    """
+    GTiff write profile with the output_layout options applied: internal
+    tiles, compression codec and level, predictor and interleave. Without
+    a layout the profile's own tiling is kept and LZW is used.
+    """
+    layout = layout or {}
+    profile = profile.copy()
+    for key in ('compress', 'predictor', 'interleave', 'zstd_level', 'zlevel', 'photometric'):
+        profile.pop(key, None)
+    block = tiled_block_size(layout.get('block_size') or profile.get('blockxsize') or 512)
+    compress = layout.get('compress', 'lzw').lower()
+    profile.update(driver='GTiff', tiled=True, blockxsize=block, blockysize=block, compress=compress,
+                   interleave=layout.get('interleave', 'pixel'), BIGTIFF='IF_SAFER')
+
+    predictor = layout.get('predictor', 1)
+    if predictor == 3 and not str(profile['dtype']).startswith('float'):
+        predictor = 2  # The floating-point predictor is only defined for float data
+    if predictor and predictor > 1:
+        profile['predictor'] = predictor
+    level = layout.get('level')
+    if level is not None and compress in ('zstd', 'deflate'):
+        profile['zstd_level' if compress == 'zstd' else 'zlevel'] = level
+    return profile
+
+
+def _cog_options(layout, dtype):
+    options = {key: value for key, value in layout_profile({'dtype': dtype}, layout).items()
+               if key in ('compress', 'predictor', 'blockxsize', 'BIGTIFF')}
+    options['BLOCKSIZE'] = options.pop('blockxsize')
+    if layout.get('level') is not None and options['compress'] in ('zstd', 'deflate'):
+        options['LEVEL'] = layout['level']
+    # Without explicit factors the COG driver builds overviews down to one tile
+    options['OVERVIEWS'] = 'FORCE_USE_EXISTING' if layout.get('overviews') else 'AUTO'
+    options['OVERVIEW_RESAMPLING'] = 'AVERAGE'
+    options['NUM_THREADS'] = 'ALL_CPUS'
+    return options
+
+
+def _write_zarr(staging, zarr_path, layout):
+    """
+    Chunked Zarr (v2) copy of a GTiff, one band of one tile per chunk: GDAL
+    reads Zarr band by band, so multi-band chunks would be decoded once per
+    band. GDAL keeps band descriptions but not the CRS/nodata of multi-band
+    arrays, so those are written into the array attributes GDAL reads them from;
+    the scales/offsets of quantized stacks go there too (see band_scaling).
+    """
+    layout = layout or {}
+    with rasterio.open(staging) as src:
+        crs, nodata, descriptions = src.crs, src.nodata, src.descriptions
+        scales, offsets = list(src.scales), list(src.offsets)
+        block = src.block_shapes[0][0]
+    scaled = any(s != 1.0 for s in scales) or any(o != 0.0 for o in offsets)
+    codec = {'lzw': 'ZLIB', 'deflate': 'ZLIB'}.get(layout.get('compress', 'zstd').lower(),
+                                                   layout.get('compress', 'zstd').upper())
+    options = {'COMPRESS': codec, 'CREATE_ZMETADATA': 'NO', 'BLOCKSIZE': f"1,{block},{block}"}
+    if layout.get('level') is not None and codec in ('ZSTD', 'ZLIB'):
+        options[f"{codec}_LEVEL"] = layout['level']
+    if nodata is not None or scaled:
+        # Zarr CreateCopy rejects a nodata value on multi-band input and any band scale/offset
+        with rasterio.open(staging, 'r+') as src:
+            src.nodata = None
+            src.scales, src.offsets = [1.0] * len(scales), [0.0] * len(offsets)
+    shutil.rmtree(zarr_path, ignore_errors=True)
+    rasterio.shutil.copy(staging, zarr_path, driver='Zarr', **options)
+
+    with rasterio.open(zarr_path, 'r+') as dst:
+        for band, description in enumerate(descriptions, start=1):
+            if description:
+                dst.set_band_description(band, description)
+    array_dir = Path(zarr_path) / Path(zarr_path).stem
+    attrs_path, array_path = array_dir / '.zattrs', array_dir / '.zarray'
+    attrs = json.loads(attrs_path.read_text())
+    if crs:
+        attrs['_CRS'] = {'wkt': crs.to_wkt()}
+    if scaled:
+        attrs['scales'] = ",".join(repr(v) for v in scales)
+        attrs['offsets'] = ",".join(repr(v) for v in offsets)
+    attrs_path.write_text(json.dumps(attrs, indent=2))
+    if nodata is not None:
+        array = json.loads(array_path.read_text())
+        array['fill_value'] = nodata
+        array_path.write_text(json.dumps(array, indent=2))
+
+
+def finalize_layout(staging, output_path, layout=None):
+    """
+    Builds overviews on the written GTiff and, for COG or Zarr outputs,
+    converts the staging GTiff into output_path.
+    """
+    layout = layout or {}
+    fmt = output_format(output_path, layout)
+    factors = layout.get('overviews') or []
+    if factors and fmt != 'zarr':
+        with rasterio.open(staging, 'r+') as dst:
+            dst.build_overviews(factors, Resampling.average)
+            dst.update_tags(ns='rio_overview', resampling='average')
+
+    if fmt == 'cog':
+        with rasterio.open(staging) as src:
+            dtype = src.dtypes[0]
+        rasterio.shutil.copy(staging, output_path, driver='COG', **_cog_options(layout, dtype))
+    elif fmt == 'zarr':
+        _write_zarr(staging, output_path, layout)
+    if Path(staging) != Path(output_path):
+        Path(staging).unlink(missing_ok=True)
+
+
+@contextmanager
+def layout_writer(output_path, profile, layout=None):
+    """
+    rasterio writer for a block-wise output that is stored with the
+    output_layout options. GTiff outputs are written in place; COG and Zarr
+    outputs go through a tiled staging GTiff that is converted on close.
+    """
+    output_path = Path(output_path)
+    fmt = output_format(output_path, layout)
+    staging = output_path if fmt == 'gtiff' else output_path.with_name(output_path.name + '.staging.tif')
+    try:
+        with rasterio.open(staging, 'w', **layout_profile(profile, layout)) as dst:
+            yield dst
+        finalize_layout(staging, output_path, layout)
+    finally:
+        if staging != output_path:
+            staging.unlink(missing_ok=True)
+            staging.with_name(staging.name + '.aux.xml').unlink(missing_ok=True)
+
+
+_VRT_DTYPES = {'uint8': 'Byte', 'uint16': 'UInt16', 'int16': 'Int16', 'float32': 'Float32'}
+
+
+def write_band_vrt(vrt_path, sources, width, height, crs, transform, dtype='float32', nodata=0,
+                   scale=None, offset=None):
+    """
+    Writes a GDAL VRT that presents bands from several same-grid rasters as one
+    dataset. `sources` is a list of (raster_path, band_index, description).
+    Paths are stored relative to the VRT so the folder can be moved. `scale`
+    and `offset` are set on every band (quantized sources).
+    """
+    vrt_path = Path(vrt_path)
+    lines = [f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">',
+             f'  <SRS>{escape(crs.to_wkt())}</SRS>',
+             f'  <GeoTransform>{", ".join(repr(v) for v in transform.to_gdal())}</GeoTransform>']
+    rect = f'xOff="0" yOff="0" xSize="{width}" ySize="{height}"'
+    for band, (path, src_band, description) in enumerate(sources, start=1):
+        rel_path = os.path.relpath(path, vrt_path.parent)
+        lines += [f'  <VRTRasterBand dataType="{_VRT_DTYPES[dtype]}" band="{band}">',
+                  f'    <Description>{escape(description or "")}</Description>',
+                  f'    <NoDataValue>{nodata}</NoDataValue>',
+                  *([f'    <Offset>{offset!r}</Offset>', f'    <Scale>{scale!r}</Scale>'] if scale is not None else []),
+                  '    <SimpleSource>',
+                  f'      <SourceFilename relativeToVRT="1">{escape(rel_path)}</SourceFilename>',
+                  f'      <SourceBand>{src_band}</SourceBand>',
+                  f'      <SrcRect {rect}/>',
+                  f'      <DstRect {rect}/>',
+                  '    </SimpleSource>',
+                  '  </VRTRasterBand>']
+    lines.append('</VRTDataset>')
+    vrt_path.write_text("\n".join(lines) + "\n")
+
+
+def list_zip_rasters(zip_path, suffixes=('.tif', '.tiff')):
+    """
+    Lists the rasters inside a zip archive as (member name, GDAL /vsizip/ path)
+    pairs, so they can be opened with rasterio without extracting the archive.
+    """
+    zip_path = Path(zip_path).resolve()
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [m for m in archive.namelist() if m.lower().endswith(suffixes)]
+    return [(member, f"/vsizip/{zip_path.as_posix()}/{member}") for member in sorted(members)]
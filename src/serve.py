@@ -0,0 +1,270 @@
+"""
+Warm-model inference server for on-demand AOIs.
+
+Loads the configured backend once and listens on localhost:
+
+    POST /predict  {"input_path": ..., "window": [col, row, width, height],
+                    "output_path": ..., "return": "path" | "array"}
+    GET  /health
+    GET  /metrics
+
+    python src/serve.py
+"""
+import base64
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import torch
+from rasterio.windows import Window
+from config import load_config
+from inference import load_inference_model, predict_raster
+from temporal import input_adapter
+
+
+class MicroBatcher:
+    """
+    Stands in for the model inside predict_raster. Tiles submitted by
+    concurrent requests are queued and run together: a batch closes when it
+    holds max_batch_size tiles or max_wait_ms after its first tile arrived,
+    whichever comes first.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=20, device='cpu'):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.device = device
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.tiles = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def __call__(self, tiles):
+        futures = []
+        for tile in tiles:
+            future = Future()
+            self.queue.put((tile, future))
+            futures.append(future)
+        return torch.stack([future.result() for future in futures])
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with torch.inference_mode():
+                    logits = self.model(torch.stack([tile for tile, _ in items]).to(self.device)).float().cpu()
+            except Exception as exc:
+                for _, future in items:
+                    future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.tiles += len(items)
+            for (_, future), tile_logits in zip(items, logits):
+                future.set_result(tile_logits)
+
+
+class ServerMetrics:
+    """Request counters and a rolling window of request latencies."""
+
+    def __init__(self, history=1000):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=history)
+
+    def begin(self):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def end(self, seconds, failed=False):
+        with self.lock:
+            self.in_flight -= 1
+            self.errors += int(failed)
+            self.latencies.append(seconds)
+
+    def snapshot(self, batcher):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000.0
+            return {
+                "uptime_s": time.time() - self.started,
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "queue_depth": batcher.queue.qsize(),
+                "batches": batcher.batches,
+                "mean_batch_size": batcher.tiles / batcher.batches if batcher.batches else 0.0,
+                "latency_ms": {
+                    "count": int(latencies.size),
+                    "mean": float(latencies.mean()) if latencies.size else None,
+                    "p50": float(np.percentile(latencies, 50)) if latencies.size else None,
+                    "p95": float(np.percentile(latencies, 95)) if latencies.size else None,
+                    "max": float(latencies.max()) if latencies.size else None,
+                },
+            }
+
+
+def parse_window(value, width, height):
+    """
+    The request's [col_off, row_off, width, height] as a Window; ValueError
+    (a 400 response) unless it is four ints with a positive size that
+    overlaps the width x height raster.
+    """
+    if not isinstance(value, (list, tuple)) or len(value) != 4 or \
+            not all(isinstance(v, int) and not isinstance(v, bool) for v in value):
+        raise ValueError(f"window must be [col_off, row_off, width, height] integers, got {value!r}")
+    col_off, row_off, w, h = value
+    if w <= 0 or h <= 0:
+        raise ValueError(f"window size must be positive, got {w}x{h}")
+    if col_off >= width or row_off >= height or col_off + w <= 0 or row_off + h <= 0:
+        raise ValueError(f"window {list(value)} does not overlap the {width}x{height} raster")
+    return Window(col_off, row_off, w, h)
+
+
+def make_handler(state):
+    """Request handler class bound to the shared server state (model, config, metrics)."""
+
+    class InferenceHandler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if state['verbose']:
+                super().log_message(format, *args)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "backend": state['backend'],
+                                      "num_channels": state['num_channels']})
+            elif self.path == "/metrics":
+                self._send_json(200, state['metrics'].snapshot(state['batcher']))
+            else:
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send_json(404, {"error": f"Unknown path {self.path}"})
+                return
+
+            metrics = state['metrics']
+            metrics.begin()
+            start = time.perf_counter()
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                status, payload = 200, self.predict(json.loads(self.rfile.read(length) or b"{}"))
+            except (KeyError, ValueError, FileNotFoundError) as exc:
+                status, payload = 400, {"error": f"{type(exc).__name__}: {exc}"}
+            except Exception as exc:
+                status, payload = 500, {"error": f"{type(exc).__name__}: {exc}"}
+            elapsed = time.perf_counter() - start
+            metrics.end(elapsed, failed=status != 200)
+            payload["latency_ms"] = elapsed * 1000.0
+            self._send_json(status, payload)
+
+        def predict(self, request):
+            input_path = Path(request['input_path'])
+            if not input_path.exists():
+                raise FileNotFoundError(str(input_path))
+            output_path = Path(request.get('output_path') or
+                               state['output_dir'] / f"{input_path.stem}_{uuid.uuid4().hex[:8]}.tif")
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+
+            inf_cfg = state['config']['inference']
+            with rasterio.open(input_path) as src:
+                channels, band_transform = input_adapter(state['config'], state['root_dir'], src.count)
+                window = parse_window(request['window'], src.width, src.height) if request.get('window') else None
+            if channels != state['num_channels']:
+                raise ValueError(f"{input_path.name} gives {channels} model channels, "
+                                 f"the model expects {state['num_channels']}")
+            stats = predict_raster(state['batcher'], input_path, output_path,
+                                   window_size=inf_cfg['window_size'],
+                                   overlap=inf_cfg['overlap'],
+                                   batch_size=state['max_batch_size'],
+                                   block_size=inf_cfg.get('block_size', 512),
+                                   window=window,
+                                   band_transform=band_transform)
+            result = {"output_path": str(output_path), "windows": stats['windows']}
+
+            if request.get('return', 'path') == 'array':
+                with rasterio.open(output_path) as src:
+                    mask = src.read(1)
+                result.update(shape=list(mask.shape), dtype='uint8',
+                              mask=base64.b64encode(mask.tobytes()).decode('ascii'))
+            return result
+
+    return InferenceHandler
+
+
+def create_server(config, root_dir):
+    """Loads the model once and returns a ThreadingHTTPServer bound to serve.host:serve.port."""
+    serve_cfg = config['serve']
+    inf_cfg = config['inference']
+    backend = inf_cfg.get('backend', 'torch')
+
+    with rasterio.open(root_dir / inf_cfg.get('input_path', config['data']['norm_output']).strip()) as src:
+        num_channels, _ = input_adapter(config, root_dir, src.count)
+    device = torch.device("cuda" if torch.cuda.is_available() and backend == 'torch' else "cpu")
+    model = load_inference_model(backend, config, root_dir, num_channels, device)
+
+    state = {
+        'config': config,
+        'root_dir': root_dir,
+        'backend': backend,
+        'num_channels': num_channels,
+        'max_batch_size': serve_cfg.get('max_batch_size', inf_cfg['batch_size']),
+        'batcher': MicroBatcher(model, serve_cfg.get('max_batch_size', inf_cfg['batch_size']),
+                                serve_cfg.get('max_wait_ms', 20), device),
+        'metrics': ServerMetrics(),
+        'output_dir': root_dir / serve_cfg.get('output_dir', 'models/serve'),
+        'verbose': serve_cfg.get('verbose', False),
+    }
+    server = ThreadingHTTPServer((serve_cfg.get('host', '127.0.0.1'), serve_cfg.get('port', 8765)),
+                                 make_handler(state))
+    server.daemon_threads = True
+    return server
+
+
+def run_server(config=None):
+    """Serves the model until interrupted (Ctrl+C)."""
+    config = load_config(config)
+    server = create_server(config, Path(__file__).resolve().parent.parent)
+    host, port = server.server_address[:2]
+    print(f"Serving {config['inference'].get('backend', 'torch')} model on http://{host}:{port} "
+          f"(POST /predict, GET /health, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    run_server()
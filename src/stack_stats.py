@@ -0,0 +1,222 @@
+import json
+import math
+from functools import partial
+
+import numpy as np
+import rasterio
+from raster_utils import iter_windows, make_executor
+
+
+class BandAccumulator:
+    """
+    Mergeable single-pass statistics for one band: valid count, min/max,
+    Welford mean/variance and a fixed-bin histogram over hist_range.
+    Values outside hist_range are counted in the edge bins.
+    """
+
+    def __init__(self, hist_range=(-60.0, 40.0), bins=10000):
+        self.hist_range = (float(hist_range[0]), float(hist_range[1]))
+        self.count = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.hist = np.zeros(int(bins), dtype=np.int64)
+
+    @property
+    def bins(self):
+        return self.hist.size
+
+    @property
+    def bin_width(self):
+        return (self.hist_range[1] - self.hist_range[0]) / self.bins
+
+    @property
+    def std(self):
+        # Population std, same as np.std
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    @property
+    def valid_percent(self):
+        return (self.count / self.total) * 100 if self.total else 0.0
+
+    def update(self, values, total):
+        """Adds a 1-D array of valid values taken from a block of `total` pixels."""
+        self.total += int(total)
+        n = values.size
+        if n == 0:
+            return
+
+        values = values.astype('float64', copy=False)
+        block_mean = float(values.mean())
+        block_m2 = float(np.square(values - block_mean).sum())
+        self._merge_moments(n, block_mean, block_m2)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        lo, hi = self.hist_range
+        idx = ((values - lo) * (self.bins / (hi - lo))).astype(np.int64)
+        np.clip(idx, 0, self.bins - 1, out=idx)
+        self.hist += np.bincount(idx, minlength=self.bins)
+
+    def _merge_moments(self, n, mean, m2):
+        # Chan et al. pairwise combination of (count, mean, M2)
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    def percentile(self, q):
+        """
+        Approximate np.percentile(valid, q) from the histogram. The error is at
+        most one bin width for values inside hist_range.
+        """
+        if self.count == 0:
+            return None
+        # Same rank convention as np.percentile's default linear method
+        rank = (q / 100.0) * (self.count - 1)
+        cumulative = np.cumsum(self.hist)
+        b = int(np.searchsorted(cumulative, rank, side='right'))
+        b = min(b, self.bins - 1)
+        before = cumulative[b - 1] if b > 0 else 0
+        frac = (rank - before + 0.5) / self.hist[b] if self.hist[b] else 0.5
+        value = self.hist_range[0] + (b + min(max(frac, 0.0), 1.0)) * self.bin_width
+        return float(min(max(value, self.min), self.max))
+
+    def merge(self, other):
+        if other.hist_range != self.hist_range or other.bins != self.bins:
+            raise ValueError("Cannot merge accumulators with different histogram layouts")
+        self.total += other.total
+        self.hist += other.hist
+        if other.count:
+            self._merge_moments(other.count, other.mean, other.m2)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        return self
+
+    def to_dict(self):
+        nonzero = np.flatnonzero(self.hist)
+        first, last = (int(nonzero[0]), int(nonzero[-1]) + 1) if nonzero.size else (0, 0)
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "mean": self.mean,
+            "std": self.std,
+            "m2": self.m2,
+            "valid_percent": self.valid_percent,
+            # Only the populated span of the histogram is stored
+            "histogram": {"offset": first, "counts": self.hist[first:last].tolist()},
+        }
+
+    @classmethod
+    def from_dict(cls, data, hist_range, bins):
+        acc = cls(hist_range, bins)
+        acc.count = data["count"]
+        acc.total = data["total"]
+        acc.mean = data["mean"]
+        acc.m2 = data["m2"]
+        if acc.count:
+            acc.min = data["min"]
+            acc.max = data["max"]
+        offset = data["histogram"]["offset"]
+        counts = data["histogram"]["counts"]
+        acc.hist[offset:offset + len(counts)] = counts
+        return acc
+
+
+def _accumulate_windows(opener, windows, nodata, hist_range, bins):
+    """Worker task: one pass over a chunk of windows, all bands of each block at once."""
+    with opener() as src:
+        accs = [BandAccumulator(hist_range, bins) for _ in range(src.count)]
+        for window in windows:
+            block = src.read(window=window)
+            for band_data, acc in zip(block, accs):
+                valid = band_data[(band_data != nodata) & np.isfinite(band_data)]
+                acc.update(valid, band_data.size)
+    return accs
+
+
+def compute_statistics(opener, width, height, nodata=0, block_size=512, workers=0,
+                       executor='process', hist_range=(-60.0, 40.0), bins=10000):
+    """
+    Visits every block of the raster returned by `opener` once and returns one
+    BandAccumulator per band. Chunks of windows are spread over the worker
+    pool and their partial accumulators merged, so each block is decoded once
+    for all bands instead of once per band.
+    """
+    windows = list(iter_windows(width, height, block_size))
+    pool = make_executor(executor, workers)
+    task = partial(_accumulate_windows, opener, nodata=nodata, hist_range=hist_range, bins=bins)
+
+    if pool is None:
+        return task(windows)
+
+    n_chunks = min(len(windows), workers * 4)
+    chunks = [windows[i::n_chunks] for i in range(n_chunks)]
+    result = None
+    with pool:
+        for partial_accs in pool.map(task, chunks):
+            if result is None:
+                result = partial_accs
+            else:
+                for acc, other in zip(result, partial_accs):
+                    acc.merge(other)
+    return result
+
+
+def write_statistics_log(log_path, source_name, band_names, accumulators):
+    with open(log_path, 'w') as log:
+        log.write(f"Statistical Summary for {source_name}\n")
+        log.write("=" * 50 + "\n\n")
+
+        for i, acc in enumerate(accumulators, start=1):
+            band_name = band_names[i - 1] if band_names[i - 1] else f"Band_{i}"
+            if acc.count == 0:
+                log.write(f"Band {i} ({band_name}): No valid data found.\n\n")
+                continue
+
+            stats = {
+                "MINIMUM": acc.min,
+                "MAXIMUM": acc.max,
+                "MEAN": acc.mean,
+                "STDDEV": acc.std,
+                "VALID_PERCENT": acc.valid_percent
+            }
+            log.write(f"--- Band {i}: {band_name} ---\n")
+            for key, value in stats.items():
+                log.write(f"STATISTICS_{key}={value:.12f}\n")
+            log.write("\n")
+
+
+def write_statistics_json(json_path, source_name, band_names, accumulators, nodata=0):
+    first = accumulators[0] if accumulators else BandAccumulator()
+    sidecar = {
+        "source": source_name,
+        "nodata": nodata,
+        "hist_range": list(first.hist_range),
+        "hist_bins": first.bins,
+        "bands": [
+            {"index": i, "name": band_names[i - 1] or f"Band_{i}", **acc.to_dict()}
+            for i, acc in enumerate(accumulators, start=1)
+        ],
+    }
+    with open(json_path, 'w') as f:
+        json.dump(sidecar, f)
+
+
+def load_statistics_json(json_path):
+    """Returns (sidecar dict, list of BandAccumulator) from a JSON written above."""
+    with open(json_path, 'r') as f:
+        sidecar = json.load(f)
+    accs = [BandAccumulator.from_dict(band, sidecar["hist_range"], sidecar["hist_bins"])
+            for band in sidecar["bands"]]
+    return sidecar, accs
+
+
+def raster_opener(path):
+    """Picklable callable that opens `path`, for use with compute_statistics."""
+    return partial(rasterio.open, str(path))
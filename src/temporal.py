@@ -0,0 +1,254 @@
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from config import load_config
+from instrumentation import stage_run
+from raster_utils import iter_windows, read_normalized, tiled_block_size
+
+BAND_SUFFIXES = ("VV", "VH", "Ratio")
+DEFAULT_OUTPUT = "data/processed/temporal/Niigata_Temporal.tif"
+_BAND_NAME = re.compile(r"(?:Norm_)?(\d{8})_(VV|VH|Ratio)$")
+
+
+def parse_band_names(descriptions):
+    """(date, suffix) of every '<date>_<VV|VH|Ratio>' (optionally 'Norm_'-prefixed) band."""
+    parsed = []
+    for i, name in enumerate(descriptions, start=1):
+        match = _BAND_NAME.match(name or "")
+        if match is None:
+            raise ValueError(f"Band {i} ('{name}') is not named <date>_<VV|VH|Ratio>")
+        parsed.append((datetime.strptime(match.group(1), "%Y%m%d"), match.group(2)))
+    return parsed
+
+
+class TemporalProjection:
+    """
+    Per-pixel linear map from the C stack bands to K temporal features:
+    out = weights @ bands + bias. PCA, harmonic fitting and fixed-interval
+    resampling all reduce to this, so one streaming writer serves them all.
+    """
+
+    def __init__(self, method, weights, bias, in_names, out_names):
+        self.method = method
+        self.weights = np.asarray(weights, dtype='float32')
+        self.bias = np.asarray(bias, dtype='float32')
+        self.in_names = list(in_names)
+        self.out_names = list(out_names)
+
+    @property
+    def in_channels(self):
+        return self.weights.shape[1]
+
+    @property
+    def out_channels(self):
+        return self.weights.shape[0]
+
+    def apply(self, block):
+        """(C, H, W) block -> (K, H, W) float32; pixels with every band 0 (nodata) stay 0."""
+        c, h, w = block.shape
+        flat = block.reshape(c, -1).astype('float32', copy=False)
+        out = self.weights @ flat + self.bias[:, None]
+        out[:, ~flat.any(axis=0)] = 0
+        return out.reshape(-1, h, w)
+
+    def to_dict(self):
+        return {"method": self.method, "weights": self.weights.tolist(), "bias": self.bias.tolist(),
+                "in_names": self.in_names, "out_names": self.out_names}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["method"], data["weights"], data["bias"], data["in_names"], data["out_names"])
+
+
+def _per_polarization(names, build):
+    """Block-diagonal projection: `build(days)` -> (K, n_dates) matrix, applied to each of VV/VH/Ratio."""
+    parsed = parse_band_names(names)
+    t0 = min(date for date, _ in parsed)
+    blocks, out_names = [], []
+    weights = []
+    for suffix in BAND_SUFFIXES:
+        idx = [i for i, (_, s) in enumerate(parsed) if s == suffix]
+        if not idx:
+            continue
+        days = np.array([(parsed[i][0] - t0).days for i in idx], dtype='float64')
+        matrix, labels = build(days)
+        rows = np.zeros((matrix.shape[0], len(names)))
+        rows[:, idx] = matrix
+        weights.append(rows)
+        out_names += [f"{suffix}_{label}" for label in labels]
+    weights = np.vstack(weights)
+    return weights, np.zeros(weights.shape[0]), out_names
+
+
+def harmonic_projection(names, harmonics=2, period_days=None):
+    """
+    Least-squares harmonic (phenology) coefficients per polarization:
+    offset, trend and `harmonics` cosine/sine pairs of the given period
+    (default: the span of the acquisitions, one growing season).
+    """
+    def build(days):
+        period = period_days or max(days.max() - days.min(), 1.0) * len(days) / max(len(days) - 1, 1)
+        columns = [np.ones_like(days), days / period]
+        labels = ["offset", "trend"]
+        for k in range(1, harmonics + 1):
+            phase = 2 * np.pi * k * days / period
+            columns += [np.cos(phase), np.sin(phase)]
+            labels += [f"cos{k}", f"sin{k}"]
+        # Coefficients of the least-squares fit are a fixed linear map of the series
+        return np.linalg.pinv(np.column_stack(columns)), labels
+
+    weights, bias, out_names = _per_polarization(names, build)
+    return TemporalProjection("harmonic", weights, bias, names, out_names)
+
+
+def resample_projection(names, steps=8):
+    """Linear interpolation of each polarization onto `steps` evenly spaced dates."""
+    def build(days):
+        targets = np.linspace(days.min(), days.max(), steps)
+        matrix = np.zeros((steps, len(days)))
+        order = np.argsort(days)
+        for row, t in enumerate(targets):
+            # Interpolating the identity matrix gives each target's weights on the acquisitions
+            matrix[row, order] = [np.interp(t, days[order], np.eye(len(days))[j]) for j in range(len(days))]
+        return matrix, [f"t{row}" for row in range(steps)]
+
+    weights, bias, out_names = _per_polarization(names, build)
+    return TemporalProjection("resample", weights, bias, names, out_names)
+
+
+def sample_pixels(src, n_pixels=200000, patch=32, seed=0):
+    """Random patch x patch windows until n_pixels valid (non-nodata) pixels, as an (N, C) array."""
+    rng = np.random.default_rng(seed)
+    samples, total = [], 0
+    for _ in range(max(1, 4 * n_pixels // (patch * patch))):
+        row = int(rng.integers(0, max(src.height - patch, 0) + 1))
+        col = int(rng.integers(0, max(src.width - patch, 0) + 1))
+        block = read_normalized(src, Window(col, row, min(patch, src.width), min(patch, src.height)))
+        flat = block.reshape(src.count, -1)
+        valid = flat[:, flat.any(axis=0)].T
+        samples.append(valid)
+        total += len(valid)
+        if total >= n_pixels:
+            break
+    return np.concatenate(samples)[:n_pixels].astype('float64')
+
+
+def fit_pca(src, components=12, n_pixels=200000, seed=0):
+    """PCA of the band vectors of a random pixel sample; keeps the leading `components`."""
+    sample = sample_pixels(src, n_pixels, seed=seed)
+    mean = sample.mean(axis=0)
+    cov = np.cov(sample - mean, rowvar=False)
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    order = np.argsort(eigvals)[::-1][:components]
+    weights = eigvecs[:, order].T
+    # Deterministic signs: largest loading of every component positive
+    signs = np.sign(weights[np.arange(len(weights)), np.abs(weights).argmax(axis=1)])
+    weights *= signs[:, None]
+    explained = eigvals[order].sum() / eigvals.sum() if eigvals.sum() else 0.0
+    print(f"PCA: {components} components explain {explained:.1%} of the variance ({len(sample)} pixels)")
+    return TemporalProjection("pca", weights, -weights @ mean, src.descriptions,
+                              [f"PC{i}" for i in range(1, len(weights) + 1)])
+
+
+def fit_projection(src, t_cfg):
+    method = t_cfg.get('method', 'pca')
+    if method == 'pca':
+        return fit_pca(src, t_cfg.get('components', 12), t_cfg.get('sample_pixels', 200000), t_cfg.get('seed', 0))
+    if method == 'harmonic':
+        return harmonic_projection(src.descriptions, t_cfg.get('harmonics', 2), t_cfg.get('period_days'))
+    if method == 'resample':
+        return resample_projection(src.descriptions, t_cfg.get('steps', 8))
+    raise ValueError(f"Unknown temporal method '{method}', use 'pca', 'harmonic' or 'resample'")
+
+
+def write_projected(src, projection, out_path, block_size=512):
+    """Streams the projection over the stack block by block into a tiled float32 GeoTIFF."""
+    block = tiled_block_size(block_size)
+    profile = src.profile.copy()
+    profile.update(driver='GTiff', count=projection.out_channels, dtype='float32', nodata=None,
+                   compress='lzw', tiled=True, blockxsize=block, blockysize=block, BIGTIFF='IF_SAFER')
+    with rasterio.open(out_path, 'w', **profile) as dst:
+        for window in iter_windows(src.width, src.height, block):
+            dst.write(projection.apply(read_normalized(src, window)), window=window)
+        for i, name in enumerate(projection.out_names, start=1):
+            dst.set_band_description(i, name)
+
+
+def projection_path(output_path):
+    return Path(output_path).with_suffix('.temporal.json')
+
+
+def output_path(t_cfg, root_dir):
+    """Feature raster of the `temporal` section; DVC tracks its whole folder."""
+    return root_dir / t_cfg.get('output', DEFAULT_OUTPUT).strip()
+
+
+def compress_temporal_stack(config=None):
+    """
+    Fits the configured temporal projection on the normalized stack and
+    writes the compact feature raster (temporal.output) plus the projection
+    itself (<output>.temporal.json), which inference reuses on new scenes.
+    With temporal.enabled false nothing is fitted and stale outputs are removed.
+    """
+    root_dir = Path(__file__).resolve().parent.parent
+    config = load_config(config)
+    t_cfg = config.get('temporal') or {}
+    stack_path = root_dir / config['data']['norm_output'].strip()
+    out_path = output_path(t_cfg, root_dir)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if not t_cfg.get('enabled', False):
+        for path in (out_path, projection_path(out_path)):
+            path.unlink(missing_ok=True)
+        print("temporal.enabled is false: no temporal features written")
+        return None
+
+    with rasterio.open(stack_path) as src:
+        print(f"Compressing {src.count} bands of {stack_path.name} with '{t_cfg.get('method', 'pca')}'...")
+        projection = fit_projection(src, t_cfg)
+        write_projected(src, projection, out_path, t_cfg.get('block_size', 512))
+
+    with open(projection_path(out_path), 'w') as f:
+        json.dump(projection.to_dict(), f)
+    print(f"{projection.in_channels} -> {projection.out_channels} channels saved at: {out_path}")
+    return projection
+
+
+def load_projection(config, root_dir):
+    """The fitted projection when temporal compression is enabled, else None."""
+    t_cfg = config.get('temporal') or {}
+    if not t_cfg.get('enabled', False):
+        return None
+    with open(projection_path(output_path(t_cfg, root_dir)), 'r') as f:
+        return TemporalProjection.from_dict(json.load(f))
+
+
+def model_input_path(config, root_dir):
+    """Raster the model trains on: the temporal features when enabled, else the normalized stack."""
+    t_cfg = config.get('temporal') or {}
+    if t_cfg.get('enabled', False):
+        return output_path(t_cfg, root_dir)
+    return root_dir / config['data']['norm_output'].strip()
+
+
+def input_adapter(config, root_dir, raster_count):
+    """
+    (model channels, per-tile transform or None) for feeding a raster with
+    `raster_count` bands to the model: a full normalized stack is projected
+    on the fly when the model was trained on temporal features.
+    """
+    projection = load_projection(config, root_dir)
+    if projection is None or raster_count != projection.in_channels:
+        return raster_count, None
+    return projection.out_channels, projection.apply
+
+
+if __name__ == "__main__":
+    config = load_config()
+    with stage_run("temporal_features", config):
+        compress_temporal_stack(config)
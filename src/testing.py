@@ -14,22 +14,17 @@ if platform.system() == "Windows":
         pass
 
 import torch
-import yaml
-import geoai
 import rasterio
 from pathlib import Path
 from pathlib import Path
-import matplotlib.pyplot as plt
-from sklearn.metrics import confusion_matrix, classification_report
-
-def load_config():
-    """Finds the config.yaml in the project root."""
-    # Assumes script is in /src, so parent of parent is root
-    root_dir = Path(__file__).resolve().parent.parent
-    config_path = root_dir / "config.yaml"
-    
-    with open(config_path, "r") as f:
-        return yaml.safe_load(f)
+import numpy as np
+from config import load_config
+from inference import load_inference_model, predict_raster
+from instrumentation import span, stage_run
+from metrics import evaluate_scenes, segmentation_scores
+from polygonize import polygonize_to_file
+from raster_utils import QUANTIZED_MAX_CODE
+from temporal import input_adapter
 
 def run_inference(config=None):
     """Executes semantic segmentation using parameters from config."""
@@ -37,45 +32,87 @@ def run_inference(config=None):
         config = load_config()
 
     # Extract sections for readability
+    root_dir = Path(__file__).resolve().parent.parent
     inf_cfg = config['inference']
     train_cfg = config['training']
-    data_cfg = config['data']
-
-    print(f"🚀 Starting inference on: {inf_cfg['test_image']}")
-    
-    # Run geoai semantic segmentation
-    geoai.semantic_segmentation(
-        input_path=inf_cfg['test_image'],
-        output_path=inf_cfg['masks_path'],
-        model_path=inf_cfg['model_path'],
-        architecture=train_cfg['architecture'],
-        encoder_name=train_cfg['encoder'],
-        num_channels=data_cfg['num_channels'],
-        num_classes=2,
-        window_size=inf_cfg['window_size'],
-        overlap=inf_cfg['overlap'],
-        batch_size=inf_cfg['batch_size'],
-    )
-    
-    print(f"✅ Prediction saved to: {inf_cfg['masks_path']}")
-
-def calculate_metrics(ground_truth_path, prediction_path):
+    input_path = root_dir / inf_cfg.get('input_path', config['data']['norm_output']).strip()
+    model_path = root_dir / inf_cfg['model_path']
+    output_path = root_dir / inf_cfg['output_mask_path']
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with rasterio.open(input_path) as src:
+        num_channels, band_transform = input_adapter(config, root_dir, src.count)
+        quantized = src.dtypes[0] in QUANTIZED_MAX_CODE
+
+    print(f"🚀 Starting inference on: {input_path}")
+
+    if inf_cfg.get('engine', 'stream') == 'geoai':
+        if band_transform is not None:
+            raise ValueError("The geoai engine cannot project bands on the fly; "
+                             "point inference.input_path at temporal.output or use engine: stream")
+        if quantized:
+            raise ValueError("The geoai engine reads raw quantized codes; use engine: stream, "
+                             "which dequantizes on read")
+        # Run geoai semantic segmentation
+        import geoai
+        geoai.semantic_segmentation(
+            input_path=str(input_path),
+            output_path=str(output_path),
+            model_path=str(model_path),
+            architecture=train_cfg['architecture'],
+            encoder_name=train_cfg['encoder'],
+            num_channels=num_channels,
+            num_classes=2,
+            window_size=inf_cfg['window_size'],
+            overlap=inf_cfg['overlap'],
+            batch_size=inf_cfg['batch_size'],
+        )
+    else:
+        # Streaming engine: windows are blended and written as soon as their rows are final
+        backend = inf_cfg.get('backend', 'torch')
+        device = torch.device("cuda" if torch.cuda.is_available() and backend == 'torch' else "cpu")
+        model = load_inference_model(backend, config, root_dir, num_channels, device)
+        print(f"Backend: {backend}")
+        stats = predict_raster(model, input_path, output_path,
+                               window_size=inf_cfg['window_size'],
+                               overlap=inf_cfg['overlap'],
+                               batch_size=inf_cfg['batch_size'],
+                               prefetch=inf_cfg.get('prefetch', 2),
+                               device=device,
+                               block_size=inf_cfg.get('block_size', 512),
+                               band_transform=band_transform)
+        print(f"⏱️ {stats['windows']} windows in {stats['seconds']:.1f}s "
+              f"({stats['windows_per_sec']:.2f} windows/s)")
+
+    print(f"✅ Prediction saved to: {output_path}")
+
+def vectorize_prediction(config=None):
+    """Polygonizes the predicted paddy mask (class 1) into inference.vector_output."""
+    if config is None:
+        config = load_config()
+
+    root_dir = Path(__file__).resolve().parent.parent
+    inf_cfg = config['inference']
+    vector_path = root_dir / inf_cfg.get('vector_output', 'data/processed/prediction/nigata_prediction.geojson')
+
+    n_polygons = polygonize_to_file(root_dir / inf_cfg['output_mask_path'], vector_path, config.get('polygonize'), value=1)
+    print(f"🗺️ {n_polygons} predicted paddy polygons saved to: {vector_path}")
+
+def calculate_metrics(ground_truth_path, prediction_path, config=None):
     """
-    Generates Confusion Matrix and Accuracy Report
+    Generates Confusion Matrix and Accuracy Report.
+    Counts are accumulated block by block (see metrics.py), so full-size
+    label and prediction rasters are never held in memory.
     """
-    with rasterio.open(ground_truth_path) as gt_src, rasterio.open(prediction_path) as pred_src:
-        y_true = gt_src.read(1).flatten()
-        y_pred = pred_src.read(1).flatten()
-
-    # Filter out NoData if necessary (assuming 0 or 255 might be nodata)
-    mask = (y_true <= 1) & (y_pred <= 1) 
-    y_true = y_true[mask]
-    y_pred = y_pred[mask]
-
-    # Generate Confusion Matrix
-    cm = confusion_matrix(y_true, y_pred)
-    
+    eval_cfg = (config or {}).get('evaluation') or {}
+    _, cm = evaluate_scenes([("test", ground_truth_path, prediction_path)],
+                            block_size=eval_cfg.get('block_size', 1024),
+                            workers=eval_cfg.get('workers', 0),
+                            executor=eval_cfg.get('executor', 'process'))
+    Path("plots").mkdir(exist_ok=True)
+
     # Plotting
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(8,6))
     plt.imshow(cm, interpolation='nearest', cmap=plt.cm.Greens)
     plt.title("Confusion Matrix: Rice vs Non-Rice")
@@ -83,19 +120,35 @@ def calculate_metrics(ground_truth_path, prediction_path):
     plt.ylabel('True Label')
     plt.xlabel('Predicted Label')
     plt.savefig("plots/test_confusion_matrix.png")
-    
-    # Save Text Report
-    report = classification_report(y_true, y_pred, target_names=['Non-Rice', 'Rice'])
+
+    # Save Text Report (per class, with the paddy class as the positive one)
     with open("plots/test_report.txt", "w") as f:
-        f.write(report)
-    
+        f.write(f"{'':>10}{'precision':>11}{'recall':>11}{'f1-score':>11}{'iou':>11}{'support':>11}\n\n")
+        for name, class_cm in (("Non-Rice", cm[::-1, ::-1]), ("Rice", cm)):
+            iou, f1, precision, recall = segmentation_scores(class_cm)
+            f.write(f"{name:>10}{precision:>11.4f}{recall:>11.4f}{f1:>11.4f}{iou:>11.4f}{int(class_cm[1].sum()):>11}\n")
+        f.write(f"\n{'accuracy':>10}{np.trace(cm) / max(cm.sum(), 1):>44.4f}{int(cm.sum()):>11}\n")
+
     print("📊 Evaluation Metrics Saved to /plots directory.")
+    return cm
 
 
-    
+def run_test(config=None):
+    """The `test` stage: predict, vectorize and score the prediction."""
+    config = load_config(config)
+    with span("inference"):
+        run_inference(config)
+    with span("vectorize"):
+        vectorize_prediction(config)
+    # Score the prediction against the label aligned to the stack grid
+    root_dir = Path(__file__).resolve().parent.parent
+    with span("metrics"):
+        calculate_metrics(root_dir / config['data']['label_aligned_tif'],
+                          root_dir / config['inference']['output_mask_path'], config)
+
 
 if __name__ == "__main__":    
     # Execute
-    run_inference()
-    # If you have a corresponding label for tile_000009, run this:
-    calculate_metrics("G:/data/test/labels/tile_000009.tif", config['inference']['output_mask_path'])
+    config = load_config()
+    with stage_run("test", config):
+        run_test(config)
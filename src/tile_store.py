@@ -0,0 +1,179 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import shapely
+import torch
+from rasterio.features import rasterize
+from rasterio.windows import bounds as window_bounds
+from rasterio.windows import transform as window_transform
+from torch.utils.data import Dataset
+from raster_utils import band_scaling, dequantize, iter_windows
+
+STORE_VERSION = 2
+
+
+def _store_is_current(store_dir, raster_path, label_path):
+    meta_path = Path(store_dir) / "meta.json"
+    if not meta_path.exists():
+        return False
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    return (meta.get("version") == STORE_VERSION
+            and meta.get("source") == str(raster_path)
+            and meta.get("source_mtime") == Path(raster_path).stat().st_mtime
+            and meta.get("label") == str(label_path)
+            and meta.get("label_mtime") == Path(label_path).stat().st_mtime)
+
+
+class PolygonIndex:
+    """
+    Label polygons in an STRtree, so burning a window only rasterizes the
+    polygons whose envelopes intersect it instead of scanning them all.
+    """
+
+    def __init__(self, vector_path, crs=None):
+        import geopandas as gpd  # Only vector labels need it
+
+        gdf = gpd.read_file(vector_path)
+        if crs is not None and gdf.crs is not None:
+            gdf = gdf.to_crs(crs)
+        geoms = [g for g in gdf.geometry if g is not None and not g.is_empty]
+        self.geoms = np.array(geoms, dtype=object)
+        self.tree = shapely.STRtree(self.geoms)
+
+    def burn(self, window, transform, out=None):
+        """Rasterizes the polygons touching `window` (value 1) into a uint8 array."""
+        if out is None:
+            out = np.zeros((window.height, window.width), dtype='uint8')
+        hits = self.tree.query(shapely.box(*window_bounds(window, transform)))
+        if len(hits):
+            rasterize(((geom, 1) for geom in self.geoms[hits]), out=out,
+                      transform=window_transform(window, transform), dtype='uint8')
+        return out
+
+
+def build_tile_store(raster_path, label_path, store_dir, block_size=1024):
+    """
+    Copies the normalized stack into `image.npy` (H, W, C float32, or the
+    stack's integer dtype when it is quantized) and the labels into
+    `label.npy` (H, W uint8) on the same grid, both memory-mappable. A label
+    raster already aligned to the stack grid is sliced block by block; a
+    vector file is burned per block through a PolygonIndex. Skipped when the
+    store is newer than its inputs.
+    """
+    store_dir = Path(store_dir)
+    if _store_is_current(store_dir, raster_path, label_path):
+        print(f"Tile store is up to date: {store_dir}")
+        return store_dir
+    store_dir.mkdir(parents=True, exist_ok=True)
+
+    with rasterio.open(raster_path) as src:
+        height, width, count = src.height, src.width, src.count
+        transform, crs = src.transform, src.crs
+        # Quantized stacks stay quantized: WindowDataset dequantizes each window
+        dtype = src.dtypes[0] if np.dtype(src.dtypes[0]).kind == 'u' else 'float32'
+        scales, offsets = band_scaling(src)
+        print(f"Building tile store {store_dir} ({width}x{height}x{count})...")
+
+        # Pixel-interleaved layout: a window read touches T contiguous rows of T*C values
+        image = np.lib.format.open_memmap(store_dir / "image.npy", mode='w+',
+                                          dtype=dtype, shape=(height, width, count))
+        for window in iter_windows(width, height, block_size):
+            block = src.read(window=window).astype(dtype, copy=False)
+            rows = slice(window.row_off, window.row_off + window.height)
+            cols = slice(window.col_off, window.col_off + window.width)
+            image[rows, cols, :] = np.moveaxis(block, 0, -1)
+        image.flush()
+        del image
+
+    label = np.lib.format.open_memmap(store_dir / "label.npy", mode='w+',
+                                      dtype='uint8', shape=(height, width))
+    if Path(label_path).suffix.lower() in ('.tif', '.tiff'):
+        with rasterio.open(label_path) as lbl:
+            if (lbl.width, lbl.height) != (width, height) or not lbl.transform.almost_equals(transform):
+                raise ValueError(f"{label_path} is not on the stack grid; run labeling.align_labels_to_stack first")
+            for window in iter_windows(width, height, block_size):
+                rows = slice(window.row_off, window.row_off + window.height)
+                cols = slice(window.col_off, window.col_off + window.width)
+                label[rows, cols] = lbl.read(1, window=window) == 1
+    else:
+        index = PolygonIndex(label_path, crs)
+        for window in iter_windows(width, height, block_size):
+            rows = slice(window.row_off, window.row_off + window.height)
+            cols = slice(window.col_off, window.col_off + window.width)
+            label[rows, cols] = index.burn(window, transform)
+    label.flush()
+    del label
+
+    meta = {
+        "version": STORE_VERSION,
+        "source": str(raster_path),
+        "source_mtime": Path(raster_path).stat().st_mtime,
+        "label": str(label_path),
+        "label_mtime": Path(label_path).stat().st_mtime,
+        "width": width,
+        "height": height,
+        "count": count,
+        "dtype": dtype,
+        "scales": scales,
+        "offsets": offsets,
+        "crs": crs.to_wkt() if crs else None,
+        "transform": list(transform)[:6],
+    }
+    with open(store_dir / "meta.json", 'w') as f:
+        json.dump(meta, f, indent=2)
+    return store_dir
+
+
+def window_offsets(width, height, tile_size, stride):
+    """Top-left (row, col) of every full tile_size window on a `stride` grid."""
+    return [(row, col)
+            for row in range(0, height - tile_size + 1, stride)
+            for col in range(0, width - tile_size + 1, stride)]
+
+
+class WindowDataset(Dataset):
+    """
+    Samples (image, mask) windows straight from a memory-mapped tile store.
+    Changing tile_size or stride only changes the offsets list; nothing is
+    re-exported or re-decoded.
+    """
+
+    def __init__(self, store_dir, tile_size=512, stride=256, offsets=None):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / "meta.json", 'r') as f:
+            meta = json.load(f)
+        self.num_channels = meta["count"]
+        self.band_scales, self.band_offsets = meta["scales"], meta["offsets"]
+        self.tile_size = tile_size
+        self.offsets = offsets if offsets is not None else \
+            window_offsets(meta["width"], meta["height"], tile_size, stride)
+        # Opened lazily so every DataLoader worker maps the files itself
+        self._image = None
+        self._label = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        if self._image is None:
+            self._image = np.load(self.store_dir / "image.npy", mmap_mode='r')
+            self._label = np.load(self.store_dir / "label.npy", mmap_mode='r')
+
+        row, col = self.offsets[idx]
+        t = self.tile_size
+        image = dequantize(np.ascontiguousarray(self._image[row:row + t, col:col + t, :].transpose(2, 0, 1)),
+                           self.band_scales, self.band_offsets)
+        mask = self._label[row:row + t, col:col + t].astype('int64')
+        return torch.from_numpy(image), torch.from_numpy(mask)
+
+
+def split_offsets(offsets, val_split=0.2, seed=42):
+    """Shuffles window offsets and splits them into (train, val)."""
+    order = np.random.default_rng(seed).permutation(len(offsets))
+    n_val = int(round(len(offsets) * val_split))
+    val = [offsets[i] for i in order[:n_val]]
+    train = [offsets[i] for i in order[n_val:]]
+    return train, val
@@ -13,26 +13,35 @@ if platform.system() == "Windows":
     except Exception:
         pass
 
+import argparse
+import json
 import torch
-import yaml
-import geoai
 import rasterio
+import time
+from datetime import datetime
 from pathlib import Path
 from pathlib import Path
-import matplotlib.pyplot as plt
+import segmentation_models_pytorch as smp
+from torch.utils.data import DataLoader
+from config import load_config
+from instrumentation import span, stage_run
+from metrics import segmentation_scores
+from raster_utils import QUANTIZED_MAX_CODE
+from temporal import model_input_path
+from tile_store import WindowDataset, build_tile_store, split_offsets
 
 
-def run_training_pipeline():
-    # 1. Setup Paths
+def run_training_pipeline(config=None, resume=False):
+    # 1. Setup Paths (config: a loaded config or a config file path)
     ROOT_DIR = Path(__file__).resolve().parent.parent
-    CONFIG_PATH = ROOT_DIR / "config.yaml"
-
-    with open(CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
+    config = load_config(config)
 
     # Resolve paths from config
-    train_raster = ROOT_DIR / config['data']['norm_output'].strip()
-    label_geojson = ROOT_DIR / config['data']['label_geojson'].strip()
+    train_raster = model_input_path(config, ROOT_DIR)
+    label_path = ROOT_DIR / config['data']['label_geojson'].strip()
+    if config['training'].get('label_source', 'raster') == 'raster':
+        # Binary label already aligned to the stack grid (labeling.align_labels_to_stack)
+        label_path = ROOT_DIR / config['data']['label_aligned_tif'].strip()
     out_tile_folder = ROOT_DIR / "data" / "paddy_instance"
     model_output_dir = ROOT_DIR / config['paths']['output_model_dir'].strip()
 
@@ -43,14 +52,33 @@ def run_training_pipeline():
     # 2. Determine Channel Count from Raster
     with rasterio.open(train_raster) as src:
         actual_channels = src.count
+        quantized = src.dtypes[0] in QUANTIZED_MAX_CODE
     print(f"Detected {actual_channels} channels in input stack.")
 
+    if config['training'].get('data_pipeline', 'tiles') == 'tile_store':
+        # 3a. Sample windows from a memory-mapped store instead of exporting tiles
+        store_dir = ROOT_DIR / config['data'].get('tile_store_dir', 'data/processed/tile_store').strip()
+        with span("tile_store"):
+            build_tile_store(train_raster, label_path, store_dir)
+        start = time.perf_counter()
+        history = train_from_tile_store(config, store_dir, model_output_dir,
+                                        resume=resume or config['training'].get('resume', False))
+        write_training_metrics(history, model_output_dir, time.perf_counter() - start)
+        return history
+
+    if quantized:
+        raise ValueError("geoai tiles would hold raw quantized codes; "
+                         "use training.data_pipeline: tile_store with normalization.dtype uint8/uint16")
+
+    # geoai pulls in a large dependency tree; only this pipeline needs it
+    import geoai
+
     # 3. Export Tiff Tiles (Patching)
     print("Generating training tiles...")
     tiles = geoai.export_geotiff_tiles(
         in_raster=str(train_raster),
         out_folder=str(out_tile_folder),
-        in_class_data=str(label_geojson),
+        in_class_data=str(label_path),
         tile_size=config['training']['tile_size'],
         stride=config['training']['stride'],
         buffer_radius=0,
@@ -58,6 +86,7 @@ def run_training_pipeline():
 
     # # 4. Train Segmentation Model
     print(f"Starting {config['training']['architecture']} training...")
+    start = time.perf_counter()
     geoai.train_segmentation_model(
         images_dir=f"{out_tile_folder}/images",
         labels_dir=f"{out_tile_folder}/labels",
@@ -74,28 +103,214 @@ def run_training_pipeline():
         visualize=True,
         verbose=True,
     )
+    history = torch.load(model_output_dir / "training_history.pth", weights_only=False)
+    write_training_metrics(history, model_output_dir, time.perf_counter() - start)
+    return history
+
+
+def write_training_summary(history, train_cfg, output_dir):
+    """Writes training_history.pth and training_summary.txt like geoai does."""
+    torch.save(history, output_dir / "training_history.pth")
+    with open(output_dir / "training_summary.txt", 'w') as f:
+        f.write(f"Training completed on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Architecture: {train_cfg['architecture']}\n")
+        f.write(f"Encoder: {train_cfg['encoder']}\n")
+        f.write(f"Total epochs: {len(history['train_losses'])}\n")
+        f.write(f"Best validation IoU: {max(history['val_ious']):.4f}\n")
+        f.write(f"Final validation IoU: {history['val_ious'][-1]:.4f}\n")
+        f.write(f"Final validation F1: {history['val_f1s'][-1]:.4f}\n")
+        f.write(f"Final validation Precision: {history['val_precisions'][-1]:.4f}\n")
+        f.write(f"Final validation Recall: {history['val_recalls'][-1]:.4f}\n")
+        f.write(f"Final validation loss: {history['val_losses'][-1]:.4f}\n")
+        if history.get('train_tiles_per_sec'):
+            f.write(f"Mean training throughput: {sum(history['train_tiles_per_sec']) / len(history['train_tiles_per_sec']):.2f} tiles/s\n")
+            f.write(f"Mean validation throughput: {sum(history['val_tiles_per_sec']) / len(history['val_tiles_per_sec']):.2f} tiles/s\n")
+
+
+def write_training_metrics(history, output_dir, seconds):
+    """Best/final validation scores and wall time as JSON, for DVC metrics and the tuner."""
+    best = max(range(len(history['val_ious'])), key=history['val_ious'].__getitem__) if history['val_ious'] else None
+    metrics = {
+        "epochs_completed": len(history['val_ious']),
+        "best_epoch": best + 1 if best is not None else None,
+        "best_val_iou": history['val_ious'][best] if best is not None else None,
+        "best_val_f1": history['val_f1s'][best] if best is not None else None,
+        "final_val_iou": history['val_ious'][-1] if history['val_ious'] else None,
+        "final_val_f1": history['val_f1s'][-1] if history['val_f1s'] else None,
+        "final_val_precision": history['val_precisions'][-1] if history['val_precisions'] else None,
+        "final_val_recall": history['val_recalls'][-1] if history['val_recalls'] else None,
+        "final_val_loss": history['val_losses'][-1] if history['val_losses'] else None,
+        "train_tiles_per_sec": history['train_tiles_per_sec'][-1] if history.get('train_tiles_per_sec') else None,
+        "seconds": seconds,
+    }
+    with open(Path(output_dir) / "training_metrics.json", 'w') as f:
+        json.dump(metrics, f, indent=2)
+    return metrics
+
+
+def train_from_tile_store(config, store_dir, model_output_dir, resume=False):
+    """
+    Trains the smp segmentation model on windows sampled from the tile store.
+    Writes best_model.pth, final_model.pth, training_history.pth and
+    training_summary.txt to model_output_dir. A last_checkpoint.pth is saved
+    after every epoch; with `resume` training continues from it up to
+    training.epochs (the tuner raises epochs between halving rungs).
+
+    CPU options from the training section: `threads` (intra-op threads),
+    `amp: bf16` (bfloat16 autocast), `channels_last` and `compile`
+    (torch.compile); `num_workers`/`prefetch_factor` size the DataLoader.
+    """
+    train_cfg = config['training']
+    tile_size, stride = train_cfg['tile_size'], train_cfg['stride']
+    if train_cfg.get('threads'):
+        torch.set_num_threads(train_cfg['threads'])
+
+    dataset = WindowDataset(store_dir, tile_size, stride)
+    train_offsets, val_offsets = split_offsets(dataset.offsets, train_cfg.get('val_split', 0.2))
+    loader_args = dict(batch_size=train_cfg['batch_size'], num_workers=train_cfg.get('num_workers', 0))
+    if loader_args['num_workers'] > 0:
+        # Workers keep their memory maps between epochs and read ahead of the model
+        loader_args.update(persistent_workers=True, prefetch_factor=train_cfg.get('prefetch_factor', 2))
+    train_loader = DataLoader(WindowDataset(store_dir, tile_size, offsets=train_offsets),
+                              shuffle=True, **loader_args)
+    val_loader = DataLoader(WindowDataset(store_dir, tile_size, offsets=val_offsets),
+                            shuffle=False, **loader_args)
+    print(f"Sampling {len(train_offsets)} train / {len(val_offsets)} val windows from {store_dir}")
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = smp.create_model(
+        arch=train_cfg['architecture'],
+        encoder_name=train_cfg['encoder'],
+        encoder_weights=train_cfg['encoder_weights'],
+        in_channels=dataset.num_channels,
+        classes=2,  # Background + Paddy
+    ).to(device)
+    memory_format = torch.channels_last if train_cfg.get('channels_last', False) else torch.contiguous_format
+    model = model.to(memory_format=memory_format)
+    optimizer = torch.optim.Adam(model.parameters(), lr=train_cfg['learning_rate'])
+    criterion = torch.nn.CrossEntropyLoss()
+
+    # bfloat16 autocast keeps fp32 weights/optimizer state; no loss scaling needed
+    use_bf16 = train_cfg.get('amp') == 'bf16'
+
+    def autocast():
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_bf16)
+
+    # Checkpoints are saved from `model`; the compiled wrapper only runs the steps
+    step_model = torch.compile(model) if train_cfg.get('compile', False) else model
+    print(f"Device {device}, {torch.get_num_threads()} threads, amp={'bf16' if use_bf16 else 'off'}, "
+          f"channels_last={memory_format is torch.channels_last}, compile={step_model is not model}")
+
+    history = {"train_losses": [], "val_losses": [], "val_ious": [], "val_f1s": [],
+               "val_precisions": [], "val_recalls": [], "train_tiles_per_sec": [],
+               "val_tiles_per_sec": [], "epoch_seconds": []}
+    best_iou = -1.0
+    first_epoch = 1
+
+    checkpoint_path = model_output_dir / "last_checkpoint.pth"
+    if resume and checkpoint_path.exists():
+        checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+        model.load_state_dict(checkpoint['model'])
+        optimizer.load_state_dict(checkpoint['optimizer'])
+        history.update(checkpoint['history'])
+        best_iou = checkpoint['best_iou']
+        first_epoch = checkpoint['epoch'] + 1
+        print(f"Resuming from epoch {checkpoint['epoch']} ({checkpoint_path})")
+
+    for epoch in range(first_epoch, train_cfg['epochs'] + 1):
+        start = time.perf_counter()
+        model.train()
+        train_loss = 0.0
+        with span("train_epoch", epoch=epoch):
+            for images, masks in train_loader:
+                images = images.to(device, memory_format=memory_format)
+                masks = masks.to(device)
+                optimizer.zero_grad()
+                with autocast():
+                    loss = criterion(step_model(images), masks)
+                loss.backward()
+                optimizer.step()
+                train_loss += loss.item() * images.size(0)
+        train_seconds = time.perf_counter() - start
+
+        model.eval()
+        val_start = time.perf_counter()
+        val_loss = 0.0
+        confusion = torch.zeros(2, 2, dtype=torch.int64)
+        with span("val_epoch", epoch=epoch), torch.no_grad(), autocast():
+            for images, masks in val_loader:
+                images = images.to(device, memory_format=memory_format)
+                masks = masks.to(device)
+                logits = step_model(images)
+                val_loss += criterion(logits, masks).item() * images.size(0)
+                preds = logits.argmax(dim=1)
+                confusion += torch.bincount((masks * 2 + preds).flatten().cpu(), minlength=4).reshape(2, 2)
+
+        iou, f1, precision, recall = segmentation_scores(confusion)
+        history["train_losses"].append(train_loss / max(len(train_offsets), 1))
+        history["val_losses"].append(val_loss / max(len(val_offsets), 1))
+        history["val_ious"].append(iou)
+        history["val_f1s"].append(f1)
+        history["val_precisions"].append(precision)
+        history["val_recalls"].append(recall)
+        val_seconds = time.perf_counter() - val_start
+        history["train_tiles_per_sec"].append(len(train_offsets) / train_seconds if train_seconds else 0.0)
+        history["val_tiles_per_sec"].append(len(val_offsets) / val_seconds if val_seconds else 0.0)
+        history["epoch_seconds"].append(time.perf_counter() - start)
+
+        if iou > best_iou:
+            best_iou = iou
+            torch.save(model.state_dict(), model_output_dir / "best_model.pth")
+        torch.save({"epoch": epoch, "model": model.state_dict(), "optimizer": optimizer.state_dict(),
+                    "history": history, "best_iou": best_iou}, checkpoint_path)
+        print(f"Epoch {epoch}/{train_cfg['epochs']}: train loss {history['train_losses'][-1]:.4f}, "
+              f"val loss {history['val_losses'][-1]:.4f}, val IoU {iou:.4f} "
+              f"({history['epoch_seconds'][-1]:.1f}s, train {history['train_tiles_per_sec'][-1]:.1f} tiles/s, "
+              f"val {history['val_tiles_per_sec'][-1]:.1f} tiles/s)")
+
+    torch.save(model.state_dict(), model_output_dir / "final_model.pth")
+    write_training_summary(history, train_cfg, model_output_dir)
+    return history
 
 
 def save_learning_curves(history, output_path):
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(10, 5))
     
     # Plot Loss
     plt.subplot(1, 2, 1)
-    plt.plot(history['train_loss'], label='Train Loss')
-    plt.plot(history['val_loss'], label='Val Loss')
+    plt.plot(history['train_losses'], label='Train Loss')
+    plt.plot(history['val_losses'], label='Val Loss')
     plt.title('Loss Curve')
     plt.legend()
 
     # Plot IoU
     plt.subplot(1, 2, 2)
-    plt.plot(history['train_iou'], label='Train IoU')
-    plt.plot(history['val_iou'], label='Val IoU')
+    plt.plot(history['val_ious'], label='Val IoU')
     plt.title('IoU Curve')
     plt.legend()
 
     plt.savefig(output_path)
     plt.close()
 
+
+def run_train_model(config=None, resume=False, curves="plots/learning_curves.png"):
+    """The `train_model` stage: run_training_pipeline, then the learning curve plot ('' to skip)."""
+    history = run_training_pipeline(config, resume=resume)
+    if curves and history:
+        Path(curves).parent.mkdir(parents=True, exist_ok=True)
+        save_learning_curves(history, output_path=curves)
+    return history
+
+
 if __name__ == "__main__":
-    run_training_pipeline()
-    save_learning_curves(history="models\training_history.pth", output_path="plots/learning_curves.png")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the paddy segmentation model.")
+    parser.add_argument("--config", help="Config file (default: config.yaml in the project root)")
+    parser.add_argument("--resume", action="store_true", help="Continue from last_checkpoint.pth")
+    parser.add_argument("--curves", default="plots/learning_curves.png", help="Learning curve plot ('' to skip)")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    with stage_run("train_model", config):
+        run_train_model(config, resume=args.resume, curves=args.curves)
\ No newline at end of file